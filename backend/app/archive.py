@@ -0,0 +1,274 @@
+"""
+コールドアーカイブ
+期限切れメッセージと関連行（受信箱・コンテンツ・ベクトル）を、削除前に
+日付パーティション付きの圧縮列指向ファイル（Parquet / Arrow IPC）へ書き出す
+
+    {archive_dir}/{テーブル}/date=YYYY-MM-DD/part-{時刻}-{PID}-{連番}.{parquet|arrow}
+
+日付は messages.expires_at（関連行は親メッセージの expires_at）の日付。
+ファイルはバッチ毎に一時ファイルへ書き込み、fsync 後にリネームしてから
+DBの行を削除する（削除に失敗して再実行された場合は同じ行が重複し得るため、
+読み出し側で id により重複を除く）。
+
+ベクトルはワーカープロセスごとのインメモリインデックスにしかないため、書き出せるのは
+アーカイブを実行するプロセスのインデックスにあるベクトルのみ（別ワーカーで作成された
+ベクトルや、scripts/sweep_expired.py から実行した場合は書き出されない）。
+書き出せなかった件数は vectors_missing に集計し、警告ログで報告する。
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from sqlalchemy import select
+
+from app.config import get_settings
+from app.models import Inbox, Message, MessageContent
+from app.services.vector_service import vector_service
+
+logger = logging.getLogger(__name__)
+
+# pyarrowのインポートを安全に行う
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    pa = None
+    pq = None
+
+ARCHIVE_TABLES = ("messages", "inbox", "message_contents", "vectors")
+FORMAT_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def _schemas(dimension: int) -> Dict[str, "pa.Schema"]:
+    timestamp = pa.timestamp("us")
+    return {
+        "messages": pa.schema([
+            ("id", pa.string()),
+            ("thread_id", pa.string()),
+            ("sender_id", pa.string()),
+            ("summary", pa.string()),
+            ("slots", pa.string()),
+            ("lang_hint", pa.string()),
+            ("vector_id", pa.string()),
+            ("created_at", timestamp),
+            ("expires_at", timestamp),
+        ]),
+        "inbox": pa.schema([
+            ("id", pa.string()),
+            ("user_id", pa.string()),
+            ("message_id", pa.string()),
+            ("thread_id", pa.string()),
+            ("status", pa.string()),
+            ("created_at", timestamp),
+        ]),
+        "message_contents": pa.schema([
+            ("id", pa.string()),
+            ("message_id", pa.string()),
+            ("user_id", pa.string()),
+            ("content_type", pa.string()),
+            ("text", pa.string()),
+            ("created_at", timestamp),
+            ("updated_at", timestamp),
+        ]),
+        "vectors": pa.schema([
+            ("vector_id", pa.string()),
+            ("message_id", pa.string()),
+            ("vector", pa.list_(pa.float32(), dimension)),
+        ]),
+    }
+
+
+class MessageArchiver:
+    """期限切れメッセージのバッチを列指向ファイルへ書き出す"""
+
+    def __init__(
+        self,
+        archive_dir: str,
+        file_format: str = "parquet",
+        compression: str = "zstd",
+        vector_lookup: Optional[Callable[[Iterable[str]], Dict[str, "object"]]] = None,
+        dimension: int = 384,
+    ):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("アーカイブには pyarrow が必要です")
+        if file_format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"未対応のアーカイブ形式です: {file_format}")
+        self.archive_dir = archive_dir
+        self.file_format = file_format
+        self.compression = None if compression == "none" else compression
+        self.vector_lookup = vector_lookup or vector_service.get
+        self.schemas = _schemas(dimension)
+        self._seq = itertools.count()
+        # 統計（監視用）
+        self.files_written = 0
+        self.rows_written = 0
+        self.vectors_written = 0
+        # このプロセスのインデックスになく書き出せなかったベクトル数
+        self.vectors_missing = 0
+
+    async def archive(self, db, message_ids: Sequence[str]) -> int:
+        """メッセージと関連行を読み出してファイルに書き出し、書き出したメッセージ数を返す"""
+        if not message_ids:
+            return 0
+        message_ids = list(message_ids)
+        messages = (await db.execute(
+            select(Message.__table__).where(Message.id.in_(message_ids))
+        )).mappings().all()
+        if not messages:
+            return 0
+        inbox = (await db.execute(
+            select(Inbox.__table__).where(Inbox.message_id.in_(message_ids))
+        )).mappings().all()
+        # text は TypeDecorator で展開済みの文字列として取得される
+        contents = (await db.execute(
+            select(MessageContent.__table__).where(MessageContent.message_id.in_(message_ids))
+        )).mappings().all()
+        vector_ids = {row["vector_id"]: row["id"] for row in messages if row["vector_id"]}
+        vectors = self.vector_lookup(vector_ids)
+        missing = len(vector_ids) - len(vectors)
+        if missing:
+            logger.warning(
+                f"アーカイブ: {missing}/{len(vector_ids)}件のベクトルがこのプロセスのインデックスにないため"
+                f"書き出していません（メッセージ・関連行は書き出し済み）"
+            )
+
+        day_of = {row["id"]: self._partition_day(row) for row in messages}
+        partitions: Dict[str, Dict[date, List[dict]]] = {name: defaultdict(list) for name in ARCHIVE_TABLES}
+        for row in messages:
+            partitions["messages"][day_of[row["id"]]].append(dict(row))
+        for row in inbox:
+            partitions["inbox"][day_of.get(row["message_id"])].append(dict(row))
+        for row in contents:
+            partitions["message_contents"][day_of.get(row["message_id"])].append(dict(row))
+        for vector_id, vector in vectors.items():
+            message_id = vector_ids[vector_id]
+            partitions["vectors"][day_of[message_id]].append(
+                {"vector_id": vector_id, "message_id": message_id, "vector": vector.tolist()}
+            )
+
+        # ファイル書き込み（圧縮・fsync）はイベントループを塞がないようスレッドで実行
+        await asyncio.to_thread(self._write_partitions, partitions)
+        self.vectors_written += len(vectors)
+        self.vectors_missing += missing
+        return len(messages)
+
+    @staticmethod
+    def _partition_day(row) -> date:
+        timestamp = row["expires_at"] or row["created_at"] or datetime.now()
+        return timestamp.date()
+
+    def _write_partitions(self, partitions: Dict[str, Dict[date, List[dict]]]):
+        stamp = time.strftime("%Y%m%dT%H%M%S")
+        for name, by_day in partitions.items():
+            for day, rows in by_day.items():
+                if not rows:
+                    continue
+                day = day or date.today()
+                directory = os.path.join(self.archive_dir, name, f"date={day.isoformat()}")
+                os.makedirs(directory, exist_ok=True)
+                filename = f"part-{stamp}-{os.getpid()}-{next(self._seq):06d}{FORMAT_EXTENSIONS[self.file_format]}"
+                table = pa.Table.from_pylist(rows, schema=self.schemas[name])
+                self._write_file(table, os.path.join(directory, filename))
+                self.files_written += 1
+                self.rows_written += table.num_rows
+
+    def _write_file(self, table: "pa.Table", path: str):
+        tmp_path = path + ".tmp"
+        if self.file_format == "parquet":
+            pq.write_table(table, tmp_path, compression=self.compression or "none")
+        else:
+            options = pa.ipc.IpcWriteOptions(compression=self.compression)
+            with pa.OSFile(tmp_path, "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+        # 削除前に確実にディスクへ書き込む
+        with open(tmp_path, "rb") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class ArchiveReader:
+    """アーカイブファイルをメモリマップで読み出す（オフライン分析用）"""
+
+    def __init__(self, archive_dir: str):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError("アーカイブの読み出しには pyarrow が必要です")
+        self.archive_dir = archive_dir
+
+    def files(self, table: str, start: Optional[date] = None, end: Optional[date] = None) -> List[str]:
+        """日付範囲（両端含む）のアーカイブファイルを日付順に返す"""
+        base = os.path.join(self.archive_dir, table)
+        if not os.path.isdir(base):
+            return []
+        paths = []
+        for partition in sorted(os.listdir(base)):
+            if not partition.startswith("date="):
+                continue
+            day = date.fromisoformat(partition[len("date="):])
+            if (start and day < start) or (end and day > end):
+                continue
+            directory = os.path.join(base, partition)
+            paths.extend(
+                os.path.join(directory, name)
+                for name in sorted(os.listdir(directory))
+                if name.endswith(tuple(FORMAT_EXTENSIONS.values()))
+            )
+        return paths
+
+    def scan(
+        self,
+        table: str,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        columns: Optional[List[str]] = None,
+    ) -> Iterator["pa.RecordBatch"]:
+        """レコードバッチを順に返す（ファイル全体をメモリに読み込まない）"""
+        for path in self.files(table, start, end):
+            if path.endswith(".parquet"):
+                parquet_file = pq.ParquetFile(path, memory_map=True)
+                yield from parquet_file.iter_batches(columns=columns)
+            else:
+                # 非圧縮の Arrow IPC はメモリマップからゼロコピーで参照される
+                with pa.memory_map(path, "r") as source:
+                    reader = pa.ipc.open_file(source)
+                    for i in range(reader.num_record_batches):
+                        batch = reader.get_batch(i)
+                        yield batch.select(columns) if columns else batch
+
+    def read_table(
+        self,
+        table: str,
+        start: Optional[date] = None,
+        end: Optional[date] = None,
+        columns: Optional[List[str]] = None,
+    ) -> "pa.Table":
+        """日付範囲のアーカイブを1つのテーブルとして読み出す"""
+        batches = list(self.scan(table, start, end, columns))
+        if not batches:
+            empty = _schemas(vector_service.dimension)[table].empty_table()
+            return empty.select(columns) if columns else empty
+        return pa.Table.from_batches(batches)
+
+
+def create_archiver() -> Optional[MessageArchiver]:
+    """設定からアーカイバーを作成（無効または pyarrow がない場合は None）"""
+    settings = get_settings()
+    if not settings.archive_enabled:
+        return None
+    if not PYARROW_AVAILABLE:
+        logger.warning("pyarrow が利用できないため、期限切れメッセージはアーカイブせずに削除します")
+        return None
+    return MessageArchiver(
+        settings.archive_dir,
+        file_format=settings.archive_format,
+        compression=settings.archive_compression,
+        dimension=vector_service.dimension,
+    )
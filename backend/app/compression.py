@@ -0,0 +1,176 @@
+"""
+テキスト圧縮
+MessageContent.text などの長文を透過的に圧縮して保存するカラム型
+"""
+
+import threading
+import time
+import zlib
+from typing import Dict, Optional, Union
+
+from sqlalchemy.types import LargeBinary, TypeDecorator
+
+from app.config import get_settings
+
+# zstandardのインポートを安全に行う
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+    zstandard = None
+
+# 先頭1バイトで格納形式を識別
+HEADER_PLAIN = b"\x00"
+HEADER_ZLIB = b"\x01"
+HEADER_ZSTD = b"\x02"
+
+
+class CompressionStats:
+    """圧縮率とCPUコストの集計"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.raw_bytes = 0
+            self.stored_bytes = 0
+            self.encoded = 0
+            self.compressed = 0
+            self.encode_seconds = 0.0
+            self.decoded = 0
+            self.decode_seconds = 0.0
+
+    def record_encode(self, raw: int, stored: int, compressed: bool, seconds: float):
+        with self._lock:
+            self.raw_bytes += raw
+            self.stored_bytes += stored
+            self.encoded += 1
+            self.compressed += int(compressed)
+            self.encode_seconds += seconds
+
+    def record_decode(self, seconds: float):
+        with self._lock:
+            self.decoded += 1
+            self.decode_seconds += seconds
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "encoded": self.encoded,
+                "compressed": self.compressed,
+                "raw_bytes": self.raw_bytes,
+                "stored_bytes": self.stored_bytes,
+                "ratio": round(self.raw_bytes / self.stored_bytes, 3) if self.stored_bytes else 1.0,
+                "encode_us_per_kb": round(self.encode_seconds * 1e6 / max(self.raw_bytes / 1024, 1e-9), 2),
+                "decoded": self.decoded,
+                "decode_us_avg": round(self.decode_seconds * 1e6 / self.decoded, 2) if self.decoded else 0.0,
+            }
+
+
+class TextCodec:
+    """文字列 <-> 保存用バイト列の変換"""
+
+    def __init__(
+        self,
+        algorithm: str = "zlib",
+        threshold: int = 256,
+        level: int = 6,
+        zstd_dict: Optional[bytes] = None,
+    ):
+        if algorithm == "zstd" and not ZSTD_AVAILABLE:
+            print("⚠️  zstandard not available, falling back to zlib")
+            algorithm = "zlib"
+        self.algorithm = algorithm
+        self.threshold = threshold
+        self.level = level
+        self.stats = CompressionStats()
+
+        self._zstd_dict = zstandard.ZstdCompressionDict(zstd_dict) if zstd_dict and ZSTD_AVAILABLE else None
+        # zstdの圧縮/展開オブジェクトはスレッドセーフではないためスレッド毎に保持
+        self._local = threading.local()
+
+    def _zstd(self):
+        if not hasattr(self._local, "compressor"):
+            self._local.compressor = zstandard.ZstdCompressor(level=self.level, dict_data=self._zstd_dict)
+            self._local.decompressor = zstandard.ZstdDecompressor(dict_data=self._zstd_dict)
+        return self._local.compressor, self._local.decompressor
+
+    def encode(self, text: str) -> bytes:
+        started = time.perf_counter()
+        raw = text.encode("utf-8")
+        stored = HEADER_PLAIN + raw
+        if self.algorithm != "none" and len(raw) >= self.threshold:
+            if self.algorithm == "zstd":
+                candidate = HEADER_ZSTD + self._zstd()[0].compress(raw)
+            else:
+                candidate = HEADER_ZLIB + zlib.compress(raw, self.level)
+            # 圧縮しても小さくならない場合は平文のまま
+            if len(candidate) < len(stored):
+                stored = candidate
+        self.stats.record_encode(
+            len(raw), len(stored), stored[:1] != HEADER_PLAIN, time.perf_counter() - started
+        )
+        return stored
+
+    def decode(self, value: Union[bytes, str, memoryview]) -> str:
+        # 圧縮導入前の行（TEXTのまま残っている値）はそのまま返す
+        if isinstance(value, str):
+            return value
+        started = time.perf_counter()
+        value = bytes(value)
+        header, body = value[:1], value[1:]
+        if header == HEADER_PLAIN:
+            text = body.decode("utf-8")
+        elif header == HEADER_ZLIB:
+            text = zlib.decompress(body).decode("utf-8")
+        elif header == HEADER_ZSTD:
+            if not ZSTD_AVAILABLE:
+                raise RuntimeError("zstd圧縮されたテキストの展開には zstandard が必要です")
+            text = self._zstd()[1].decompress(body).decode("utf-8")
+        else:
+            # ヘッダーのない値はUTF-8の平文として扱う
+            text = value.decode("utf-8")
+        self.stats.record_decode(time.perf_counter() - started)
+        return text
+
+
+def create_codec() -> TextCodec:
+    """設定からコーデックを作成"""
+    settings = get_settings()
+    zstd_dict = None
+    if settings.text_compression == "zstd" and settings.text_compression_dict_path:
+        try:
+            with open(settings.text_compression_dict_path, "rb") as f:
+                zstd_dict = f.read()
+        except FileNotFoundError:
+            print(f"⚠️  zstd辞書が見つかりません: {settings.text_compression_dict_path}")
+    return TextCodec(
+        algorithm=settings.text_compression,
+        threshold=settings.text_compression_threshold,
+        level=settings.text_compression_level,
+        zstd_dict=zstd_dict,
+    )
+
+
+# グローバルインスタンス
+text_codec = create_codec()
+
+
+class CompressedText(TypeDecorator):
+    """閾値以上の長さのテキストを圧縮して保存するカラム型"""
+
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return text_codec.encode(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return text_codec.decode(value)
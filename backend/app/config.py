@@ -24,12 +24,76 @@ class Settings(BaseSettings):
     postgres_password: str = ""
     postgres_host: str = "localhost"
     postgres_port: int = 5432
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_timeout: int = 30
+    id_format: str = "uuid7"  # uuid7（時刻順）, uuid4（ランダム）
     
+    # SQLite本番プロファイル（WAL・PRAGMA・単一ライター）
+    sqlite_tuned: bool = False
+    sqlite_read_pool_size: int = 8
+    sqlite_mmap_size: int = 268435456  # 256MiB
+    sqlite_cache_size_kb: int = 65536  # 64MiB
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_writer_batch_size: int = 64
+    sqlite_writer_max_delay_ms: int = 2
+    
+    # メッセージINSERTの write-behind（複数行INSERTでまとめてコミット、応答はコミット後）
+    message_write_behind: bool = False
+    message_write_behind_batch_size: int = 256
+    message_write_behind_max_delay_ms: int = 5
+    
+    # 期限切れメッセージ削除設定
+    sweeper_enabled: bool = True
+    sweeper_interval_seconds: int = 300
+    sweeper_batch_size: int = 500
+    sweeper_duty_cycle: float = 0.2  # 削除に使う時間の割合
+    messages_partitioned: bool = False  # PostgreSQL: expires_at で日次パーティション化
+    
+    # コールドアーカイブ設定（削除前に列指向ファイルへ書き出し、pyarrowが必要）
+    archive_enabled: bool = False
+    archive_dir: str = "/app/data/archive"
+    archive_format: str = "parquet"  # parquet, arrow（Arrow IPC）
+    archive_compression: str = "zstd"  # zstd, lz4, none
+    
+    # 未読カウンター設定
+    unread_reconcile_interval_seconds: int = 600
+    
+    # テキスト圧縮設定（MessageContent.text）
+    text_compression: str = "zlib"  # none, zlib, zstd
+    text_compression_threshold: int = 256  # このバイト数未満は平文のまま保存
+    text_compression_level: int = 6
+    text_compression_dict_path: Optional[str] = None  # zstd共有辞書（差し替え時は再圧縮が必要）
+    
+    # 検索設定（全文 + ベクトルのハイブリッド検索）
+    search_rrf_k: int = 60  # Reciprocal Rank Fusion の平滑化定数
+    search_candidates: int = 50  # 全文・ベクトルそれぞれから取得する候補数の下限
+    render_neighbors: int = 3  # 再構成時にLLMへ渡す近傍メッセージ数
+
     # Redis設定
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_db: int = 0
     
+    # Socket.IO設定（複数ワーカー・複数ノードではRedis経由でemitを中継）
+    socketio_redis_manager: bool = False
+    socketio_redis_channel: str = "sensechat_socketio"
+    socketio_serializer: str = "default"  # default（JSON）, msgpack（クライアントに msgpack パーサーが必要）
+    socketio_batch_window_ms: int = 0  # >0 で同じ接続宛てのイベントをまとめて送信（"batch" イベント）
+    socketio_batch_max_events: int = 64
+    socketio_max_queue: int = 256  # 1接続あたりの送信待ちイベントの上限
+    socketio_max_backlog: int = 64  # 未送信パケットがこの件数以上の接続は受信停滞とみなして送信を保留
+    socketio_slow_consumer_seconds: float = 10.0  # 受信停滞がこの秒数続いた接続は切断
+    typing_refresh_seconds: float = 3.0  # 入力中が続く場合の再通知間隔
+    typing_timeout_seconds: float = 6.0  # この秒数更新がなければ入力終了を通知
+    presence_delta_interval_ms: int = 500  # オンライン状態の差分をまとめて送る間隔
+    presence_thread_room_max_members: int = 50  # これを超える参加者のスレッドは送受信した2人ごとのルームに分割
+    
+    # オフライン配信キュー（オフライン中のイベントを再接続時に再送）
+    offline_queue_ttl_seconds: int = 86400  # メッセージの有効期限と同じ24時間
+    offline_queue_max_len: int = 1000  # 1ユーザーあたりの上限
+    offline_replay_batch_size: int = 200  # 1回の再送で送るイベント数
+    
     # LLM API設定
     openai_api_key: Optional[str] = None
     openrouter_api_key: Optional[str] = None
@@ -49,6 +113,7 @@ class Settings(BaseSettings):
     
     # 監視設定
     prometheus_enabled: bool = False
+    server_timing_enabled: bool = True  # 段階別の処理時間を Server-Timing ヘッダーで返す
     grafana_enabled: bool = False
     
     # バックアップ設定
@@ -0,0 +1,116 @@
+"""
+ワーカー内の接続レジストリ
+user_id -> sid の集合、sid -> 端末セッションの双方向インデックスを持ち、
+1ユーザーの複数端末接続を扱う（参照・登録・削除はすべてO(1)）
+"""
+
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+
+class DeviceSession:
+    """1接続（端末）のセッション情報"""
+
+    __slots__ = ("sid", "user_id", "device_id", "user_agent", "connected_at", "last_seen")
+
+    def __init__(self, sid: str, user_id: str, device_id: Optional[str] = None, user_agent: Optional[str] = None):
+        self.sid = sid
+        self.user_id = user_id
+        self.device_id = device_id
+        self.user_agent = user_agent
+        self.connected_at = time.time()
+        self.last_seen = self.connected_at
+
+    def to_dict(self) -> dict:
+        return {
+            "sid": self.sid,
+            "device_id": self.device_id,
+            "user_agent": self.user_agent,
+            "connected_at": self.connected_at,
+            "last_seen": self.last_seen,
+        }
+
+
+class ConnectionRegistry:
+    """このワーカーに接続している端末の双方向インデックス"""
+
+    def __init__(self):
+        self._sessions: Dict[str, DeviceSession] = {}  # sid -> セッション
+        self._user_sids: Dict[str, Set[str]] = {}  # user_id -> sid の集合
+        # (user_id, device_id) -> sid（同じ端末の再接続で古い接続を置き換える）
+        self._device_sids: Dict[Tuple[str, str], str] = {}
+
+    def register(
+        self, sid: str, user_id: str, device_id: Optional[str] = None, user_agent: Optional[str] = None
+    ) -> Tuple[bool, Optional[DeviceSession]]:
+        """接続を登録し、(このワーカーでユーザーの最初の接続か, 置き換えた古い接続) を返す
+
+        同じ端末（device_id）が切断を検知される前に再接続した場合、古い接続を登録から外して返す。
+        """
+        if sid in self._sessions:
+            # 同じ接続での再登録（別ユーザーとして登録し直す場合は先に外す）
+            if self._sessions[sid].user_id == user_id:
+                return False, None
+            self.unregister(sid)
+
+        replaced = None
+        if device_id is not None:
+            previous_sid = self._device_sids.get((user_id, device_id))
+            if previous_sid is not None and previous_sid != sid:
+                replaced, _ = self.unregister(previous_sid)
+
+        sids = self._user_sids.setdefault(user_id, set())
+        first = not sids
+        sids.add(sid)
+        self._sessions[sid] = DeviceSession(sid, user_id, device_id, user_agent)
+        if device_id is not None:
+            self._device_sids[(user_id, device_id)] = sid
+        return first, replaced
+
+    def unregister(self, sid: str) -> Tuple[Optional[DeviceSession], bool]:
+        """接続を削除し、(削除したセッション, このワーカーでユーザーの最後の接続だったか) を返す"""
+        session = self._sessions.pop(sid, None)
+        if session is None:
+            return None, False
+        sids = self._user_sids.get(session.user_id)
+        last = True
+        if sids is not None:
+            sids.discard(sid)
+            last = not sids
+            if last:
+                del self._user_sids[session.user_id]
+        if session.device_id is not None and self._device_sids.get((session.user_id, session.device_id)) == sid:
+            del self._device_sids[(session.user_id, session.device_id)]
+        return session, last
+
+    def user_of(self, sid: str) -> Optional[str]:
+        session = self._sessions.get(sid)
+        return session.user_id if session else None
+
+    def session(self, sid: str) -> Optional[DeviceSession]:
+        return self._sessions.get(sid)
+
+    def sids_of(self, user_id: str) -> Set[str]:
+        return self._user_sids.get(user_id, set())
+
+    def devices_of(self, user_id: str) -> List[DeviceSession]:
+        return [self._sessions[sid] for sid in self.sids_of(user_id)]
+
+    def is_connected(self, user_id: str) -> bool:
+        return user_id in self._user_sids
+
+    def touch(self, sid: str):
+        """端末からの通信を記録"""
+        session = self._sessions.get(sid)
+        if session is not None:
+            session.last_seen = time.time()
+
+    def users(self) -> List[str]:
+        return list(self._user_sids)
+
+    def sid_users(self) -> Dict[str, str]:
+        """sid -> user_id（共有プレゼンスの更新用）"""
+        return {sid: session.user_id for sid, session in self._sessions.items()}
+
+    def __len__(self) -> int:
+        return len(self._sessions)
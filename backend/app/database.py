@@ -3,12 +3,16 @@
 SQLite（開発）とPostgreSQL（本番）の両方に対応
 """
 
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from pathlib import Path
 
+from app.config import get_settings
+
 # データベースURL
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/sensechat.db")
 
@@ -17,19 +21,38 @@ if DATABASE_URL.startswith("sqlite"):
     data_dir = Path("./data")
     data_dir.mkdir(exist_ok=True)
 
-# データベースエンジンの作成
+DEBUG_ECHO = os.getenv("DEBUG", "false").lower() == "true"
+
+
+def to_async_url(url: str) -> str:
+    """同期ドライバのURLを非同期ドライバ（aiosqlite / asyncpg）のURLに変換"""
+    if url.startswith("sqlite+") or url.startswith("postgresql+asyncpg"):
+        return url
+    if url.startswith("sqlite"):
+        return url.replace("sqlite", "sqlite+aiosqlite", 1)
+    if url.startswith("postgresql+"):
+        # postgresql+psycopg2:// など明示ドライバ指定を置き換え
+        return "postgresql+asyncpg" + url[url.index("://"):]
+    if url.startswith("postgresql"):
+        return url.replace("postgresql", "postgresql+asyncpg", 1)
+    return url
+
+
+ASYNC_DATABASE_URL = to_async_url(DATABASE_URL)
+
+# データベースエンジンの作成（同期: マイグレーション・スクリプト用）
 if DATABASE_URL.startswith("sqlite"):
     # SQLite用の設定
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},  # SQLite用
-        echo=os.getenv("DEBUG", "false").lower() == "true"
+        echo=DEBUG_ECHO
     )
 elif DATABASE_URL.startswith("postgresql"):
     # PostgreSQL用の設定
     engine = create_engine(
         DATABASE_URL,
-        echo=os.getenv("DEBUG", "false").lower() == "true",
+        echo=DEBUG_ECHO,
         pool_pre_ping=True,  # 接続の健全性チェック
         pool_recycle=300,    # 5分で接続をリサイクル
     )
@@ -37,17 +60,101 @@ else:
     # その他のデータベース
     engine = create_engine(
         DATABASE_URL,
-        echo=os.getenv("DEBUG", "false").lower() == "true"
+        echo=DEBUG_ECHO
     )
 
+# 非同期エンジンの作成（APIハンドラー用）
+settings = get_settings()
+SQLITE_TUNED = DATABASE_URL.startswith("sqlite") and settings.sqlite_tuned
+
+# 単一ライター用エンジン（SQLite本番プロファイルのみ）
+writer_engine = None
+
+if SQLITE_TUNED:
+    # SQLite本番プロファイル: 読み取りは接続プール、書き込みは専用接続1本に直列化
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=DEBUG_ECHO,
+        pool_size=settings.sqlite_read_pool_size,
+        max_overflow=0,
+        poolclass=AsyncAdaptedQueuePool,
+        connect_args={"timeout": 30},
+    )
+    writer_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=DEBUG_ECHO,
+        pool_size=1,
+        max_overflow=0,
+        poolclass=AsyncAdaptedQueuePool,
+        connect_args={"timeout": 30},
+    )
+elif DATABASE_URL.startswith("sqlite"):
+    # aiosqlite は接続ごとにスレッドを持つため check_same_thread は不要
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=DEBUG_ECHO
+    )
+elif DATABASE_URL.startswith("postgresql"):
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=DEBUG_ECHO,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_timeout=settings.db_pool_timeout,
+        pool_pre_ping=True,
+        pool_recycle=300,
+    )
+else:
+    async_engine = create_async_engine(
+        ASYNC_DATABASE_URL,
+        echo=DEBUG_ECHO
+    )
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """SQLite本番プロファイルのPRAGMAを接続ごとに設定"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")  # 読み取りと書き込みを並行可能に
+    cursor.execute("PRAGMA synchronous=NORMAL")  # WALではコミット毎のfsyncを省略しても整合性は保たれる
+    cursor.execute(f"PRAGMA mmap_size={settings.sqlite_mmap_size}")
+    cursor.execute(f"PRAGMA cache_size=-{settings.sqlite_cache_size_kb}")  # 負値はKiB指定
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout_ms}")
+    cursor.close()
+
+if SQLITE_TUNED:
+    for _engine in (engine, async_engine.sync_engine, writer_engine.sync_engine):
+        event.listen(_engine, "connect", apply_sqlite_pragmas)
+
 # セッションファクトリー
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 非同期セッションファクトリー
+# commit後に属性が失効すると遅延ロード（非同期では不可）が発生するため expire_on_commit=False
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+# 単一ライター用セッションファクトリー
+WriterSessionLocal = async_sessionmaker(
+    bind=writer_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+) if writer_engine is not None else None
+
 # ベースクラス
 Base = declarative_base()
 
 # データベース依存性
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# 同期データベース依存性（スクリプト・マイグレーション用）
+def get_sync_db():
     db = SessionLocal()
     try:
         yield db
@@ -59,8 +166,15 @@ async def init_db():
     """データベースの初期化"""
     try:
         # テーブル作成
-        Base.metadata.create_all(bind=engine)
+        async with async_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
         print(f"✅ データベース初期化完了: {DATABASE_URL.split('://')[0]}")
     except Exception as e:
         print(f"❌ データベース初期化エラー: {e}")
         raise
+
+async def close_db():
+    """非同期エンジンの接続プールを破棄"""
+    await async_engine.dispose()
+    if writer_engine is not None:
+        await writer_engine.dispose()
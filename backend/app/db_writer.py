@@ -0,0 +1,198 @@
+"""
+単一ライターとグループコミット
+SQLiteでの "database is locked" を避けるため、書き込みを専用タスクに直列化する
+メッセージのINSERTは write-behind バッファで複数行INSERTにまとめることもできる
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal, WriterSessionLocal
+from app.models import Message
+
+logger = logging.getLogger(__name__)
+
+# 書き込み処理: セッションを受け取り、flushまで行って結果を返す（commitは呼び出し側）
+WriteFn = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class GroupCommitWriter:
+    """書き込み処理をキューで受け取り、専用接続でまとめてコミットする"""
+
+    def __init__(self, session_factory, max_batch: int = 64, max_delay_ms: float = 2):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay_ms / 1000
+        self._queue: "asyncio.Queue[Optional[Tuple[WriteFn, asyncio.Future]]]" = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # 統計（ベンチマーク・監視用）
+        self.commits = 0
+        self.writes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def queue_depth(self) -> int:
+        """コミット待ちの書き込み件数"""
+        return self._queue.qsize()
+
+    async def submit(self, fn: WriteFn) -> Any:
+        """書き込み処理を投入し、コミット完了まで待つ"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, future))
+        return await future
+
+    async def _collect(self) -> List[Tuple[WriteFn, asyncio.Future]]:
+        """最初の1件を待ち、max_delay 以内に届いた分を max_batch 件までまとめる"""
+        first = await self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if item is None:
+                # 停止要求は残りを処理した後に反映
+                self._queue.put_nowait(None)
+                break
+            batch.append(item)
+        return batch
+
+    async def _apply(self, session: AsyncSession, batch: List[Tuple[Any, asyncio.Future]]) -> List[Any]:
+        """バッチ内の書き込みをセッションに適用し、それぞれの結果を返す"""
+        return [await fn(session) for fn, _ in batch]
+
+    async def _commit_batch(self, batch: List[Tuple[Any, asyncio.Future]]):
+        async with self.session_factory() as session:
+            try:
+                results = await self._apply(session, batch)
+                await session.commit()
+                self.commits += 1
+                self.writes += len(batch)
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                return
+            except Exception as e:
+                await session.rollback()
+                if len(batch) == 1:
+                    fn, future = batch[0]
+                    if not future.done():
+                        future.set_exception(e)
+                    return
+                logger.warning(f"グループコミット失敗のため個別にコミットします: {e}")
+
+        # 失敗した処理だけがエラーになるよう1件ずつやり直す
+        for item in batch:
+            await self._commit_batch([item])
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            if not batch:
+                break
+            await self._commit_batch(batch)
+
+    def start(self):
+        """ライタータスクを開始（FastAPIスタートアップで呼び出し）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """キューに残った書き込みを処理してから停止"""
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+
+
+class WriteBehindInserter(GroupCommitWriter):
+    """単一テーブルへの行INSERTをバッファし、複数行INSERT1回・コミット1回で書き込む
+
+    submit(row) はバッファした行がコミットされるまで待つ（durable ack）。
+    - 応答はコミット後に返すため、クライアントに成功を返した行は失われない
+    - プロセスが異常終了した場合、バッファ中の行は書き込まれず、
+      その呼び出し元にも応答は返らない（クライアントは失敗として再送する）
+    - 停止時（stop）はバッファ中の行を全て書き込んでから終了する
+    - 複数行INSERTが失敗した場合は1行ずつやり直し、失敗した行だけをエラーにする
+    """
+
+    def __init__(self, session_factory, table, max_batch: int = 256, max_delay_ms: float = 5):
+        super().__init__(session_factory, max_batch=max_batch, max_delay_ms=max_delay_ms)
+        self.table = table
+
+    async def submit(self, row: dict) -> None:
+        """行をバッファに追加し、コミット完了まで待つ"""
+        await super().submit(row)
+
+    async def _apply(self, session: AsyncSession, batch: List[Tuple[dict, asyncio.Future]]) -> List[Any]:
+        await session.execute(insert(self.table), [row for row, _ in batch])
+        return [None] * len(batch)
+
+
+def create_writer() -> Optional[GroupCommitWriter]:
+    """SQLite本番プロファイルの場合のみライターを作成
+    
+    ライターはプロセスごとに1つのため、このプロファイルは1プロセスで起動する
+    （gunicorn.conf.py がワーカー数を1に固定する）。
+    """
+    if WriterSessionLocal is None:
+        return None
+    settings = get_settings()
+    return GroupCommitWriter(
+        WriterSessionLocal,
+        max_batch=settings.sqlite_writer_batch_size,
+        max_delay_ms=settings.sqlite_writer_max_delay_ms,
+    )
+
+
+def create_message_inserter() -> Optional[WriteBehindInserter]:
+    """MESSAGE_WRITE_BEHIND=true の場合のみメッセージ用の write-behind バッファを作成"""
+    settings = get_settings()
+    if not settings.message_write_behind:
+        return None
+    return WriteBehindInserter(
+        WriterSessionLocal or AsyncSessionLocal,
+        Message.__table__,
+        max_batch=settings.message_write_behind_batch_size,
+        max_delay_ms=settings.message_write_behind_max_delay_ms,
+    )
+
+
+# グローバルインスタンス（SQLite本番プロファイル以外では None）
+db_writer = create_writer()
+# メッセージINSERTの write-behind バッファ（無効時は None）
+message_inserter = create_message_inserter()
+
+
+async def run_write(db: AsyncSession, fn: WriteFn) -> Any:
+    """書き込み処理を実行してコミット
+
+    単一ライターが動いていればそちらに投入し、そうでなければ
+    リクエストのセッションでそのままコミットする。
+    """
+    if db_writer is not None and db_writer.running:
+        return await db_writer.submit(fn)
+    try:
+        result = await fn(db)
+        await db.commit()
+        return result
+    except Exception:
+        await db.rollback()
+        raise
@@ -0,0 +1,91 @@
+"""
+全文検索のトークン化とインデックス定義
+日本語は空白で区切られないため、CJK文字列を文字バイグラムに分割して
+messages.search_text に保存し、PostgreSQL は GIN（tsvector）、
+SQLite は FTS5 仮想テーブル（トリガーで同期）で索引する
+"""
+
+import re
+import unicodedata
+from typing import List
+
+# ひらがな・カタカナ・CJK統合漢字（拡張A・互換含む）・ハングル
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_RE = re.compile(f"([{_CJK}]+)|([^\\W{_CJK}]+)")
+
+# PostgreSQL: tsvector の設定（インデックス式とクエリ式で一致させる）
+PG_TS_CONFIG = "'simple'::regconfig"
+
+# SQLite: FTS5 外部コンテンツテーブル（messages の rowid と対応付け）
+SQLITE_FTS_TABLE = "messages_fts"
+SQLITE_FTS_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5("
+    f"search_text, content='messages', content_rowid='rowid', tokenize='unicode61')",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, search_text) VALUES (new.rowid, new.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, search_text)
+        VALUES ('delete', old.rowid, old.search_text);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE OF search_text ON messages BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, search_text)
+        VALUES ('delete', old.rowid, old.search_text);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, search_text) VALUES (new.rowid, new.search_text);
+    END""",
+]
+SQLITE_FTS_DROP = [
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}",
+]
+# VACUUM で messages の rowid が振り直された場合はこれで再構築する
+SQLITE_FTS_REBUILD = f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"
+
+
+def tokenize(text: str) -> List[str]:
+    """テキストを検索トークンに分割（CJKは文字バイグラム、それ以外は単語）"""
+    if not text:
+        return []
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for cjk, word in _TOKEN_RE.findall(text):
+        if word:
+            tokens.append(word)
+        elif len(cjk) == 1:
+            tokens.append(cjk)
+        else:
+            tokens.extend(cjk[i:i + 2] for i in range(len(cjk) - 1))
+    return tokens
+
+
+def to_search_text(text: str) -> str:
+    """search_text カラムに保存する空白区切りのトークン列"""
+    return " ".join(tokenize(text))
+
+
+def _query_tokens(query: str) -> List[str]:
+    # 重複を除き、出現順を保つ
+    return list(dict.fromkeys(tokenize(query)))
+
+
+def _is_single_cjk(token: str) -> bool:
+    return len(token) == 1 and _TOKEN_RE.fullmatch(token).group(1) is not None
+
+
+def sqlite_match_expression(query: str) -> str:
+    """FTS5 の MATCH 式（全トークンの AND）。トークンがなければ空文字"""
+    terms = []
+    for token in _query_tokens(query):
+        # 1文字の漢字・かなはその文字で始まるバイグラムに前方一致させる
+        terms.append(f'"{token}"*' if _is_single_cjk(token) else f'"{token}"')
+    return " ".join(terms)
+
+
+def pg_tsquery_expression(query: str) -> str:
+    """to_tsquery に渡す式（全トークンの AND）。トークンがなければ空文字"""
+    terms = []
+    for token in _query_tokens(query):
+        terms.append(f"{token}:*" if _is_single_cjk(token) else token)
+    return " & ".join(terms)
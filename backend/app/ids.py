@@ -0,0 +1,70 @@
+"""
+主キーID生成
+時刻順に並ぶ UUIDv7（RFC 9562）を生成し、B-treeへの挿入を末尾に集中させる
+（ランダムな UUIDv4 はページ分割とキャッシュミスを増やす）
+"""
+
+import secrets
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Optional
+
+from app.config import get_settings
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+_COUNTER_MAX = 0xFFF  # rand_a（12ビット）を同一ミリ秒内の連番に使う
+
+
+def uuid7(at: Optional[datetime] = None) -> uuid.UUID:
+    """UUIDv7 を生成（同一プロセス内では単調増加）
+
+    at を指定した場合はその時刻のIDを生成する（既存行の再採番用、単調性は保証しない）。
+    """
+    global _last_ms, _counter
+    if at is not None:
+        ms, counter = int(at.timestamp() * 1000), secrets.randbits(12)
+    else:
+        with _lock:
+            ms = time.time_ns() // 1_000_000
+            if ms > _last_ms:
+                _last_ms = ms
+                # 上位1ビットを0にして同一ミリ秒内の増分に余裕を持たせる
+                _counter = secrets.randbits(11)
+            else:
+                # 同一ミリ秒内、または時計が戻った場合は前回の時刻のまま連番を進める
+                _counter += 1
+                if _counter > _COUNTER_MAX:
+                    _last_ms += 1
+                    _counter = 0
+            ms, counter = _last_ms, _counter
+
+    value = (ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0b10 << 62
+    value |= secrets.randbits(62)
+    return uuid.UUID(int=value)
+
+
+def is_uuid7(value: str) -> bool:
+    """UUIDv7 形式のID文字列かどうか"""
+    try:
+        return uuid.UUID(value).version == 7
+    except (ValueError, TypeError, AttributeError):
+        return False
+
+
+def uuid7_timestamp(value: str) -> datetime:
+    """UUIDv7 文字列に埋め込まれた生成時刻を取得"""
+    return datetime.fromtimestamp((uuid.UUID(value).int >> 80) / 1000)
+
+
+def new_id() -> str:
+    """主キー用のID文字列を生成（ID_FORMAT=uuid4 で従来のランダムIDに戻せる）"""
+    if get_settings().id_format == "uuid4":
+        return str(uuid.uuid4())
+    return str(uuid7())
@@ -0,0 +1,193 @@
+"""
+Prometheus メトリクス
+PROMETHEUS_ENABLED=true かつ prometheus_client がインストールされている場合に /metrics で公開する
+
+- HTTPリクエストの処理時間（ルート・ステータス別のヒストグラム）
+- パイプラインの段階別の処理時間（要約・ベクトル化・スロット抽出・DB書き込み・近傍検索・LLM呼び出し）
+- WebSocket接続数・イベントループの遅延・キャッシュのヒット/ミス・実行キューの待ち件数
+
+gunicorn の複数ワーカーでは PROMETHEUS_MULTIPROC_DIR を設定し、
+各ワーカーの値をファイル経由で集計する（gunicorn.conf.py が終了したワーカーの値を片付ける）。
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+from fastapi import APIRouter, Request, Response
+
+from app.config import get_settings
+
+# prometheus_client（任意依存）
+try:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+    )
+    PROMETHEUS_AVAILABLE = True
+except ImportError:
+    PROMETHEUS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 段階別の処理時間のバケット（LLM呼び出しの数秒まで）
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# イベントループの遅延・実行キューの計測間隔（秒）
+MONITOR_INTERVAL_SECONDS = 1.0
+
+# 無効時はすべての計測が何もしない
+enabled = PROMETHEUS_AVAILABLE and get_settings().prometheus_enabled
+
+if PROMETHEUS_AVAILABLE:
+    REQUEST_DURATION = Histogram(
+        "sensechat_http_request_duration_seconds",
+        "HTTPリクエストの処理時間",
+        ["method", "route", "status"],
+    )
+    STAGE_DURATION = Histogram(
+        "sensechat_stage_duration_seconds",
+        "パイプラインの段階別の処理時間",
+        ["stage"],
+        buckets=STAGE_BUCKETS,
+    )
+    CACHE_REQUESTS = Counter(
+        "sensechat_cache_requests_total",
+        "キャッシュの参照回数（result=hit/miss）",
+        ["cache", "result"],
+    )
+    SOCKET_CONNECTIONS = Gauge(
+        "sensechat_socketio_connections",
+        "WebSocket接続数（全ワーカーの合計）",
+        multiprocess_mode="livesum",
+    )
+    SLOW_CONSUMERS = Gauge(
+        "sensechat_socketio_slow_consumers_disconnected",
+        "受信が遅く切断した接続の累計（稼働中のワーカーの合計）",
+        multiprocess_mode="livesum",
+    )
+    EVENT_LOOP_LAG = Gauge(
+        "sensechat_event_loop_lag_seconds",
+        "イベントループの遅延（ワーカーの最大値）",
+        multiprocess_mode="livemax",
+    )
+    EXECUTOR_QUEUE_DEPTH = Gauge(
+        "sensechat_executor_queue_depth",
+        "実行キューの待ち件数（スレッドプール・DB書き込みキュー）",
+        ["executor"],
+        multiprocess_mode="livesum",
+    )
+
+
+@contextmanager
+def observe_stage(stage: str):
+    """パイプラインの1段階の処理時間を記録"""
+    if not enabled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_DURATION.labels(stage).observe(time.perf_counter() - started)
+
+
+def record_cache(cache: str, hit: bool):
+    """キャッシュのヒット/ミスを記録"""
+    if enabled:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def _route_label(request: Request) -> str:
+    # パスパラメータを含まないルートのテンプレート（/threads/{thread_id}/timeline など）
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+async def metrics_middleware(request: Request, call_next):
+    """ルート・ステータス別の処理時間を記録するミドルウェア"""
+    if not enabled or request.url.path == "/metrics":
+        return await call_next(request)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        REQUEST_DURATION.labels(request.method, _route_label(request), str(status)).observe(
+            time.perf_counter() - started
+        )
+
+
+def _default_executor_depth() -> int:
+    """asyncio.to_thread などが使うスレッドプールの待ち件数"""
+    executor = getattr(asyncio.get_running_loop(), "_default_executor", None)
+    work_queue = getattr(executor, "_work_queue", None)
+    return work_queue.qsize() if work_queue is not None else 0
+
+
+class RuntimeMonitor:
+    """イベントループの遅延・接続数・実行キューを定期的にゲージへ反映する
+
+    複数ワーカーではスクレイプを受けたワーカー以外の値も必要なため、各ワーカーで定期的に更新する。
+    """
+
+    def __init__(self, interval: float = MONITOR_INTERVAL_SECONDS):
+        self.interval = interval
+        # executor 名 -> 待ち件数を返す関数
+        self.queue_depths: Dict[str, Callable[[], int]] = {"default": _default_executor_depth}
+        self.socket_stats: Optional[Callable[[], Dict]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def sample(self, lag: float):
+        EVENT_LOOP_LAG.set(lag)
+        for name, depth in self.queue_depths.items():
+            EXECUTOR_QUEUE_DEPTH.labels(name).set(depth())
+        if self.socket_stats is not None:
+            stats = self.socket_stats()
+            SOCKET_CONNECTIONS.set(stats.get("connections", 0))
+            SLOW_CONSUMERS.set(stats.get("outbound", {}).get("slow_consumers", 0))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            try:
+                self.sample(max(0.0, loop.time() - expected))
+            except Exception as e:
+                logger.error(f"メトリクス更新エラー: {e}")
+
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus のスクレイプ用エンドポイント"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        # gunicorn の全ワーカーの値を集計
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY as registry
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+
+
+# グローバルインスタンス
+runtime_monitor = RuntimeMonitor()
@@ -3,17 +3,19 @@
 SQLite用（簡易版）
 """
 
-from sqlalchemy import Column, String, Text, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, String, Text, DateTime, Boolean, ForeignKey, Index, DDL, event, literal_column
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, validates
 from app.database import Base
-import uuid
+from app.compression import CompressedText
+from app.fts import PG_TS_CONFIG, SQLITE_FTS_DDL, SQLITE_FTS_DROP, to_search_text
+from app.ids import new_id
 
 class User(Base):
     """ユーザーモデル（簡易版）"""
     __tablename__ = "users"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     name = Column(String, nullable=False)
     language = Column(String, default="ja")
     style_preset = Column(String, default="biz_formal")
@@ -27,7 +29,7 @@ class Thread(Base):
     """スレッドモデル（簡易版）"""
     __tablename__ = "threads"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     created_by = Column(String, ForeignKey("users.id"))
     title = Column(String)
     created_at = Column(DateTime, default=func.now())
@@ -36,17 +38,22 @@ class Thread(Base):
     creator = relationship("User", back_populates="threads")
     messages = relationship("Message", back_populates="thread")
 
+def _summary_search_text(context):
+    """summary から全文検索用のトークン列を生成（Core の INSERT 用の既定値）"""
+    return to_search_text(context.get_current_parameters().get("summary") or "")
+
 class Message(Base):
     """メッセージモデル（軽量化版 - クライアント側保存対応）"""
     __tablename__ = "messages"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     thread_id = Column(String, ForeignKey("threads.id"))
     sender_id = Column(String, ForeignKey("users.id"))
     summary = Column(Text, nullable=False)  # 要約のみ（元のテキストはクライアント側に保存）
     vector_id = Column(String)  # FAISS内のID
     slots = Column(Text)  # JSON文字列
     lang_hint = Column(String)
+    search_text = Column(Text, default=_summary_search_text)  # 全文検索用バイグラム
     created_at = Column(DateTime, default=func.now())
     expires_at = Column(DateTime)  # 自動削除用（24時間後）
     
@@ -54,39 +61,75 @@ class Message(Base):
     thread = relationship("Thread", back_populates="messages")
     sender = relationship("User", back_populates="messages")
     contents = relationship("MessageContent", back_populates="message", cascade="all, delete-orphan")
+    
+    @validates("summary")
+    def _update_search_text(self, key, summary):
+        """ORM で summary を設定・更新した場合は検索用トークン列も更新"""
+        self.search_text = to_search_text(summary or "")
+        return summary
+    
+    # インデックス（スレッド一覧・期限切れ削除・全文/ベクトル検索のホットパス）
+    __table_args__ = (
+        Index("idx_messages_thread_created", "thread_id", "created_at", "id"),
+        Index("idx_messages_expires_at", "expires_at"),
+        Index("idx_messages_vector_id", "vector_id"),
+        Index(
+            "idx_messages_summary_gin",
+            func.to_tsvector(literal_column(PG_TS_CONFIG), literal_column("search_text")),
+            postgresql_using="gin",
+        ).ddl_if(dialect="postgresql"),
+    )
+
+# SQLite: 全文検索用のFTS5テーブルと同期トリガー
+for statement in SQLITE_FTS_DDL:
+    event.listen(Message.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in SQLITE_FTS_DROP:
+    event.listen(Message.__table__, "before_drop", DDL(statement).execute_if(dialect="sqlite"))
 
 class MessageContent(Base):
     """メッセージコンテンツモデル（サーバー側永続化対応）"""
     __tablename__ = "message_contents"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     message_id = Column(String, ForeignKey("messages.id"), nullable=False)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)  # 送信者または受信者
     content_type = Column(String, nullable=False)  # 'original' or 'rendered'
-    text = Column(Text, nullable=False)  # 元のテキストまたは再構成されたテキスト
+    text = Column(CompressedText, nullable=False)  # 元のテキストまたは再構成されたテキスト（閾値以上は圧縮）
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # リレーション
     message = relationship("Message", back_populates="contents")
     user = relationship("User")
+    
+    # インデックス（メッセージ×ユーザーのテキスト取得）
+    __table_args__ = (
+        Index("idx_message_contents_message_user", "message_id", "user_id"),
+    )
 
 class Inbox(Base):
     """受信箱モデル（簡易版）"""
     __tablename__ = "inbox"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     user_id = Column(String, ForeignKey("users.id"))
     message_id = Column(String, ForeignKey("messages.id"))
     thread_id = Column(String, ForeignKey("threads.id"))
     status = Column(String, default="unread")  # unread, read
+    message_created_at = Column(DateTime)  # messages.created_at の複製（スレッドのページをインデックス順に読むため）
     created_at = Column(DateTime, default=func.now())
+    
+    # インデックス（未読一覧・受信箱取得、スレッドへ配信されたメッセージのページング）
+    __table_args__ = (
+        Index("idx_inbox_user_status", "user_id", "status", "created_at"),
+        Index("idx_inbox_thread_message", "thread_id", "message_created_at", "message_id"),
+    )
 
 class KBItem(Base):
     """ナレッジベースアイテム（簡易版）"""
     __tablename__ = "kb_items"
     
-    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = Column(String, primary_key=True, default=new_id)
     text = Column(Text, nullable=False)
     vector_id = Column(String)  # FAISS内のID
     category = Column(String)
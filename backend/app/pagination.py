@@ -0,0 +1,57 @@
+"""
+キーセット（カーソル）ページネーション
+(created_at, id) を不透明なカーソル文字列にエンコードする
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+# カーソルの向き
+DIRECTION_NEXT = "next"  # より古いメッセージへ
+DIRECTION_PREV = "prev"  # より新しいメッセージへ
+
+
+def encode_cursor(created_at: datetime, item_id: str, direction: str) -> str:
+    """(created_at, id, 向き) をURLセーフな文字列にエンコード"""
+    payload = json.dumps(
+        {"c": created_at.isoformat(), "i": item_id, "d": direction},
+        separators=(",", ":"),
+    )
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str, str]:
+    """カーソル文字列を (created_at, id, 向き) にデコード"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        direction = payload["d"]
+        if direction not in (DIRECTION_NEXT, DIRECTION_PREV):
+            raise ValueError(direction)
+        return datetime.fromisoformat(payload["c"]), payload["i"], direction
+    except Exception:
+        raise HTTPException(status_code=400, detail="無効なカーソルです")
+
+
+def keyset_query(query, cursor: Optional[str], created_at, item_id):
+    """(created_at, id) のキーセット条件と並び順を付与し、(クエリ, 向き) を返す"""
+    key = tuple_(created_at, item_id)
+    direction = DIRECTION_NEXT
+
+    if cursor:
+        cursor_created_at, cursor_id, direction = decode_cursor(cursor)
+        if direction == DIRECTION_NEXT:
+            query = query.where(key < tuple_(cursor_created_at, cursor_id))
+        else:
+            query = query.where(key > tuple_(cursor_created_at, cursor_id))
+
+    if direction == DIRECTION_NEXT:
+        query = query.order_by(created_at.desc(), item_id.desc())
+    else:
+        query = query.order_by(created_at.asc(), item_id.asc())
+    return query, direction
@@ -0,0 +1,142 @@
+"""
+プレゼンスルーム
+オンライン状態の変化は、スレッド・家族を共有するユーザーにだけ差分で配信する
+（全接続へのブロードキャストは接続数の2乗でトラフィックが増えるため）
+
+ルーム:
+    presence:thread:{thread_id}  スレッドの参加者（作成者・送信者・配信先）
+    presence:dm:{user_a}:{user_b}  参加者が多すぎるスレッドでの、実際にやり取りした2人
+    presence:family:{family}     users.json の family が同じユーザー
+
+旧クライアントは全メッセージを thread_id "default" で配信していたため、そのようなスレッドを
+そのままルームにすると全員が1つのルームに入り差分が接続数の2乗に戻る。
+参加者が max_thread_members を超えるスレッドは、送信者と配信先の組のルームに分割する。
+"""
+
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import or_, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Inbox, Message, Thread
+from app.services.user_directory import user_directory
+
+THREAD_ROOM_PREFIX = "presence:thread:"
+FAMILY_ROOM_PREFIX = "presence:family:"
+CONVERSATION_ROOM_PREFIX = "presence:dm:"
+# これを超える参加者のスレッドはルームにしない（送信者と配信先の組のルームに分割）
+MAX_THREAD_ROOM_MEMBERS = 50
+
+
+def thread_room(thread_id: str) -> str:
+    return f"{THREAD_ROOM_PREFIX}{thread_id}"
+
+
+def family_room(family: str) -> str:
+    return f"{FAMILY_ROOM_PREFIX}{family}"
+
+
+def conversation_room(user_a: str, user_b: str) -> str:
+    first, second = sorted((user_a, user_b))
+    return f"{CONVERSATION_ROOM_PREFIX}{first}:{second}"
+
+
+def _thread_participants(thread_ids):
+    """(thread_id, user_id) の参加者一覧（作成者・送信者・配信先）"""
+    return union(
+        select(Inbox.thread_id, Inbox.user_id).where(Inbox.thread_id.in_(thread_ids)),
+        select(Inbox.thread_id, Message.sender_id)
+        .join(Message, Message.id == Inbox.message_id)
+        .where(Inbox.thread_id.in_(thread_ids)),
+        select(Message.thread_id, Message.sender_id).where(Message.thread_id.in_(thread_ids)),
+        select(Thread.id, Thread.created_by).where(Thread.id.in_(thread_ids), Thread.created_by.isnot(None)),
+    )
+
+
+async def _conversation_rooms(db: AsyncSession, user_id: str, thread_ids: Set[str]) -> Dict[str, Set[str]]:
+    """スレッド内でユーザーと送受信した相手ごとのルーム"""
+    result = await db.execute(
+        select(Message.sender_id, Inbox.user_id)
+        .join(Message, Message.id == Inbox.message_id)
+        .where(
+            Inbox.thread_id.in_(thread_ids),
+            or_(Inbox.user_id == user_id, Message.sender_id == user_id),
+        )
+        .distinct()
+    )
+    rooms: Dict[str, Set[str]] = {}
+    for sender_id, recipient_id in result:
+        if sender_id and recipient_id and sender_id != recipient_id:
+            rooms[conversation_room(sender_id, recipient_id)] = {sender_id, recipient_id}
+    return rooms
+
+
+async def load_user_rooms(db: Optional[AsyncSession], user_id: str,
+                          max_thread_members: int = MAX_THREAD_ROOM_MEMBERS) -> Dict[str, Set[str]]:
+    """ユーザーが参加するプレゼンスルームと、各ルームのメンバーを返す
+
+    DBへのクエリは1回（参加者の多すぎるスレッドがある場合のみ2回）。
+    """
+    rooms: Dict[str, Set[str]] = {}
+
+    profile = user_directory.get(user_id) or {}
+    family = profile.get("family")
+    if family:
+        rooms[family_room(family)] = {
+            user["id"] for user in user_directory.all() if user.get("family") == family
+        }
+
+    if db is not None:
+        user_threads = union(
+            select(Inbox.thread_id).where(Inbox.user_id == user_id),
+            select(Inbox.thread_id)
+            .join(Message, Message.id == Inbox.message_id)
+            .where(Message.sender_id == user_id),
+            select(Message.thread_id).where(Message.sender_id == user_id),
+            select(Thread.id).where(Thread.created_by == user_id),
+        ).subquery()
+        result = await db.execute(_thread_participants(select(user_threads.c[0]).where(user_threads.c[0].isnot(None))))
+        thread_rooms: Dict[str, Set[str]] = {}
+        for thread_id, member_id in result:
+            if thread_id and member_id:
+                thread_rooms.setdefault(thread_id, set()).add(member_id)
+        crowded = {thread_id for thread_id, members in thread_rooms.items() if len(members) > max_thread_members}
+        for thread_id, members in thread_rooms.items():
+            if thread_id not in crowded:
+                rooms[thread_room(thread_id)] = members
+        if crowded:
+            rooms.update(await _conversation_rooms(db, user_id, crowded))
+
+    return rooms
+
+
+class PresenceDeltaBatcher:
+    """ルームごとのオンライン状態の差分を短い間隔でまとめる
+
+    同じ間隔内に同じユーザーの状態が複数回変わった場合は最後の状態のみを送る。
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, str]] = {}  # room -> {user_id: status}
+        # Redis利用不可時のワーカー内バージョン
+        self._local_versions: Dict[str, int] = {}
+
+    def add(self, rooms: Iterable[str], user_id: str, status: str):
+        for room in rooms:
+            self._pending.setdefault(room, {})[user_id] = status
+
+    def drain(self) -> Dict[str, Dict[str, str]]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    def local_versions(self, rooms: Iterable[str], bump: bool) -> Dict[str, int]:
+        """ワーカー内で管理するバージョン（Redis利用不可時）"""
+        versions = {}
+        for room in rooms:
+            if bump:
+                self._local_versions[room] = self._local_versions.get(room, 0) + 1
+            versions[room] = self._local_versions.get(room, 0)
+        return versions
+
+    def __len__(self) -> int:
+        return len(self._pending)
@@ -0,0 +1,76 @@
+"""
+ホットクエリの実行計画チェック
+EXPLAIN の結果から想定インデックスが使われているかを確認する
+"""
+
+from datetime import datetime
+from typing import Dict, Tuple, List, Union
+
+from sqlalchemy import select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.sql import Select
+
+from app.models import Message, MessageContent, Inbox
+from app.pagination import encode_cursor, DIRECTION_NEXT
+from app.thread_scope import count_thread_messages, thread_page_query
+
+# スレッドのページ（ルーターと同じクエリ、2ページ目以降のカーソル付き）
+_thread_page, _ = thread_page_query(
+    select(Message), "thread_1", encode_cursor(datetime(2026, 1, 1), "msg_1", DIRECTION_NEXT), 21
+)
+
+# クエリ名 -> (クエリ, 使われるべきインデックス名（複数の場合はすべて）)
+HOT_QUERIES: Dict[str, Tuple[Select, Union[str, Tuple[str, ...]]]] = {
+    "inbox_unread": (
+        select(Inbox.id)
+        .where(Inbox.user_id == "user_1", Inbox.status == "unread")
+        .order_by(Inbox.created_at.desc()),
+        "idx_inbox_user_status",
+    ),
+    "thread_messages": (
+        _thread_page,
+        ("idx_messages_thread_created", "idx_inbox_thread_message"),
+    ),
+    "thread_message_count": (
+        count_thread_messages("thread_1"),
+        ("idx_messages_thread_created", "idx_inbox_thread_message"),
+    ),
+    "expired_messages": (
+        select(Message.id).where(Message.expires_at < datetime(2000, 1, 1)),
+        "idx_messages_expires_at",
+    ),
+    "message_by_vector": (
+        select(Message.id).where(Message.vector_id.in_(["vec_1", "vec_2"])),
+        "idx_messages_vector_id",
+    ),
+    "message_content": (
+        select(MessageContent.text)
+        .where(MessageContent.message_id == "msg_1", MessageContent.user_id == "user_1"),
+        "idx_message_contents_message_user",
+    ),
+}
+
+
+def explain(conn: Connection, stmt: Select) -> List[str]:
+    """クエリの実行計画を行のリストで取得"""
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    if conn.dialect.name == "sqlite":
+        rows = conn.execute(text(f"EXPLAIN QUERY PLAN {compiled}"))
+        return [row[-1] for row in rows]
+    rows = conn.execute(text(f"EXPLAIN {compiled}"))
+    return [row[0] for row in rows]
+
+
+def check_hot_queries(conn: Connection) -> Dict[str, Tuple[bool, List[str]]]:
+    """全ホットクエリについて (インデックス使用有無, 実行計画) を返す"""
+    if conn.dialect.name == "postgresql":
+        # 行数の少ない開発DBではシーケンシャルスキャンが選ばれるため無効化して評価
+        conn.execute(text("SET LOCAL enable_seqscan = off"))
+
+    results = {}
+    for name, (stmt, index_names) in HOT_QUERIES.items():
+        if isinstance(index_names, str):
+            index_names = (index_names,)
+        plan = explain(conn, stmt)
+        results[name] = (all(any(index_name in line for line in plan) for index_name in index_names), plan)
+    return results
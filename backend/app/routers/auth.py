@@ -5,12 +5,8 @@
 
 from fastapi import APIRouter, HTTPException
 from app.schemas import UserResponse
-from app.database import get_db
-from app.models import User
-from sqlalchemy.orm import Session
+from app.services.user_directory import user_directory
 from datetime import datetime
-import json
-import os
 
 router = APIRouter()
 
@@ -18,17 +14,14 @@ router = APIRouter()
 async def get_users():
     """利用可能なユーザー一覧を取得（簡易版）"""
     try:
-        # 設定ファイルからユーザー情報を読み込み
-        users_config_path = os.getenv("USERS_CONFIG", "config/users.json")
-        
-        if not os.path.exists(users_config_path):
+        # ユーザーディレクトリ（users.json のキャッシュ）から取得
+        if not user_directory.loaded:
             raise HTTPException(status_code=404, detail="ユーザー設定ファイルが見つかりません")
         
-        with open(users_config_path, "r", encoding="utf-8") as f:
-            users_data = json.load(f)
-        
-        return {"users": users_data.get("users", [])}
+        return {"users": user_directory.all()}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ユーザー情報の取得に失敗しました: {str(e)}")
 
@@ -36,13 +29,7 @@ async def get_users():
 async def get_user(user_id: str):
     """特定ユーザーの情報を取得"""
     try:
-        users_config_path = os.getenv("USERS_CONFIG", "config/users.json")
-        
-        with open(users_config_path, "r", encoding="utf-8") as f:
-            users_data = json.load(f)
-        
-        users = users_data.get("users", [])
-        user = next((u for u in users if u["id"] == user_id), None)
+        user = user_directory.get(user_id)
         
         if not user:
             raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
@@ -55,5 +42,7 @@ async def get_user(user_id: str):
             created_at=datetime.now()
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"ユーザー情報の取得に失敗しました: {str(e)}")
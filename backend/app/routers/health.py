@@ -7,7 +7,7 @@ from fastapi import APIRouter, HTTPException, Depends
 from app.schemas import HealthResponse
 from app.database import get_db
 from app.config import get_settings
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 from datetime import datetime
 import redis
@@ -32,7 +32,7 @@ async def health_check():
     )
 
 @router.get("/health/detailed")
-async def detailed_health_check(db: Session = Depends(get_db)):
+async def detailed_health_check(db: AsyncSession = Depends(get_db)):
     """詳細なヘルスチェック（本番環境用）"""
     settings = get_settings()
     services = {}
@@ -40,7 +40,7 @@ async def detailed_health_check(db: Session = Depends(get_db)):
     
     # データベース接続チェック
     try:
-        result = db.execute(text("SELECT 1"))
+        result = await db.execute(text("SELECT 1"))
         result.fetchone()
         services["database"] = "healthy"
         logger.info("Database health check: OK")
@@ -146,3 +146,9 @@ async def readiness_check():
 async def liveness_check():
     """Kubernetes liveness probe用"""
     return {"status": "alive", "timestamp": datetime.now()}
+
+@router.get("/health/websocket")
+async def websocket_health_check():
+    """WebSocket接続と送信キューの状態（接続ごとの送信待ち件数・切断した受信の遅い接続の数）"""
+    from app.websocket_manager import websocket_manager
+    return {"timestamp": datetime.now(), **websocket_manager.connection_stats()}
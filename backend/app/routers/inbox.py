@@ -0,0 +1,71 @@
+"""
+受信箱エンドポイント
+未読数サマリーと一括既読
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from app.schemas import InboxSummaryResponse, MarkReadRequest, MarkReadResponse
+from app.database import get_db
+from app.db_writer import run_write
+from app.models import Inbox
+from app.routers.messages import get_current_user
+from app.services.unread_counter_service import unread_counter_service
+from app.services.thread_version_service import thread_version_service
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+router = APIRouter()
+
+@router.get("/summary", response_model=InboxSummaryResponse)
+async def get_inbox_summary(current_user: str = Depends(get_current_user)):
+    """未読数サマリーを取得（Redisカウンターから取得するためDB集計は通常不要）"""
+    try:
+        total_unread, threads = await unread_counter_service.get_summary(current_user)
+        return InboxSummaryResponse(
+            user_id=current_user,
+            total_unread=total_unread,
+            threads=threads
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"未読数の取得に失敗しました: {str(e)}")
+
+@router.post("/read", response_model=MarkReadResponse)
+async def mark_read(
+    request: MarkReadRequest,
+    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """受信箱の項目をまとめて既読にする"""
+    try:
+        query = update(Inbox).where(
+            Inbox.user_id == current_user,
+            Inbox.status == "unread"
+        )
+        if request.inbox_ids:
+            query = query.where(Inbox.id.in_(request.inbox_ids))
+        if request.message_ids:
+            query = query.where(Inbox.message_id.in_(request.message_ids))
+        if request.thread_id:
+            query = query.where(Inbox.thread_id == request.thread_id)
+        
+        # 実際に既読になった行だけを減算するため RETURNING で取得
+        async def mark(session: AsyncSession):
+            result = await session.execute(
+                query.values(status="read").returning(Inbox.thread_id),
+                execution_options={"synchronize_session": False}
+            )
+            return result.scalars().all()
+        
+        async with unread_counter_service.in_flight([current_user]):
+            thread_ids = await run_write(db, mark)
+            await unread_counter_service.decrement(
+                (current_user, thread_id) for thread_id in thread_ids
+            )
+        await thread_version_service.bump(thread_ids)
+        total_unread, _ = await unread_counter_service.get_summary(current_user)
+        
+        return MarkReadResponse(updated=len(thread_ids), total_unread=total_unread)
+        
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"既読処理に失敗しました: {str(e)}")
@@ -2,20 +2,35 @@
 メッセージ関連エンドポイント
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Response
 from app.schemas import (
     MessageCreate, MessageResponse, RenderRequest, RenderResponse,
-    DeliverRequest, DeliverResponse
+    DeliverRequest, DeliverResponse, FanoutDeliverRequest, FanoutDeliverResponse,
+    FanoutDelivery, TimelineContent, TimelineMessage, TimelineResponse
 )
 from app.database import get_db
-from app.models import Message, Thread, Inbox, User
+from app.config import get_settings
+from app.models import Message, MessageContent, Thread, Inbox, User
 from app.services.embedding_service import EmbeddingService
 from app.services.llm_api_service import LLMAPIService
+from app.services.vector_service import vector_service
+from app.services.search_service import search_service
+from app.services.unread_counter_service import unread_counter_service
+from app.services.user_directory import user_directory
+from app.services.thread_version_service import thread_version_service
 from app.websocket_manager import websocket_manager
-from sqlalchemy.orm import Session
+from app.db_writer import message_inserter, run_write
+from app.ids import new_id
+from app.metrics import record_cache
+from app.timing import span, current_timings
+from app.pagination import encode_cursor, DIRECTION_NEXT, DIRECTION_PREV
+from app.thread_scope import count_thread_messages, thread_page_query
+from sqlalchemy import select, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from datetime import datetime
 from typing import Optional
-import uuid
+import hashlib
 import json
 
 router = APIRouter()
@@ -31,9 +46,13 @@ def get_current_user(x_user_id: Optional[str] = Header(None)):
 async def embed_message(
     request: MessageCreate,
     current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    timing: bool = Query(False, description="段階別の処理時間（ms）を timings に含める"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """テキストを要約・ベクトル化してメッセージを作成"""
+    """テキストを要約・ベクトル化してメッセージを作成
+    
+    段階別の処理時間は Server-Timing ヘッダーで返す。
+    """
     start_time = datetime.now()
     
     try:
@@ -41,38 +60,57 @@ async def embed_message(
         embedding_service = EmbeddingService()
         
         # 1. テキスト要約
-        summary = await embedding_service.summarize_text(
-            request.text, 
-            request.lang_hint
-        )
+        with span("summarize"):
+            summary = await embedding_service.summarize_text(
+                request.text, 
+                request.lang_hint
+            )
         
         # 2. ベクトル化
-        vector_id, vector = await embedding_service.create_embedding(
-            request.text,
-            request.lang_hint
-        )
+        with span("embed"):
+            vector_id, vector = await embedding_service.create_embedding(
+                request.text,
+                request.lang_hint
+            )
         
         # 3. スロット抽出
-        slots = await embedding_service.extract_slots(
-            request.text,
-            request.slots
-        )
+        with span("slots"):
+            slots = await embedding_service.extract_slots(
+                request.text,
+                request.slots
+            )
         
         # 4. データベース保存（要約とベクトルのみ）
         from datetime import timedelta
-        message = Message(
-            thread_id=None,  # 新規スレッド
-            sender_id=current_user,
-            summary=summary,
-            vector_id=vector_id,
-            slots=json.dumps(slots),
-            lang_hint=request.lang_hint,
-            expires_at=datetime.now() + timedelta(hours=24)  # 24時間後自動削除
-        )
+        now = datetime.now()
+        row = {
+            "id": new_id(),
+            "thread_id": None,  # 新規スレッド
+            "sender_id": current_user,
+            "summary": summary,
+            "vector_id": vector_id,
+            "slots": json.dumps(slots),
+            "lang_hint": request.lang_hint,
+            "created_at": now,
+            "expires_at": now + timedelta(hours=24)  # 24時間後自動削除
+        }
+        message = Message(**row)
+        
+        with span("db_write"):
+            if message_inserter is not None and message_inserter.running:
+                # 他のリクエストの行と複数行INSERTにまとめ、コミットされてから応答する
+                await message_inserter.submit(row)
+            else:
+                async def save_message(session: AsyncSession):
+                    session.add(message)
+                    await session.flush()
+                    return message
+                
+                await run_write(db, save_message)
         
-        db.add(message)
-        db.commit()
-        db.refresh(message)
+        # 5. ベクトルインデックスに登録（期限切れ時はスイーパーが削除）
+        with span("index"):
+            vector_service.add(vector_id, vector)
         
         processing_time = (datetime.now() - start_time).total_seconds() * 1000
         
@@ -82,44 +120,66 @@ async def embed_message(
             vector_id=vector_id,
             slots=slots,
             created_at=message.created_at,
-            processing_time_ms=int(processing_time)
+            processing_time_ms=int(processing_time),
+            timings=current_timings() if timing else None
             # original_text は返さない（クライアント側に保存）
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"メッセージ作成に失敗しました: {str(e)}")
 
 @router.post("/render", response_model=RenderResponse)
 async def render_message(
     request: RenderRequest,
     current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    timing: bool = Query(False, description="段階別の処理時間（ms）を timings に含める"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """メッセージを受信者向けに再構成"""
+    """メッセージを受信者向けに再構成
+    
+    段階別の処理時間は Server-Timing ヘッダーで返す。
+    """
     try:
-        # 1. メッセージ取得
-        message = db.query(Message).filter(Message.id == request.message_id).first()
-        if not message:
-            raise HTTPException(status_code=404, detail="メッセージが見つかりません")
-        
-        # 2. 受信者情報取得
-        recipient = db.query(User).filter(User.id == request.recipient_id).first()
+        with span("db_read"):
+            # 1. メッセージ取得
+            message = await db.get(Message, request.message_id)
+            if not message:
+                raise HTTPException(status_code=404, detail="メッセージが見つかりません")
+            
+            # 2. 受信者情報取得
+            # ユーザーディレクトリ（メモリ）を優先し、未登録の場合のみDBを参照
+            recipient = user_directory.get(request.recipient_id)
+            if not recipient:
+                user = await db.get(User, request.recipient_id)
+                if user:
+                    recipient = {"language": user.language, "style_preset": user.style_preset}
         if not recipient:
             raise HTTPException(status_code=404, detail="受信者が見つかりません")
+        style_preset = recipient.get("style_preset", "biz_formal")
+        language = recipient.get("language", "ja")
         
-        # 3. ベクトル検索（実際の実装ではVectorServiceを使用）
-        neighbors = []  # 実装予定
+        # 3. 関連メッセージ検索（全文 + ベクトルのハイブリッド検索）
+        # 検索に失敗しても近傍なしで再構成を続ける
+        try:
+            with span("retrieval"):
+                neighbors = await search_service.find_neighbors(
+                    db, message, request.recipient_id, limit=get_settings().render_neighbors
+                )
+        except Exception as e:
+            print(f"近傍検索エラー: {e}")
+            neighbors = []
         
         # 4. LLM API再構成
         llm_service = LLMAPIService()
-        rendered_text, confidence = await llm_service.reconstruct_message(
-            summary=message.summary,
-            slots=json.loads(message.slots or "{}"),
-            style_preset=recipient.style_preset,
-            language=recipient.language,
-            neighbors=neighbors
-        )
+        with span("llm"):
+            rendered_text, confidence = await llm_service.reconstruct_message(
+                summary=message.summary,
+                slots=json.loads(message.slots or "{}"),
+                style_preset=style_preset,
+                language=language,
+                neighbors=neighbors
+            )
         
         # 5. 再構成されたテキストをクライアント側に返す
         response = RenderResponse(
@@ -127,28 +187,31 @@ async def render_message(
             confidence=confidence,
             used_neighbors=neighbors,
             slots=json.loads(message.slots or "{}"),
-            style_applied=recipient.style_preset
+            style_applied=style_preset
         )
         
         # 6. WebSocketでリアルタイム通知を送信
         try:
-            await websocket_manager.broadcast_new_message(
-                message_data={
-                    "message_id": message.id,
-                    "text": rendered_text,
-                    "summary": message.summary,
-                    "sender_id": message.sender_id,
-                    "recipient_id": request.recipient_id,
-                    "confidence": confidence,
-                    "created_at": message.created_at.isoformat()
-                },
-                sender_id=message.sender_id,
-                recipient_id=request.recipient_id
-            )
+            with span("notify"):
+                await websocket_manager.broadcast_new_message(
+                    message_data={
+                        "message_id": message.id,
+                        "text": rendered_text,
+                        "summary": message.summary,
+                        "sender_id": message.sender_id,
+                        "recipient_id": request.recipient_id,
+                        "confidence": confidence,
+                        "created_at": message.created_at.isoformat()
+                    },
+                    sender_id=message.sender_id,
+                    recipient_id=request.recipient_id
+                )
         except Exception as e:
             # WebSocket通知の失敗はログに記録するが、APIレスポンスは継続
             print(f"WebSocket通知エラー: {e}")
         
+        if timing:
+            response.timings = current_timings()
         return response
         
     except HTTPException:
@@ -156,43 +219,56 @@ async def render_message(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"メッセージ再構成に失敗しました: {str(e)}")
 
+async def _ensure_thread(db: AsyncSession, thread_id: Optional[str], created_by: str):
+    """スレッドが指定されているが未存在の場合は作成"""
+    if not thread_id:
+        return
+    existing_thread = await db.get(Thread, thread_id)
+    if not existing_thread:
+        new_thread = Thread(
+            id=thread_id,
+            created_by=created_by,
+            title="default"
+        )
+        db.add(new_thread)
+        await db.flush()  # INSERTを確定してFK整合性を満たす
+
 @router.post("/deliver", response_model=DeliverResponse)
 async def deliver_message(
     request: DeliverRequest,
     current_user: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """メッセージを指定ユーザーに配信"""
     try:
         # 0. メッセージの存在確認（送信者情報取得のため）
-        message = db.query(Message).filter(Message.id == request.message_id).first()
+        message = await db.get(Message, request.message_id)
         if not message:
             raise HTTPException(status_code=404, detail="メッセージが見つかりません")
 
-        # 1. スレッドが指定されているが未存在の場合は作成（MVP: 単一デフォルトスレッドを許容）
         thread_id = request.thread_id
-        if thread_id:
-            existing_thread = db.query(Thread).filter(Thread.id == thread_id).first()
-            if not existing_thread:
-                new_thread = Thread(
-                    id=thread_id,
-                    created_by=message.sender_id,
-                    title="default"
-                )
-                db.add(new_thread)
-                db.flush()  # INSERTを確定してFK整合性を満たす
 
-        # 2. 配信レコード作成
-        delivery = Inbox(
-            user_id=request.to_user_id,
-            message_id=request.message_id,
-            thread_id=thread_id,
-            status="unread"
-        )
+        async def save_delivery(session: AsyncSession):
+            # 1. スレッドが指定されているが未存在の場合は作成（MVP: 単一デフォルトスレッドを許容）
+            await _ensure_thread(session, thread_id, message.sender_id)
+
+            # 2. 配信レコード作成
+            delivery = Inbox(
+                user_id=request.to_user_id,
+                message_id=request.message_id,
+                thread_id=thread_id,
+                status="unread",
+                message_created_at=message.created_at
+            )
+            session.add(delivery)
+            await session.flush()
+            await session.refresh(delivery)
+            return delivery
         
-        db.add(delivery)
-        db.commit()
-        db.refresh(delivery)
+        async with unread_counter_service.in_flight([request.to_user_id]):
+            delivery = await run_write(db, save_delivery)
+            await unread_counter_service.increment([(delivery.user_id, thread_id)])
+        await thread_version_service.bump([thread_id])
         
         return DeliverResponse(
             status="queued",
@@ -202,23 +278,143 @@ async def deliver_message(
         )
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"メッセージ配信に失敗しました: {str(e)}")
+
+@router.post("/deliver/fanout", response_model=FanoutDeliverResponse)
+async def deliver_message_fanout(
+    request: FanoutDeliverRequest,
+    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """メッセージを複数ユーザーに一括配信"""
+    try:
+        # 0. メッセージとスレッドの確認は受信者数に関わらず1回のみ
+        message = await db.get(Message, request.message_id)
+        if not message:
+            raise HTTPException(status_code=404, detail="メッセージが見つかりません")
+        
+        thread_id = request.thread_id
+        
+        # 1. 配信レコードを1回の複数行INSERTで作成
+        created_at = datetime.now()
+        rows = [
+            {
+                "id": new_id(),
+                "user_id": user_id,
+                "message_id": request.message_id,
+                "thread_id": thread_id,
+                "status": "unread",
+                "message_created_at": message.created_at,
+                "created_at": created_at
+            }
+            for user_id in request.to_user_ids
+        ]
+        
+        async def save_deliveries(session: AsyncSession):
+            await _ensure_thread(session, thread_id, message.sender_id)
+            await session.execute(insert(Inbox), rows)
+        
+        async with unread_counter_service.in_flight(row["user_id"] for row in rows):
+            await run_write(db, save_deliveries)
+            await unread_counter_service.increment(
+                (row["user_id"], thread_id) for row in rows
+            )
+        await thread_version_service.bump([thread_id])
+        
+        deliveries = [
+            FanoutDelivery(user_id=row["user_id"], delivery_id=row["id"])
+            for row in rows
+        ]
+        
+        # 2. オンラインの受信者へまとめて通知
+        try:
+            await websocket_manager.notify_deliveries(
+                {
+                    "message_id": message.id,
+                    "thread_id": thread_id,
+                    "sender_id": message.sender_id,
+                    "created_at": created_at.isoformat()
+                },
+                {row["user_id"]: row["id"] for row in rows}
+            )
+        except Exception as e:
+            # WebSocket通知の失敗はログに記録するが、APIレスポンスは継続
+            print(f"WebSocket通知エラー: {e}")
+        
+        return FanoutDeliverResponse(
+            status="queued",
+            message_id=message.id,
+            thread_id=thread_id,
+            deliveries=deliveries,
+            created_at=created_at
+        )
+        
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"メッセージ配信に失敗しました: {str(e)}")
 
+async def _count_thread_messages(db: AsyncSession, thread_id: str, mode: str) -> int:
+    """スレッド内メッセージ数を取得（exact: COUNT(*) / estimated: プランナー推定値）"""
+    if mode == "estimated" and db.bind.dialect.name == "postgresql":
+        result = await db.execute(
+            text(
+                "EXPLAIN (FORMAT JSON) SELECT id FROM messages WHERE thread_id = :thread_id"
+                " UNION SELECT message_id FROM inbox WHERE thread_id = :thread_id"
+            ),
+            {"thread_id": thread_id}
+        )
+        plan = result.scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]["Plan"]["Plan Rows"])
+    
+    # SQLiteはインデックスのみで数えられるため推定値でも正確な件数を返す
+    result = await db.execute(count_thread_messages(thread_id))
+    return result.scalar_one()
+
+def _keyset_page(rows: list, limit: int, direction: str, cursor: Optional[str], message_of=lambda row: row):
+    """1件多く取得した行からページを切り出し、(行, 続きの有無, next_cursor, prev_cursor) を返す"""
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == DIRECTION_PREV:
+        rows.reverse()
+    
+    next_cursor = None
+    prev_cursor = None
+    if rows:
+        first, last = message_of(rows[0]), message_of(rows[-1])
+        # 前方向に進んだ場合は戻る側に必ずページがある
+        if has_more or direction == DIRECTION_PREV:
+            next_cursor = encode_cursor(last.created_at, last.id, DIRECTION_NEXT)
+        if (direction == DIRECTION_PREV and has_more) or (direction == DIRECTION_NEXT and cursor):
+            prev_cursor = encode_cursor(first.created_at, first.id, DIRECTION_PREV)
+    return rows, has_more, next_cursor, prev_cursor
+
 @router.get("/threads/{thread_id}/messages")
 async def get_thread_messages(
     thread_id: str,
     current_user: str = Depends(get_current_user),
-    limit: int = 20,
-    offset: int = 0,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    count: Optional[str] = Query(None, pattern="^(exact|estimated)$"),
+    db: AsyncSession = Depends(get_db)
 ):
-    """スレッドのメッセージ一覧を取得（SenseChat MVP対応）"""
+    """スレッドのメッセージ一覧を取得（SenseChat MVP対応）
+    
+    新しい順に (created_at, id) のキーセットでページングする。
+    next_cursor でより古いページ、prev_cursor でより新しいページを取得。
+    """
     try:
-        # メッセージとその再構成を取得
-        messages = db.query(Message).filter(
-            Message.thread_id == thread_id
-        ).offset(offset).limit(limit).all()
+        # 1件多く取得して続きの有無を判定
+        query, direction = thread_page_query(select(Message), thread_id, cursor, limit + 1)
+        result = await db.execute(query)
+        messages, has_more, next_cursor, prev_cursor = _keyset_page(
+            list(result.scalars().all()), limit, direction, cursor
+        )
         
         result_messages = []
         for msg in messages:
@@ -232,12 +428,120 @@ async def get_thread_messages(
                 "status": "read"  # 簡易版
             })
         
+        total_count = None
+        if count:
+            total_count = await _count_thread_messages(db, thread_id, count)
+        
         return {
             "thread_id": thread_id,
             "messages": result_messages,
-            "total_count": len(result_messages),
-            "has_more": len(result_messages) == limit
+            "total_count": total_count,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+            "prev_cursor": prev_cursor
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"メッセージ取得に失敗しました: {str(e)}")
+
+def _timeline_etag(thread_id: str, current_user: str, cursor: Optional[str], limit: int, version) -> str:
+    """ページ（ユーザー・カーソル・件数）とスレッドのバージョンから弱いETagを生成"""
+    page_key = hashlib.sha1(f"{thread_id}|{current_user}|{cursor or ''}|{limit}".encode("utf-8")).hexdigest()[:16]
+    return f'W/"{version}-{page_key}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    # 弱い比較（W/ の有無を無視）
+    return "*" in candidates or any(tag.removeprefix("W/") == etag.removeprefix("W/") for tag in candidates)
+
+@router.get("/threads/{thread_id}/timeline", response_model=TimelineResponse)
+async def get_thread_timeline(
+    thread_id: str,
+    response: Response,
+    current_user: str = Depends(get_current_user),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db)
+):
+    """スレッドを開くのに必要なデータ（メッセージ・自分のテキスト・受信箱の状態）を一括取得
+    
+    メッセージと受信箱の状態は1クエリ、自分宛てのコンテンツは selectinload の1クエリで
+    取得する（メッセージ数に依存しない）。並び順とカーソルは /threads/{id}/messages と同じ。
+    スレッドに作成されたメッセージに加え、スレッドへ配信されたメッセージも含める。
+    スレッドのバージョンが変わっていなければ If-None-Match に対してDBを参照せず304を返す。
+    """
+    try:
+        version = await thread_version_service.get(thread_id)
+        if version is not None:
+            etag = _timeline_etag(thread_id, current_user, cursor, limit, version)
+            if _etag_matches(if_none_match, etag):
+                record_cache("timeline_etag", True)
+                return Response(status_code=304, headers={"ETag": etag})
+        record_cache("timeline_etag", False)
+        
+        # 自分の受信箱の状態（同じメッセージが複数回配信されていれば最新）
+        inbox_status = (
+            select(Inbox.status)
+            .where(Inbox.message_id == Message.id, Inbox.user_id == current_user)
+            .order_by(Inbox.created_at.desc())
+            .limit(1)
+            .correlate(Message)
+            .scalar_subquery()
+        )
+        # 1件多く取得して続きの有無を判定
+        query, direction = thread_page_query(
+            select(Message, inbox_status.label("inbox_status"))
+            .options(selectinload(Message.contents.and_(MessageContent.user_id == current_user))),
+            thread_id, cursor, limit + 1
+        )
+        result = await db.execute(query)
+        rows, has_more, next_cursor, prev_cursor = _keyset_page(
+            list(result.all()), limit, direction, cursor, message_of=lambda row: row[0]
+        )
+        
+        timeline = TimelineResponse(
+            thread_id=thread_id,
+            messages=[
+                TimelineMessage(
+                    id=message.id,
+                    sender_id=message.sender_id,
+                    summary=message.summary,
+                    slots=json.loads(message.slots or "{}"),
+                    status=status,
+                    contents=[
+                        TimelineContent(
+                            content_type=content.content_type,
+                            text=content.text,
+                            updated_at=content.updated_at
+                        )
+                        for content in sorted(message.contents, key=lambda c: (c.content_type, c.id))
+                    ],
+                    created_at=message.created_at,
+                    expires_at=message.expires_at
+                )
+                for message, status in rows
+            ],
+            has_more=has_more,
+            next_cursor=next_cursor,
+            prev_cursor=prev_cursor
+        )
+        
+        if version is None:
+            # バージョンを取得できない場合は内容のハッシュで判定（DB参照は省けない）
+            digest = hashlib.sha1(timeline.json().encode("utf-8")).hexdigest()[:16]
+            etag = _timeline_etag(thread_id, current_user, cursor, limit, f"c{digest}")
+            if _etag_matches(if_none_match, etag):
+                return Response(status_code=304, headers={"ETag": etag})
+        
+        response.headers["ETag"] = etag
+        return timeline
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"タイムライン取得に失敗しました: {str(e)}")
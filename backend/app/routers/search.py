@@ -0,0 +1,74 @@
+"""
+検索エンドポイント
+メッセージ要約の全文検索・ハイブリッド検索（全文 + ベクトル）
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.schemas import SearchResponse, SearchResult
+from app.database import get_db
+from app.routers.messages import get_current_user
+from app.services.search_service import search_service
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+import json
+
+router = APIRouter()
+
+@router.get("/search", response_model=SearchResponse)
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=200),
+    thread_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    mode: str = Query("lexical", pattern="^(lexical|hybrid)$"),
+    intent: Optional[str] = None,
+    urgency: Optional[str] = None,
+    sentiment: Optional[str] = None,
+    current_user: str = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """参加しているスレッドのメッセージ要約を検索（関連度順）
+    
+    mode=hybrid では全文検索とベクトル検索の順位を RRF で統合する。
+    intent / urgency / sentiment で抽出済みスロットによる絞り込みができる。
+    """
+    try:
+        slots = {
+            key: value
+            for key, value in (("intent", intent), ("urgency", urgency), ("sentiment", sentiment))
+            if value
+        }
+        
+        if mode == "hybrid":
+            hits, has_more = await search_service.hybrid_search(
+                db, current_user, q, limit=limit, offset=offset, thread_id=thread_id, slots=slots
+            )
+        else:
+            rows, has_more = await search_service.search_messages(
+                db, current_user, q, limit=limit, offset=offset, thread_id=thread_id, slots=slots
+            )
+            hits = [(message, score, {"lexical": offset + rank}) for rank, (message, score) in enumerate(rows, start=1)]
+
+        results = [
+            SearchResult(
+                message_id=message.id,
+                thread_id=message.thread_id,
+                sender_id=message.sender_id,
+                summary=message.summary,
+                slots=json.loads(message.slots or "{}"),
+                score=score,
+                ranks=ranks,
+                created_at=message.created_at
+            )
+            for message, score, ranks in hits
+        ]
+
+        return SearchResponse(
+            query=q,
+            results=results,
+            has_more=has_more,
+            next_offset=offset + len(results) if has_more else None
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"検索に失敗しました: {str(e)}")
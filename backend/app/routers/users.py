@@ -6,21 +6,23 @@ from fastapi import APIRouter, Depends, HTTPException
 from app.schemas import UserResponse
 from app.database import get_db
 from app.models import User
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 router = APIRouter()
 
 @router.get("/", response_model=List[UserResponse])
-async def get_all_users(db: Session = Depends(get_db)):
+async def get_all_users(db: AsyncSession = Depends(get_db)):
     """全ユーザー一覧を取得"""
-    users = db.query(User).all()
+    result = await db.execute(select(User))
+    users = result.scalars().all()
     return users
 
 @router.get("/{user_id}", response_model=UserResponse)
-async def get_user(user_id: str, db: Session = Depends(get_db)):
+async def get_user(user_id: str, db: AsyncSession = Depends(get_db)):
     """特定ユーザーの情報を取得"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="ユーザーが見つかりません")
     return user
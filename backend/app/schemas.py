@@ -43,6 +43,7 @@ class MessageResponse(BaseModel):
     slots: Dict[str, Any]
     created_at: datetime
     processing_time_ms: int
+    timings: Optional[Dict[str, float]] = None  # ?timing=true の場合の段階別の処理時間（ms）
 
 # スレッド関連スキーマ
 class ThreadCreate(BaseModel):
@@ -69,6 +70,26 @@ class InboxResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class InboxSummaryResponse(BaseModel):
+    user_id: str
+    total_unread: int
+    threads: Dict[str, int]
+
+class MarkReadRequest(BaseModel):
+    inbox_ids: Optional[List[str]] = Field(None, max_items=500)
+    message_ids: Optional[List[str]] = Field(None, max_items=500)
+    thread_id: Optional[str] = None
+    
+    @validator('thread_id', always=True)
+    def require_target(cls, v, values):
+        if not v and not values.get('inbox_ids') and not values.get('message_ids'):
+            raise ValueError('inbox_ids, message_ids, thread_id のいずれかが必要です')
+        return v
+
+class MarkReadResponse(BaseModel):
+    updated: int
+    total_unread: int
+
 # レンダリング関連スキーマ
 class RenderRequest(BaseModel):
     message_id: str
@@ -80,6 +101,7 @@ class RenderResponse(BaseModel):
     used_neighbors: List[Dict[str, Any]]
     slots: Dict[str, Any]
     style_applied: str
+    timings: Optional[Dict[str, float]] = None  # ?timing=true の場合の段階別の処理時間（ms）
 
 # 配信関連スキーマ
 class DeliverRequest(BaseModel):
@@ -93,6 +115,67 @@ class DeliverResponse(BaseModel):
     estimated_delivery: datetime
     created_at: datetime
 
+class FanoutDeliverRequest(BaseModel):
+    to_user_ids: List[str] = Field(..., min_items=1, max_items=100)
+    message_id: str
+    thread_id: str
+    
+    @validator('to_user_ids')
+    def unique_user_ids(cls, v):
+        # 重複を除去（順序は維持）
+        return list(dict.fromkeys(v))
+
+class FanoutDelivery(BaseModel):
+    user_id: str
+    delivery_id: str
+
+class FanoutDeliverResponse(BaseModel):
+    status: str
+    message_id: str
+    thread_id: str
+    deliveries: List[FanoutDelivery]
+    created_at: datetime
+
+# タイムライン関連スキーマ
+class TimelineContent(BaseModel):
+    content_type: str  # "original" または "rendered"
+    text: str
+    updated_at: Optional[datetime]
+
+class TimelineMessage(BaseModel):
+    id: str
+    sender_id: str
+    summary: str
+    slots: Dict[str, Any]
+    status: Optional[str]  # 自分の受信箱の状態（自分宛てでなければ None）
+    contents: List[TimelineContent]  # 自分が保存したテキスト
+    created_at: datetime
+    expires_at: datetime
+
+class TimelineResponse(BaseModel):
+    thread_id: str
+    messages: List[TimelineMessage]
+    has_more: bool
+    next_cursor: Optional[str]
+    prev_cursor: Optional[str]
+
+# 検索関連スキーマ
+class SearchResult(BaseModel):
+    message_id: str
+    thread_id: Optional[str]
+    sender_id: str
+    summary: str
+    slots: Dict[str, Any]
+    score: float
+    ranks: Dict[str, int]  # 検索方式ごとの順位（lexical / vector）
+    created_at: datetime
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+    has_more: bool
+    next_offset: Optional[int]
+
 # エラーレスポンススキーマ
 class ErrorResponse(BaseModel):
     error: Dict[str, Any]
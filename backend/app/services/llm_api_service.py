@@ -119,7 +119,8 @@ class OpenRouterClient:
     def __init__(self, model: str):
         self.model = model
         self.api_key = os.getenv("OPENROUTER_API_KEY")
-        self.base_url = "https://openrouter.ai/api/v1"
+        # 負荷試験ではローカルのスタブ（scripts/stub_llm.py）に向ける
+        self.base_url = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
         
     async def generate(self, prompt: str, max_tokens: int = 200, temperature: float = 0.7) -> Dict[str, Any]:
         """OpenRouter API でテキスト生成"""
@@ -160,7 +161,8 @@ class OpenAIClient:
     
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
-        self.base_url = "https://api.openai.com/v1"
+        # 負荷試験ではローカルのスタブ（scripts/stub_llm.py）に向ける
+        self.base_url = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
         
     async def generate(self, prompt: str, max_tokens: int = 200, temperature: float = 0.7) -> Dict[str, Any]:
         """OpenAI GPT-4 API でテキスト生成"""
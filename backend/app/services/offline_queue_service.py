@@ -0,0 +1,159 @@
+"""
+オフライン配信キュー
+オフラインのユーザー宛てのリアルタイムイベントをユーザーごとのRedis Streamに保持し、
+再接続時にまとめて再送する（クライアントの ack で削除）。
+Redisが利用できない場合は受信箱の未読行から配信通知を再構成する。
+"""
+
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.models import Inbox, Message
+
+logger = logging.getLogger(__name__)
+
+# Redisキー: offline:{user_id} -> Stream(event, data)
+KEY_PREFIX = "offline:"
+# 受信箱から再構成したイベントのIDの接頭辞（inbox:{受信箱ID}、Streamからは削除しない）
+INBOX_EVENT_PREFIX = "inbox:"
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_SECONDS = 30
+
+# (イベントID, イベント名, データ)
+QueuedEvent = Tuple[str, str, Dict[str, Any]]
+
+
+def _next_id(event_id: str) -> str:
+    """Stream ID の直後のID（XTRIM MINID で event_id 自身まで削除するため）"""
+    ms, seq = event_id.split("-")
+    return f"{ms}-{int(seq) + 1}"
+
+
+class OfflineQueueService:
+    """ユーザーごとの未配信イベントキュー"""
+
+    def __init__(self, redis_client=None, ttl_seconds: Optional[int] = None, max_len: Optional[int] = None):
+        settings = get_settings()
+        if redis_client is None:
+            redis_client = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=settings.redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+            )
+        self.r = redis_client
+        # メッセージの有効期限（24時間）を超えて保持しない
+        self.ttl_seconds = ttl_seconds or settings.offline_queue_ttl_seconds
+        # 1ユーザーあたりの上限（古いものから破棄）
+        self.max_len = max_len or settings.offline_queue_max_len
+        self._redis_down_until = 0.0
+
+    def _redis_usable(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, e: Exception):
+        logger.warning(f"オフライン配信キュー: Redis利用不可のため受信箱から再送します: {e}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def enqueue(self, user_id: str, event: str, data: Dict[str, Any]) -> Optional[str]:
+        """未配信イベントを追加し、イベントIDを返す（Redis利用不可の場合は None）"""
+        event_ids = await self.enqueue_many([(user_id, event, data)])
+        return event_ids[0] if event_ids else None
+
+    async def enqueue_many(self, events: List[Tuple[str, str, Dict[str, Any]]]) -> Optional[List[str]]:
+        """(user_id, イベント名, データ) をまとめて追加（一斉配信用、Redisへの往復は1回）"""
+        if not events:
+            return []
+        if not self._redis_usable():
+            return None
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for user_id, event, data in events:
+                    key = f"{KEY_PREFIX}{user_id}"
+                    pipe.xadd(
+                        key,
+                        {"event": event, "data": json.dumps(data, ensure_ascii=False, default=str)},
+                        maxlen=self.max_len,
+                        approximate=True,
+                    )
+                    pipe.expire(key, self.ttl_seconds)
+                results = await pipe.execute()
+            return results[::2]
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+
+    async def pending(self, user_id: str, limit: int) -> Optional[List[QueuedEvent]]:
+        """未確認のイベントを古い順に返す（Redis利用不可の場合は None）"""
+        if not self._redis_usable():
+            return None
+        try:
+            entries = await self.r.xrange(f"{KEY_PREFIX}{user_id}", count=limit)
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+        return [(event_id, fields["event"], json.loads(fields["data"])) for event_id, fields in entries]
+
+    async def ack(self, user_id: str, last_event_id: str) -> bool:
+        """last_event_id までのイベントを削除"""
+        if not self._redis_usable():
+            return False
+        try:
+            min_id = _next_id(last_event_id)
+        except ValueError:
+            return False
+        try:
+            await self.r.xtrim(f"{KEY_PREFIX}{user_id}", minid=min_id, approximate=False)
+            return True
+        except Exception as e:
+            self._mark_redis_down(e)
+            return False
+
+    async def pending_from_inbox(
+        self, db: AsyncSession, user_id: str, limit: int, after: Optional[str] = None
+    ) -> List[QueuedEvent]:
+        """受信箱の未読行から配信通知（new_delivery）を再構成する（Redis利用不可時）
+
+        after はクライアントが最後に ack した受信箱ID（inbox: を除いた部分）。
+        その行より後の未読行のみを返し、再接続のたびに同じ配信を再送しない。
+        """
+        query = (
+            select(Inbox, Message.sender_id)
+            .join(Message, Message.id == Inbox.message_id)
+            .where(Inbox.user_id == user_id, Inbox.status == "unread")
+        )
+        if after:
+            cursor_created_at = (
+                select(Inbox.created_at)
+                .where(Inbox.id == after, Inbox.user_id == user_id)
+                .scalar_subquery()
+            )
+            # カーソルの行が見つからない場合は先頭から（比較が NULL になり何も返さないのを避ける）
+            query = query.where(or_(
+                cursor_created_at.is_(None),
+                Inbox.created_at > cursor_created_at,
+                and_(Inbox.created_at == cursor_created_at, Inbox.id > after),
+            ))
+        result = await db.execute(query.order_by(Inbox.created_at, Inbox.id).limit(limit))
+        return [
+            (f"{INBOX_EVENT_PREFIX}{delivery.id}", "new_delivery", {
+                "message_id": delivery.message_id,
+                "thread_id": delivery.thread_id,
+                "sender_id": sender_id,
+                "created_at": delivery.created_at.isoformat() if delivery.created_at else None,
+                "delivery_id": delivery.id,
+            })
+            for delivery, sender_id in result
+        ]
+
+
+# グローバルインスタンス
+offline_queue_service = OfflineQueueService()
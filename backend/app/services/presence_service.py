@@ -0,0 +1,188 @@
+"""
+プレゼンスサービス
+全ワーカー・全ノードで共有するオンライン状態をRedisに保持する
+各ワーカーは自分の接続を定期的に更新し、異常終了したワーカーの接続は期限切れで消える
+"""
+
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import redis.asyncio as redis
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Redisキー:
+#   presence:user:{user_id} -> ZSET(sid, 有効期限)  ユーザーの接続
+#   presence:online         -> ZSET(user_id, 有効期限)  オンラインのユーザー
+#   presence:version:{room} -> プレゼンスルームの差分バージョン
+USER_KEY_PREFIX = "presence:user:"
+ONLINE_KEY = "presence:online"
+VERSION_KEY_PREFIX = "presence:version:"
+# 接続の有効期限（ワーカーは PRESENCE_TTL_SECONDS / 3 ごとに更新する）
+PRESENCE_TTL_SECONDS = 60
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_SECONDS = 30
+
+# 接続を登録し、有効な接続数を返す（1 ならオフラインからオンラインになった）
+CONNECT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[3])
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('ZADD', KEYS[2], ARGV[2], ARGV[5])
+return redis.call('ZCARD', KEYS[1])
+"""
+
+# 接続を削除し、残りの有効な接続数を返す（0 ならオフラインになった）
+DISCONNECT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+local live = redis.call('ZCARD', KEYS[1])
+if live == 0 then
+  redis.call('DEL', KEYS[1])
+  redis.call('ZREM', KEYS[2], ARGV[3])
+end
+return live
+"""
+
+
+def _user_key(user_id: str) -> str:
+    return f"{USER_KEY_PREFIX}{user_id}"
+
+
+class PresenceService:
+    """Redis上の共有プレゼンスレジストリ
+
+    Redisが利用できない場合は各メソッドが None を返し、
+    呼び出し側はワーカー内の接続情報にフォールバックする。
+    """
+
+    def __init__(self, redis_client=None, ttl_seconds: int = PRESENCE_TTL_SECONDS):
+        if redis_client is None:
+            settings = get_settings()
+            redis_client = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=settings.redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+            )
+        self.r = redis_client
+        self.ttl_seconds = ttl_seconds
+        self._connect = self.r.register_script(CONNECT)
+        self._disconnect = self.r.register_script(DISCONNECT)
+        self._redis_down_until = 0.0
+
+    def _redis_usable(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, e: Exception):
+        logger.warning(f"プレゼンス: Redis利用不可のためワーカー内の接続情報を使用します: {e}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def connect(self, user_id: str, sid: str) -> Optional[bool]:
+        """接続を登録し、ユーザーがオンラインになった（最初の接続）かどうかを返す"""
+        if not self._redis_usable():
+            return None
+        now = time.time()
+        try:
+            live = await self._connect(
+                keys=[_user_key(user_id), ONLINE_KEY],
+                args=[sid, now + self.ttl_seconds, now, self.ttl_seconds, user_id],
+            )
+            return live == 1
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+
+    async def disconnect(self, user_id: str, sid: str) -> Optional[bool]:
+        """接続を削除し、ユーザーがオフラインになった（最後の接続）かどうかを返す"""
+        if not self._redis_usable():
+            return None
+        try:
+            live = await self._disconnect(
+                keys=[_user_key(user_id), ONLINE_KEY],
+                args=[sid, time.time(), user_id],
+            )
+            return live == 0
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+
+    async def refresh(self, sessions: Dict[str, str]):
+        """このワーカーの接続（sid -> user_id）の有効期限を延長し、期限切れのユーザーを削除"""
+        if not self._redis_usable():
+            return
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for sid, user_id in sessions.items():
+                    pipe.zadd(_user_key(user_id), {sid: expires_at})
+                    pipe.expire(_user_key(user_id), self.ttl_seconds)
+                    pipe.zadd(ONLINE_KEY, {user_id: expires_at})
+                # 異常終了したワーカーに接続していたユーザー
+                pipe.zremrangebyscore(ONLINE_KEY, "-inf", now)
+                await pipe.execute()
+        except Exception as e:
+            self._mark_redis_down(e)
+
+    async def online(self, user_ids: Iterable[str]) -> Optional[Set[str]]:
+        """指定ユーザーのうちオンラインのユーザーを返す"""
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return set()
+        if not self._redis_usable():
+            return None
+        try:
+            scores = await self.r.zmscore(ONLINE_KEY, user_ids)
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+        now = time.time()
+        return {user_id for user_id, score in zip(user_ids, scores) if score is not None and score > now}
+
+    async def online_users(self) -> Optional[List[str]]:
+        """オンラインの全ユーザーを返す"""
+        if not self._redis_usable():
+            return None
+        try:
+            return await self.r.zrangebyscore(ONLINE_KEY, time.time(), "+inf")
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+
+    async def bump_versions(self, rooms: Iterable[str]) -> Optional[Dict[str, int]]:
+        """ルームの差分バージョンを進める（全ワーカーで通し番号）"""
+        rooms = list(rooms)
+        if not self._redis_usable():
+            return None
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for room in rooms:
+                    pipe.incr(f"{VERSION_KEY_PREFIX}{room}")
+                versions = await pipe.execute()
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+        return dict(zip(rooms, versions))
+
+    async def get_versions(self, rooms: Iterable[str]) -> Optional[Dict[str, int]]:
+        """ルームの現在の差分バージョン（スナップショット用）"""
+        rooms = list(rooms)
+        if not rooms:
+            return {}
+        if not self._redis_usable():
+            return None
+        try:
+            versions = await self.r.mget([f"{VERSION_KEY_PREFIX}{room}" for room in rooms])
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+        return {room: int(version or 0) for room, version in zip(rooms, versions)}
+
+
+# グローバルインスタンス
+presence_service = PresenceService()
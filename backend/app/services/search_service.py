@@ -0,0 +1,259 @@
+"""
+メッセージ検索サービス
+messages.search_text（バイグラム）に対する全文検索と、VectorService による
+ベクトル検索を、呼び出しユーザーが参加しているスレッド・メッセージに限定して
+ランキング順に返す。ハイブリッド検索は両者を Reciprocal Rank Fusion で統合する
+"""
+
+import asyncio
+import json
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from sqlalchemy import JSON, cast, func, literal_column, or_, select, text, union
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.sql import column, table
+
+from app.config import get_settings
+from app.fts import PG_TS_CONFIG, SQLITE_FTS_TABLE, pg_tsquery_expression, sqlite_match_expression
+from app.models import Inbox, Message, Thread
+from app.services.vector_service import vector_service
+from app.thread_scope import in_thread, in_threads
+
+_messages_fts = table(SQLITE_FTS_TABLE, column("rowid"))
+
+# スロットで絞り込めるキー（EmbeddingService.extract_slots の出力）
+SLOT_FILTER_KEYS = ("intent", "urgency", "sentiment")
+
+# (メッセージ, 統合スコア, {"lexical": 順位, "vector": 順位})
+HybridHit = Tuple[Message, float, Dict[str, int]]
+
+
+def accessible_messages_filter(user_id: str):
+    """ユーザーが閲覧できるメッセージの条件（送信者・配信先・参加スレッド）
+
+    参加スレッドのメッセージには、スレッドへ配信された（受信箱にのみスレッドIDを持つ）メッセージも含む。
+    """
+    user_threads = union(
+        select(Inbox.thread_id).where(Inbox.user_id == user_id, Inbox.thread_id.isnot(None)),
+        select(Thread.id).where(Thread.created_by == user_id),
+    )
+    return or_(
+        Message.sender_id == user_id,
+        Message.id.in_(select(Inbox.message_id).where(Inbox.user_id == user_id)),
+        in_threads(user_threads),
+    )
+
+
+def slot_filter(dialect: str, key: str, value: str):
+    """slots（JSON文字列）の指定キーが値と一致する条件"""
+    if key not in SLOT_FILTER_KEYS:
+        raise ValueError(f"絞り込みに未対応のスロットです: {key}")
+    if dialect == "postgresql":
+        return cast(Message.slots, JSONB)[key].astext == value
+    if dialect == "sqlite":
+        return func.json_extract(Message.slots, f"$.{key}") == value
+    return cast(Message.slots, JSON)[key].as_string() == value
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """複数のランキング（IDのリスト）を RRF で統合し、(ID, スコア) を降順で返す"""
+    scores: Dict[str, float] = {}
+    for ranked_ids in rankings.values():
+        for rank, item_id in enumerate(ranked_ids, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class SearchService:
+    """全文検索（PostgreSQL: tsvector + GIN / SQLite: FTS5）とハイブリッド検索"""
+
+    def __init__(self, vectors=None, embedding_service=None):
+        self.vectors = vectors or vector_service
+        self._embedding_service = embedding_service
+
+    @property
+    def embedding_service(self):
+        # モデル読み込みが重いため初回利用時に作成して使い回す
+        if self._embedding_service is None:
+            from app.services.embedding_service import EmbeddingService
+            self._embedding_service = EmbeddingService()
+        return self._embedding_service
+
+    def _lexical_query(self, dialect: str, query: str):
+        """(検索条件付きのSELECT, 並び順) を返す。トークンがなければ None"""
+        if dialect == "postgresql":
+            expression = pg_tsquery_expression(query)
+            if not expression:
+                return None
+            vector = func.to_tsvector(literal_column(PG_TS_CONFIG), Message.search_text)
+            tsquery = func.to_tsquery(literal_column(PG_TS_CONFIG), expression)
+            score = func.ts_rank_cd(vector, tsquery)
+            stmt = select(Message, score.label("score")).where(vector.op("@@")(tsquery))
+            return stmt, score.desc()
+
+        if dialect == "sqlite":
+            expression = sqlite_match_expression(query)
+            if not expression:
+                return None
+            # bm25 は小さいほど関連度が高い
+            bm25 = func.bm25(literal_column(SQLITE_FTS_TABLE))
+            stmt = (
+                select(Message, (-bm25).label("score"))
+                .select_from(_messages_fts)
+                .join(Message, literal_column("messages.rowid") == _messages_fts.c.rowid)
+                .where(text(f"{SQLITE_FTS_TABLE} MATCH :match").bindparams(match=expression))
+            )
+            return stmt, bm25.asc()
+
+        raise ValueError(f"全文検索に未対応のデータベースです: {dialect}")
+
+    def _scope(self, stmt, dialect: str, user_id: str, thread_id: Optional[str],
+               slots: Optional[Dict[str, str]], exclude_ids: Iterable[str] = (),
+               shared_with: Optional[str] = None):
+        """閲覧範囲・スレッド・スロット・除外IDの条件を付与"""
+        stmt = stmt.where(accessible_messages_filter(user_id))
+        if shared_with:
+            # 両方のユーザーが閲覧できるメッセージのみ
+            stmt = stmt.where(accessible_messages_filter(shared_with))
+        if thread_id:
+            stmt = stmt.where(in_thread(thread_id))
+        for key, value in (slots or {}).items():
+            stmt = stmt.where(slot_filter(dialect, key, value))
+        exclude_ids = list(exclude_ids)
+        if exclude_ids:
+            stmt = stmt.where(Message.id.notin_(exclude_ids))
+        return stmt
+
+    async def search_messages(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        thread_id: Optional[str] = None,
+        slots: Optional[Dict[str, str]] = None,
+        exclude_ids: Iterable[str] = (),
+        shared_with: Optional[str] = None,
+    ) -> Tuple[List[Tuple[Message, float]], bool]:
+        """全文検索して ([(メッセージ, スコア)], 続きの有無) を関連度順に返す
+        
+        shared_with を指定すると、そのユーザーも閲覧できるメッセージに限定する。
+        """
+        dialect = db.bind.dialect.name
+        lexical = self._lexical_query(dialect, query)
+        if lexical is None:
+            return [], False
+        stmt, order = lexical
+        stmt = self._scope(stmt, dialect, user_id, thread_id, slots, exclude_ids, shared_with)
+
+        # 1件多く取得して続きの有無を判定
+        stmt = stmt.order_by(order, Message.created_at.desc(), Message.id.desc())
+        result = await db.execute(stmt.limit(limit + 1).offset(offset))
+        rows = [(message, float(score)) for message, score in result.all()]
+        return rows[:limit], len(rows) > limit
+
+    async def hybrid_search(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        thread_id: Optional[str] = None,
+        slots: Optional[Dict[str, str]] = None,
+        exclude_ids: Iterable[str] = (),
+        shared_with: Optional[str] = None,
+        query_vector: Optional[np.ndarray] = None,
+    ) -> Tuple[List[HybridHit], bool]:
+        """全文検索とベクトル検索を並行実行し、RRF で統合した結果を返す
+
+        全文検索は日付・時刻・固有名詞などの完全一致に、ベクトル検索は
+        言い換えに強い。両方の上位候補を取り、閲覧範囲とスロット条件で
+        絞り込んでから順位を統合する。query_vector を渡すとクエリの埋め込みを省略する。
+        """
+        settings = get_settings()
+        dialect = db.bind.dialect.name
+        exclude_ids = list(exclude_ids)
+        candidates = max(settings.search_candidates, (offset + limit) * 2)
+
+        async def vector_leg() -> List[str]:
+            vector = query_vector
+            if vector is None:
+                _, vector = await self.embedding_service.create_embedding(query)
+            # ANN は閲覧範囲を知らないため、絞り込みで減る分を見込んで多めに取得
+            hits = await asyncio.to_thread(self.vectors.search, vector, candidates * 4)
+            return [vector_id for vector_id, _ in hits]
+
+        # 全文検索（DB）とベクトル検索（スレッド）を並行実行
+        lexical, vector_ids = await asyncio.gather(
+            self.search_messages(
+                db, user_id, query, limit=candidates, thread_id=thread_id,
+                slots=slots, exclude_ids=exclude_ids, shared_with=shared_with
+            ),
+            vector_leg(),
+        )
+        lexical_rows, _ = lexical
+
+        # ベクトル候補を閲覧範囲・スロット条件で絞り込み、ANN の順位を保つ
+        vector_rows: List[Message] = []
+        if vector_ids:
+            stmt = self._scope(
+                select(Message).where(Message.vector_id.in_(vector_ids)),
+                dialect, user_id, thread_id, slots, exclude_ids, shared_with
+            )
+            by_vector_id = {m.vector_id: m for m in (await db.execute(stmt)).scalars()}
+            vector_rows = [by_vector_id[v] for v in vector_ids if v in by_vector_id][:candidates]
+
+        messages = {m.id: m for m, _ in lexical_rows}
+        messages.update((m.id, m) for m in vector_rows)
+        rankings = {
+            "lexical": [m.id for m, _ in lexical_rows],
+            "vector": [m.id for m in vector_rows],
+        }
+        ranks = {
+            name: {message_id: rank for rank, message_id in enumerate(ids, start=1)}
+            for name, ids in rankings.items()
+        }
+
+        fused = reciprocal_rank_fusion(rankings, k=settings.search_rrf_k)
+        page = fused[offset:offset + limit]
+        hits = [
+            (
+                messages[message_id],
+                score,
+                {name: r[message_id] for name, r in ranks.items() if message_id in r},
+            )
+            for message_id, score in page
+        ]
+        return hits, len(fused) > offset + limit
+
+    async def find_neighbors(self, db: AsyncSession, message: Message, recipient_id: str,
+                             limit: int = 3) -> List[Dict[str, object]]:
+        """再構成時にLLMへ渡す関連メッセージ（要約とスロット）を取得
+        
+        近傍は受信者のプロンプトと used_neighbors に含まれるため、送信者と受信者の
+        両方が閲覧できるメッセージに限定する。ベクトルは保存済みのものを使い、
+        このワーカーのインデックスにない場合のみ要約を埋め込み直す。
+        """
+        stored = self.vectors.get([message.vector_id]) if message.vector_id else {}
+        hits, _ = await self.hybrid_search(
+            db, message.sender_id, message.summary, limit=limit, exclude_ids=[message.id],
+            shared_with=recipient_id, query_vector=stored.get(message.vector_id)
+        )
+        return [
+            {
+                "message_id": hit.id,
+                "summary": hit.summary,
+                "slots": json.loads(hit.slots or "{}"),
+                "score": round(score, 4),
+            }
+            for hit, score, _ in hits
+        ]
+
+
+# グローバルインスタンス
+search_service = SearchService()
@@ -0,0 +1,253 @@
+"""
+スレッドバージョンサービス
+スレッド内容（メッセージ・受信箱の状態）が変わるたびにRedisのバージョン番号を進め、
+タイムラインのETagをDBに問い合わせずに判定できるようにする
+
+Redis障害中に進められなかったスレッドは記録しておき、復旧後の最初のRedis操作で
+まとめて進める。その間に他のワーカーが古いバージョンで304を返さないよう、
+各ワーカーはRedis上のリース（thread_version_leases）を定期的に更新し、
+期限切れのリースが1つでもある間は全ワーカーが get() で None を返す（内容のハッシュでETagを判定）。
+リースは未反映の変更を書き戻してからでないと更新しない。
+
+障害を検知してからリースが切れるまでの最大 LEASE_SECONDS 秒は、他のワーカーが古いバージョンを
+返し得る。停止したまま戻らないワーカーのリースは LEASE_FORGET_SECONDS 後に削除し、
+同時にバージョンの下限（thread_version_floor）を上げて全スレッドのバージョンを無効にする。
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from typing import Dict, Iterable, Optional, Set
+
+import redis.asyncio as redis
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Redisキー: thread_version:{thread_id} -> バージョン番号
+KEY_PREFIX = "thread_version:"
+# 更新のないスレッドのバージョンは一定期間で破棄（次回参照時に現在時刻で再作成）
+VERSION_TTL_SECONDS = 7 * 24 * 3600
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_SECONDS = 30
+# 障害中に記録するスレッド数の上限（超えた場合は復旧時に全スレッドのバージョンを破棄）
+MAX_PENDING_BUMPS = 10000
+# これ以下のバージョンは無効（全スレッドのバージョンを一括で破棄する場合に上げる）
+FLOOR_KEY = "thread_version_floor"
+# ワーカーごとのリース: origin -> 有効期限[ms]
+LEASES_KEY = "thread_version_leases"
+LEASE_SECONDS = 6
+LEASE_REFRESH_SECONDS = 2
+# 期限切れのまま更新されないリース（異常終了したワーカー）を削除するまでの秒数
+LEASE_FORGET_SECONDS = 600
+
+# バージョンを進める（現在時刻[ms]未満なら現在時刻まで進める）
+# キーが消えた後に再作成されても過去のバージョン番号と重複しない
+BUMP = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local now = tonumber(ARGV[1])
+local version = current + 1
+if version < now then version = now end
+redis.call('SET', KEYS[1], version, 'EX', ARGV[2])
+return version
+"""
+
+# バージョンの下限を上げる（下がることはない）
+RAISE_FLOOR = """
+local floor = tonumber(redis.call('GET', KEYS[1]) or '0')
+if floor < tonumber(ARGV[1]) then redis.call('SET', KEYS[1], ARGV[1]) end
+return 1
+"""
+
+# 期限切れのまま放置されたリースを削除し、削除した場合は下限を上げる
+# ARGV: 削除する期限の閾値[ms], 現在時刻[ms], origin...
+FORGET_LEASES = """
+local forgotten = 0
+for i = 3, #ARGV do
+  local expires = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or '-1')
+  if expires >= 0 and expires < tonumber(ARGV[1]) then
+    redis.call('HDEL', KEYS[1], ARGV[i])
+    forgotten = forgotten + 1
+  end
+end
+if forgotten > 0 then
+  local floor = tonumber(redis.call('GET', KEYS[2]) or '0')
+  if floor < tonumber(ARGV[2]) then redis.call('SET', KEYS[2], ARGV[2]) end
+end
+return forgotten
+"""
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class ThreadVersionService:
+    """スレッド単位の変更バージョン（ETag判定用）"""
+
+    def __init__(self, redis_client=None):
+        if redis_client is None:
+            settings = get_settings()
+            redis_client = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=settings.redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+            )
+        self.r = redis_client
+        self._bump = self.r.register_script(BUMP)
+        self._raise_floor = self.r.register_script(RAISE_FLOOR)
+        self._forget_leases = self.r.register_script(FORGET_LEASES)
+        self._redis_down_until = 0.0
+        # Redis障害中に進められなかったスレッド
+        self._pending: Set[str] = set()
+        self._pending_overflow = False
+        # リースの識別子（プロセスごと）
+        self.origin = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+
+    def _redis_usable(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, e: Exception):
+        logger.warning(f"スレッドバージョン: Redis利用不可のため毎回DBから取得します: {e}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def _defer(self, thread_ids: Set[str]):
+        """進められなかったスレッドを復旧後に進めるため記録"""
+        if self._pending_overflow:
+            return
+        if len(self._pending) + len(thread_ids) > MAX_PENDING_BUMPS:
+            self._pending_overflow = True
+            self._pending.clear()
+            return
+        self._pending.update(thread_ids)
+
+    async def _bump_many(self, thread_ids: Set[str]):
+        async with self.r.pipeline(transaction=False) as pipe:
+            for thread_id in thread_ids:
+                await self._bump(
+                    keys=[f"{KEY_PREFIX}{thread_id}"],
+                    args=[_now_ms(), VERSION_TTL_SECONDS],
+                    client=pipe,
+                )
+            await pipe.execute()
+
+    async def _replay_pending(self):
+        """障害中に進められなかったバージョンを進める（失敗時は例外）"""
+        if self._pending_overflow:
+            # 記録しきれなかったため全スレッドのバージョンを破棄（次回参照時に現在時刻で再作成）
+            await self._raise_floor(keys=[FLOOR_KEY], args=[_now_ms()])
+            self._pending_overflow = False
+            self._pending.clear()
+            logger.info("スレッドバージョン: Redis復旧により全スレッドのバージョンを破棄しました")
+            return
+        if self._pending:
+            pending = set(self._pending)
+            await self._bump_many(pending)
+            self._pending -= pending
+            logger.info(f"スレッドバージョン: 障害中の変更 {len(pending)}スレッドのバージョンを進めました")
+
+    async def bump(self, thread_ids: Iterable[Optional[str]]):
+        """スレッドのバージョンを進める（スレッド内容の変更時）"""
+        thread_ids = {thread_id for thread_id in thread_ids if thread_id}
+        if not thread_ids:
+            return
+        if not self._redis_usable():
+            self._defer(thread_ids)
+            return
+        try:
+            await self._replay_pending()
+            await self._bump_many(thread_ids)
+        except Exception as e:
+            # 進め損ねたバージョンは古いETagを返し得るため、キーの削除を試み、復旧後にも進める
+            self._mark_redis_down(e)
+            self._defer(thread_ids)
+            await self._forget(thread_ids)
+
+    async def _forget(self, thread_ids: Iterable[str]):
+        try:
+            await self.r.delete(*(f"{KEY_PREFIX}{thread_id}" for thread_id in thread_ids))
+        except Exception:
+            pass
+
+    async def _leases_current(self, leases: Dict[str, str]) -> bool:
+        """他のワーカーのリースがすべて有効か（期限切れのワーカーは未反映の変更を持ち得る）"""
+        now = _now_ms()
+        expired = {
+            origin: int(expires) for origin, expires in leases.items()
+            if origin != self.origin and int(expires) < now
+        }
+        if not expired:
+            return True
+        threshold = now - LEASE_FORGET_SECONDS * 1000
+        abandoned = [origin for origin, expires in expired.items() if expires < threshold]
+        if abandoned:
+            forgotten = await self._forget_leases(keys=[LEASES_KEY, FLOOR_KEY], args=[threshold, now, *abandoned])
+            if forgotten:
+                logger.warning(f"スレッドバージョン: 更新の止まったリース {forgotten}件を削除し、全スレッドのバージョンを破棄しました")
+        return False
+
+    async def get(self, thread_id: str) -> Optional[int]:
+        """現在のバージョンを返す（Redis利用不可・期限切れのリースがある場合は None）"""
+        if not self._redis_usable():
+            return None
+        try:
+            await self._replay_pending()
+            key = f"{KEY_PREFIX}{thread_id}"
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.get(key)
+                pipe.get(FLOOR_KEY)
+                pipe.hgetall(LEASES_KEY)
+                version, floor, leases = await pipe.execute()
+            if not await self._leases_current(leases):
+                return None
+            if version is None or int(version) <= int(floor or 0):
+                # 初回参照時・一括破棄後は現在時刻を初期バージョンとして作成
+                version = await self._bump(keys=[key], args=[_now_ms(), VERSION_TTL_SECONDS])
+            return int(version)
+        except Exception as e:
+            self._mark_redis_down(e)
+            return None
+
+    async def renew_lease(self):
+        """未反映の変更を書き戻してからリースを更新（失敗時は例外）"""
+        await self._replay_pending()
+        await self.r.hset(LEASES_KEY, self.origin, _now_ms() + LEASE_SECONDS * 1000)
+
+    async def _run(self):
+        while True:
+            if self._redis_usable():
+                try:
+                    await self.renew_lease()
+                except Exception as e:
+                    self._mark_redis_down(e)
+            await asyncio.sleep(LEASE_REFRESH_SECONDS)
+
+    def start(self):
+        """リースの定期更新を開始（FastAPIスタートアップで呼び出し）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """リースの定期更新を停止し、未反映の変更がなければリースを返却"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self._replay_pending()
+            await self.r.hdel(LEASES_KEY, self.origin)
+        except Exception as e:
+            # リースは期限切れのまま残り、他のワーカーは内容のハッシュで判定し続ける
+            logger.warning(f"スレッドバージョン: 停止時に未反映の変更を書き戻せませんでした: {e}")
+
+
+# グローバルインスタンス
+thread_version_service = ThreadVersionService()
@@ -0,0 +1,309 @@
+"""
+未読カウンターサービス
+ユーザー別・スレッド別の未読数をRedisハッシュで保持し、DBと定期的に突き合わせる
+
+DB集計値での置き換え（キー未作成時の再構築・突き合わせ）は、集計前に読んだ
+ユーザーの更新番号が変わっていない場合のみ行い、集計中の加算・減算を上書きしない。
+配信・既読のコミットからカウンターへの反映までの間（in_flight）も置き換えない
+（コミット済みの行を集計した値に、直後の加算が重ねて数えられるのを防ぐ）
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy import func, select
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import Inbox
+
+logger = logging.getLogger(__name__)
+
+# Redisキー: unread:{user_id} -> {thread_id: 未読数, TOTAL_FIELD: 合計}
+KEY_PREFIX = "unread:"
+# Redisキー: unread_seq:{user_id} -> 加算・減算のたびに進む更新番号
+SEQ_PREFIX = "unread_seq:"
+# Redisキー: unread_inflight:{user_id} -> コミット済み・カウンター未反映の変更数
+IN_FLIGHT_PREFIX = "unread_inflight:"
+# 反映前に異常終了した場合に置き換えの停止を解除するまでの秒数
+IN_FLIGHT_TTL_SECONDS = 60
+# 突き合わせを1ワーカーのみで実行するためのロック
+RECONCILE_LOCK_KEY = "unread_reconcile_lock"
+TOTAL_FIELD = "_total"
+NO_THREAD_FIELD = "_none"
+SEQ_TTL_SECONDS = 7 * 24 * 3600
+# Redis障害時に再接続を試みるまでの秒数
+REDIS_RETRY_SECONDS = 30
+
+# 更新番号を進め、キーが存在する場合のみ加算する（未作成・退避済みのキーは次回参照時にDBから再構築）
+APPLY = """
+redis.call('INCR', KEYS[2])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[3])
+    redis.call('HINCRBY', KEYS[1], ARGV[2], ARGV[3])
+end
+return 1
+"""
+
+# 更新番号が集計前に読んだ値（ARGV[1]、未作成なら空文字）のままで、反映待ちの変更がない場合のみ、
+# カウンターを集計値（ARGV[2:] の field, value）で置き換える
+STORE_IF_UNCHANGED = """
+local seq = redis.call('GET', KEYS[2]) or ''
+if seq ~= ARGV[1] or tonumber(redis.call('GET', KEYS[3]) or '0') > 0 then
+    return 0
+end
+redis.call('DEL', KEYS[1])
+redis.call('HSET', KEYS[1], unpack(ARGV, 2))
+return 1
+"""
+
+# 反映待ちの変更数を増減（0以下になったら削除）
+IN_FLIGHT = """
+local n = redis.call('INCRBY', KEYS[1], ARGV[1])
+if n <= 0 then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return n
+"""
+
+
+def _thread_field(thread_id: Optional[str]) -> str:
+    return thread_id or NO_THREAD_FIELD
+
+
+def _keys(user_id: str) -> List[str]:
+    return [f"{KEY_PREFIX}{user_id}", f"{SEQ_PREFIX}{user_id}", f"{IN_FLIGHT_PREFIX}{user_id}"]
+
+
+class UnreadCounterService:
+    """未読数をO(1)で返すためのマテリアライズドカウンター"""
+
+    def __init__(self, redis_client=None, session_factory=AsyncSessionLocal):
+        if redis_client is None:
+            settings = get_settings()
+            redis_client = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=settings.redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+            )
+        self.r = redis_client
+        self._apply_script = self.r.register_script(APPLY)
+        self._store_if_unchanged = self.r.register_script(STORE_IF_UNCHANGED)
+        self._in_flight_script = self.r.register_script(IN_FLIGHT)
+        self.session_factory = session_factory
+        self._redis_down_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def _redis_usable(self) -> bool:
+        return time.monotonic() >= self._redis_down_until
+
+    def _mark_redis_down(self, e: Exception):
+        logger.warning(f"未読カウンター: Redis利用不可のためDB集計にフォールバックします: {e}")
+        self._redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    async def _mark_in_flight(self, user_ids: List[str], delta: int) -> bool:
+        if not user_ids or not self._redis_usable():
+            return False
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for user_id in user_ids:
+                    await self._in_flight_script(
+                        keys=[f"{IN_FLIGHT_PREFIX}{user_id}"], args=[delta, IN_FLIGHT_TTL_SECONDS], client=pipe
+                    )
+                await pipe.execute()
+            return True
+        except Exception as e:
+            self._mark_redis_down(e)
+            return False
+
+    @asynccontextmanager
+    async def in_flight(self, user_ids: Iterable[str]):
+        """DBの未読の変更をコミットしてから increment / decrement するまでを囲む
+
+        この間はユーザーのカウンターをDB集計値で置き換えない（コミット済みの行を含む集計値に
+        直後の加算・減算が重なるのを防ぐ）。
+        """
+        user_ids = sorted(set(user_ids))
+        marked = await self._mark_in_flight(user_ids, 1)
+        try:
+            yield
+        finally:
+            if marked:
+                await self._mark_in_flight(user_ids, -1)
+
+    async def increment(self, deliveries: Iterable[Tuple[str, Optional[str]]]):
+        """(user_id, thread_id) ごとに未読数を加算（配信時）"""
+        await self._apply(Counter(deliveries), sign=1)
+
+    async def decrement(self, reads: Iterable[Tuple[str, Optional[str]]]):
+        """(user_id, thread_id) ごとに未読数を減算（既読時・未読の配信の削除時）"""
+        await self._apply(Counter(reads), sign=-1)
+
+    async def _apply(self, counts: Counter, sign: int):
+        if not counts or not self._redis_usable():
+            return
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for (user_id, thread_id), n in counts.items():
+                    await self._apply_script(
+                        keys=_keys(user_id),
+                        args=[_thread_field(thread_id), TOTAL_FIELD, sign * n, SEQ_TTL_SECONDS],
+                        client=pipe,
+                    )
+                await pipe.execute()
+        except Exception as e:
+            # 取りこぼしは次回の突き合わせで補正される
+            self._mark_redis_down(e)
+
+    async def get_summary(self, user_id: str) -> Tuple[int, Dict[str, int]]:
+        """(合計未読数, スレッド別未読数) を返す"""
+        seq = None
+        if self._redis_usable():
+            try:
+                async with self.r.pipeline(transaction=False) as pipe:
+                    pipe.hgetall(f"{KEY_PREFIX}{user_id}")
+                    pipe.get(f"{SEQ_PREFIX}{user_id}")
+                    data, seq = await pipe.execute()
+                if data:
+                    return self._parse(data)
+            except Exception as e:
+                self._mark_redis_down(e)
+
+        # キー未作成（初回・退避済み）またはRedis障害時はDBから集計
+        counts = await self._count_from_db(user_id)
+        if self._redis_usable():
+            await self._store(user_id, counts, seq)
+        return sum(counts.values()), {
+            thread: n for thread, n in counts.items() if thread != NO_THREAD_FIELD
+        }
+
+    def _parse(self, data: Dict[str, str]) -> Tuple[int, Dict[str, int]]:
+        threads = {
+            field: int(value) for field, value in data.items()
+            if field not in (TOTAL_FIELD, NO_THREAD_FIELD) and int(value) > 0
+        }
+        return max(int(data.get(TOTAL_FIELD, 0)), 0), threads
+
+    async def _count_from_db(self, user_id: Optional[str] = None) -> Dict:
+        query = (
+            select(Inbox.user_id, Inbox.thread_id, func.count())
+            .where(Inbox.status == "unread")
+            .group_by(Inbox.user_id, Inbox.thread_id)
+        )
+        if user_id is not None:
+            query = query.where(Inbox.user_id == user_id)
+        async with self.session_factory() as db:
+            rows = (await db.execute(query)).all()
+
+        if user_id is not None:
+            return {_thread_field(thread_id): n for _, thread_id, n in rows}
+        per_user: Dict[str, Dict[str, int]] = {}
+        for uid, thread_id, n in rows:
+            per_user.setdefault(uid, {})[_thread_field(thread_id)] = n
+        return per_user
+
+    def _store_args(self, counts: Dict[str, int], seq: Optional[str]) -> List:
+        mapping = {**counts, TOTAL_FIELD: sum(counts.values())}
+        return [seq or "", *(item for field_value in mapping.items() for item in field_value)]
+
+    async def _store(self, user_id: str, counts: Dict[str, int], seq: Optional[str]) -> bool:
+        """集計中に更新がなければ、ユーザーのカウンターをDB集計値で置き換える
+        
+        seq は集計前に読んだ更新番号。集計中に加算・減算があった場合は置き換えず、
+        次回参照時に改めて集計する。
+        """
+        try:
+            return bool(await self._store_if_unchanged(keys=_keys(user_id), args=self._store_args(counts, seq)))
+        except Exception as e:
+            self._mark_redis_down(e)
+            return False
+
+    async def reconcile(self) -> int:
+        """カウンターのあるユーザーをDBの未読数と突き合わせ、置き換えたユーザー数を返す
+        
+        キーのないユーザーは次回参照時にDBから集計されるため対象にしない。
+        """
+        if not self._redis_usable():
+            return 0
+        try:
+            user_ids = [
+                key[len(KEY_PREFIX):]
+                async for key in self.r.scan_iter(match=f"{KEY_PREFIX}*", count=500)
+            ]
+            if not user_ids:
+                return 0
+            # DB集計より前の更新番号（集計中に更新されたユーザーは置き換えない）
+            seqs = await self.r.mget([f"{SEQ_PREFIX}{user_id}" for user_id in user_ids])
+        except Exception as e:
+            self._mark_redis_down(e)
+            return 0
+
+        per_user = await self._count_from_db()
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for user_id, seq in zip(user_ids, seqs):
+                    # 未読がなくなったユーザーは合計0で置き換える
+                    await self._store_if_unchanged(
+                        keys=_keys(user_id),
+                        args=self._store_args(per_user.get(user_id, {}), seq),
+                        client=pipe,
+                    )
+                results = await pipe.execute()
+        except Exception as e:
+            self._mark_redis_down(e)
+            return 0
+        return sum(1 for stored in results if stored)
+
+    async def _acquire_reconcile_lock(self, interval_seconds: float) -> bool:
+        """全ワーカーで1間隔につき1回だけ突き合わせるためのロックを取得"""
+        if not self._redis_usable():
+            return False
+        try:
+            # 次の間隔の開始前に期限切れになるよう、間隔より少し短く保持する
+            ttl = max(1, int(interval_seconds * 0.9))
+            return bool(await self.r.set(RECONCILE_LOCK_KEY, os.getpid(), nx=True, ex=ttl))
+        except Exception as e:
+            self._mark_redis_down(e)
+            return False
+
+    async def run_reconciler(self, interval_seconds: float):
+        """一定間隔で突き合わせを実行（ロックを取得したワーカーのみ）"""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if not await self._acquire_reconcile_lock(interval_seconds):
+                    continue
+                users = await self.reconcile()
+                logger.info(f"未読カウンターを突き合わせました: {users}ユーザー")
+            except Exception as e:
+                logger.error(f"未読カウンター突き合わせエラー: {e}")
+
+    def start(self, interval_seconds: float):
+        """突き合わせジョブを開始（FastAPIスタートアップで呼び出し）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run_reconciler(interval_seconds))
+
+    async def stop(self):
+        """突き合わせジョブを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# グローバルインスタンス
+unread_counter_service = UnreadCounterService()
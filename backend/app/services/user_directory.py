@@ -0,0 +1,223 @@
+"""
+ユーザーディレクトリ
+users.json をメモリに保持し、ID によるO(1)参照を提供する
+ファイルの更新時刻の変化で再読み込みし、Redis Pub/Sub で他ワーカーにも通知する
+
+監視タスクの開始後は、ファイルの確認・読み込みを監視タスクがスレッドで行い、
+get() はメモリのみを参照する（イベントループをファイルI/Oで止めない）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import redis.asyncio as redis
+from sqlalchemy import or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.metrics import record_cache
+from app.models import User
+
+logger = logging.getLogger(__name__)
+
+# 他ワーカーへの再読み込み通知チャンネル
+INVALIDATION_CHANNEL = "user_directory:invalidate"
+
+
+class UserDirectory:
+    """users.json のインメモリキャッシュ"""
+
+    def __init__(self, path: Optional[str] = None, check_interval: float = 2.0, redis_client=None):
+        self.path = path or os.getenv("USERS_CONFIG", "config/users.json")
+        # ファイルの更新確認（stat）を行う最短間隔（秒）
+        self.check_interval = check_interval
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self._loaded = False
+        self._task: Optional[asyncio.Task] = None
+        if redis_client is None:
+            settings = get_settings()
+            redis_client = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=settings.redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+            )
+        self.r = redis_client
+
+    @property
+    def loaded(self) -> bool:
+        self._maybe_reload()
+        return self._loaded
+
+    def load(self) -> bool:
+        """users.json を読み込む（変更があった場合のみ True）"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            if self._loaded:
+                logger.warning(f"ユーザー設定ファイルが見つかりません: {self.path}")
+            self._users, self._mtime, self._loaded = {}, None, False
+            return False
+
+        if mtime == self._mtime:
+            return False
+
+        with open(self.path, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        self._users = {u["id"]: u for u in config.get("users", [])}
+        self._mtime = mtime
+        self._loaded = True
+        logger.info(f"ユーザー設定を読み込みました: {len(self._users)}名")
+        return True
+
+    def _maybe_reload(self):
+        if self._task is not None:
+            # 監視タスクが定期的に確認する
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        try:
+            if self.load():
+                self._notify_others()
+        except Exception as e:
+            # 書き込み途中のファイル等は前回の内容を使い続ける
+            logger.error(f"ユーザー設定の再読み込みに失敗しました: {e}")
+
+    def invalidate(self):
+        """次回参照時に必ずファイルを読み直す"""
+        self._mtime = None
+        self._checked_at = 0.0
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """IDでユーザーを取得"""
+        self._maybe_reload()
+        user = self._users.get(user_id)
+        record_cache("user_directory", user is not None)
+        return user
+
+    def all(self) -> List[Dict[str, Any]]:
+        """全ユーザーを取得（users.json の記載順）"""
+        self._maybe_reload()
+        return list(self._users.values())
+
+    async def sync_to_db(self, session_factory=AsyncSessionLocal) -> int:
+        """users テーブルをディレクトリの内容に合わせ、追加・更新した件数を返す
+        
+        全ワーカーが同時に実行しても衝突しないよう、1文の UPSERT（ON CONFLICT DO UPDATE）で書き込む。
+        """
+        users = dict(self._users)
+        if not users:
+            return 0
+        rows = [
+            {
+                "id": user_id,
+                "name": data["name"],
+                "language": data.get("language", "ja"),
+                "style_preset": data.get("style_preset", "biz_formal"),
+            }
+            for user_id, data in users.items()
+        ]
+        async with session_factory() as db:
+            insert = pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+            stmt = insert(User).values(rows)
+            columns = User.__table__.c
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[columns.id],
+                set_={field: stmt.excluded[field] for field in ("name", "language", "style_preset")},
+                # 変更のない行は更新しない（件数にも含めない）
+                where=or_(*(
+                    columns[field].is_distinct_from(stmt.excluded[field])
+                    for field in ("name", "language", "style_preset")
+                )),
+            )
+            result = await db.execute(stmt)
+            await db.commit()
+        return result.rowcount
+
+    def _notify_others(self):
+        try:
+            asyncio.get_running_loop().create_task(self._publish())
+        except RuntimeError:
+            # イベントループ外（スクリプト等）では通知しない
+            pass
+
+    async def _publish(self):
+        try:
+            await self.r.publish(INVALIDATION_CHANNEL, str(os.getpid()))
+        except Exception as e:
+            logger.warning(f"ユーザー設定の変更通知に失敗しました: {e}")
+
+    async def _run(self):
+        """他ワーカーからの通知を受けて再読み込みし、変更をDBへ同期する"""
+        pubsub = None
+        try:
+            pubsub = self.r.pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+        except Exception as e:
+            logger.warning(f"ユーザー設定の変更通知を購読できません（ファイル監視のみ）: {e}")
+            pubsub = None
+
+        while True:
+            notified = False
+            if pubsub is not None:
+                try:
+                    message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=self.check_interval)
+                    if message and message.get("data") != str(os.getpid()):
+                        self.invalidate()
+                        notified = True
+                except Exception as e:
+                    logger.warning(f"ユーザー設定の変更通知の受信に失敗しました: {e}")
+                    pubsub = None
+            else:
+                await asyncio.sleep(self.check_interval)
+
+            try:
+                changed = await asyncio.to_thread(self.load)
+            except Exception as e:
+                # 書き込み途中のファイル等は前回の内容を使い続ける
+                logger.error(f"ユーザー設定の再読み込みに失敗しました: {e}")
+                continue
+            if changed and not notified:
+                # 通知による再読み込みでは再通知・DB同期しない（通知元のワーカーが行う）
+                await self._publish()
+                try:
+                    await self.sync_to_db()
+                except Exception as e:
+                    logger.error(f"ユーザー設定のDB同期に失敗しました: {e}")
+
+    async def start(self):
+        """初回読み込み・DB同期と監視タスクを開始（FastAPIスタートアップで呼び出し）"""
+        await asyncio.to_thread(self.load)
+        try:
+            changed = await self.sync_to_db()
+            if changed:
+                logger.info(f"ユーザー設定をDBへ同期しました: {changed}件")
+        except Exception as e:
+            logger.error(f"ユーザー設定のDB同期に失敗しました: {e}")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """監視タスクを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# グローバルインスタンス
+user_directory = UserDirectory()
@@ -0,0 +1,206 @@
+"""
+ベクトルインデックスサービス
+FAISS（利用可能な場合）または NumPy によるインメモリ近傍検索
+
+インデックスはワーカープロセスごとに持つため、削除は Redis Pub/Sub で
+他のワーカー（および別プロセスのスイーパー）から全ワーカーへ通知する
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import redis.asyncio as redis
+
+from app.config import get_settings
+
+# faissのインポートを安全に行う
+try:
+    import faiss
+    FAISS_AVAILABLE = True
+except ImportError as e:
+    print(f"Warning: faiss not available: {e}")
+    FAISS_AVAILABLE = False
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# ベクトル削除の通知チャンネル
+REMOVAL_CHANNEL = "vector_index:remove"
+# Redis障害時に購読をやり直すまでの秒数
+RESUBSCRIBE_SECONDS = 30
+
+
+class VectorService:
+    """vector_id をキーにしたベクトルインデックス（ワーカープロセス内）"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        # vector_id(str) <-> 内部ID(int64)
+        self._ids: Dict[str, int] = {}
+        self._vector_ids: Dict[int, str] = {}
+        self._next_id = 1
+
+        if FAISS_AVAILABLE:
+            # 内積（正規化済みベクトルでコサイン類似度）+ 削除可能なIDマップ
+            self._index = faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+        else:
+            self._index = None
+            self._vectors: Dict[int, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _normalize(self, vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def add(self, vector_id: str, vector: np.ndarray) -> None:
+        """ベクトルを追加（同じvector_idは置き換え）"""
+        vector = self._normalize(vector)
+        with self._lock:
+            if vector_id in self._ids:
+                self._remove_locked([vector_id])
+            internal_id = self._next_id
+            self._next_id += 1
+            self._ids[vector_id] = internal_id
+            self._vector_ids[internal_id] = vector_id
+            if self._index is not None:
+                self._index.add_with_ids(vector.reshape(1, -1), np.array([internal_id], dtype=np.int64))
+            else:
+                self._vectors[internal_id] = vector
+
+    def remove(self, vector_ids: Iterable[str]) -> int:
+        """ベクトルを削除し、削除件数を返す（未登録のIDは無視）"""
+        with self._lock:
+            return self._remove_locked(vector_ids)
+
+    def _remove_locked(self, vector_ids: Iterable[str]) -> int:
+        internal_ids = [self._ids.pop(vid) for vid in vector_ids if vid in self._ids]
+        if not internal_ids:
+            return 0
+        for internal_id in internal_ids:
+            del self._vector_ids[internal_id]
+        if self._index is not None:
+            self._index.remove_ids(np.array(internal_ids, dtype=np.int64))
+        else:
+            for internal_id in internal_ids:
+                del self._vectors[internal_id]
+        return len(internal_ids)
+
+    def get(self, vector_ids: Iterable[str]) -> Dict[str, np.ndarray]:
+        """登録済みベクトル（正規化済み）を取得（未登録のIDは無視）"""
+        with self._lock:
+            vectors = {}
+            for vector_id in vector_ids:
+                internal_id = self._ids.get(vector_id)
+                if internal_id is None:
+                    continue
+                if self._index is not None:
+                    vectors[vector_id] = self._index.reconstruct(internal_id)
+                else:
+                    vectors[vector_id] = self._vectors[internal_id].copy()
+            return vectors
+
+    def search(self, vector: np.ndarray, k: int = 5) -> List[Tuple[str, float]]:
+        """近傍検索して (vector_id, 類似度) を類似度の高い順に返す"""
+        query = self._normalize(vector)
+        with self._lock:
+            if not self._ids:
+                return []
+            k = min(k, len(self._ids))
+            if self._index is not None:
+                scores, ids = self._index.search(query.reshape(1, -1), k)
+                pairs = zip(ids[0].tolist(), scores[0].tolist())
+            else:
+                internal_ids = list(self._vectors.keys())
+                matrix = np.stack([self._vectors[i] for i in internal_ids])
+                all_scores = matrix @ query
+                top = np.argsort(-all_scores)[:k]
+                pairs = [(internal_ids[i], float(all_scores[i])) for i in top]
+            return [
+                (self._vector_ids[internal_id], float(score))
+                for internal_id, score in pairs
+                if internal_id in self._vector_ids
+            ]
+
+
+class VectorRemovalBroadcaster:
+    """ベクトルの削除を全ワーカーのインデックスに反映する
+    
+    Redis 利用不可の間に通知できなかった削除は他ワーカーのインデックスに残るが、
+    近傍検索の結果はDBの行と突き合わせるため、削除済みメッセージが返ることはない
+    （次のワーカー再起動で解放される）。
+    """
+
+    def __init__(self, index: VectorService, redis_client=None):
+        self.index = index
+        if redis_client is None:
+            settings = get_settings()
+            redis_client = redis.Redis(
+                host=settings.redis_host,
+                port=settings.redis_port,
+                db=settings.redis_db,
+                decode_responses=True,
+                socket_connect_timeout=1,
+            )
+        self.r = redis_client
+        # 自分が送った通知を無視するための送信元ID
+        self.origin = uuid.uuid4().hex
+        self._task: Optional[asyncio.Task] = None
+
+    async def remove(self, vector_ids: Iterable[str]) -> int:
+        """このプロセスのインデックスから削除し、他のワーカーにも削除を通知する"""
+        vector_ids = list(vector_ids)
+        if not vector_ids:
+            return 0
+        removed = self.index.remove(vector_ids)
+        try:
+            await self.r.publish(REMOVAL_CHANNEL, json.dumps({"origin": self.origin, "vector_ids": vector_ids}))
+        except Exception as e:
+            logger.warning(f"ベクトル削除の通知に失敗しました（{len(vector_ids)}件）: {e}")
+        return removed
+
+    async def _run(self):
+        """他プロセスからの削除通知をこのワーカーのインデックスに反映する"""
+        while True:
+            pubsub = self.r.pubsub()
+            try:
+                await pubsub.subscribe(REMOVAL_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    if payload.get("origin") != self.origin:
+                        self.index.remove(payload.get("vector_ids", []))
+            except Exception as e:
+                logger.warning(f"ベクトル削除通知の購読に失敗しました（{RESUBSCRIBE_SECONDS}秒後に再試行）: {e}")
+            finally:
+                await pubsub.aclose()
+            await asyncio.sleep(RESUBSCRIBE_SECONDS)
+
+    def start(self):
+        """削除通知の購読を開始（FastAPIスタートアップで呼び出し）"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """購読を停止"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# グローバルインスタンス
+vector_service = VectorService()
+vector_removals = VectorRemovalBroadcaster(vector_service)
@@ -0,0 +1,305 @@
+"""
+Socket.IO 送信のバッチ化と接続ごとの送信キュー
+このワーカーの接続への送信は、接続ごとの上限付きキューを経由する。
+
+- 同じ接続宛てに短い間隔（数ms）で続いたイベントは1フレームにまとめて送信する。
+  複数イベントは "batch" イベント（[[event, data], ...]）として届く。
+- 最新の状態だけを送ればよいイベント（入力中・プレゼンスのスナップショットなど）は、
+  送信待ちの古いイベントを置き換える。
+- 受信の遅いクライアント（Engine.IO の送信キューが捌けない接続）への送信は保留し、
+  キューが一杯になれば破棄してよいイベントから捨てる。保留が続く接続や、破棄できない
+  イベントで一杯になった接続は切断する（再接続時に missed_events / get_presence で再同期される）。
+
+Socket.IO のクライアントマネージャーのうち、このワーカーの接続に実際に送信する段（AsyncManager.emit）
+を置き換えるため、Redis経由で他のワーカーから中継されたイベントにも適用される。
+"""
+
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import socketio
+from socketio import packet
+
+logger = logging.getLogger(__name__)
+
+# 複数イベントをまとめたフレームのイベント名
+BATCH_EVENT = "batch"
+
+# 最新の状態だけを送ればよいイベント: イベント名 -> 置き換えの単位となるデータの項目（None はイベント名のみ）
+LATEST_ONLY = {
+    "user_typing": "user_id",
+    "presence_snapshot": None,
+    "online_users": None,
+    "devices": None,
+    "pong": None,
+}
+# キューが一杯のときに破棄してよいイベント（presence_delta はバージョンの欠番からクライアントが再同期する）
+DROPPABLE = {"user_typing", "presence_delta", "pong"}
+
+# 送信を保留している接続の再試行間隔（秒）
+STALL_RETRY_SECONDS = 0.1
+
+# (namespace, eio_sid)
+ConnectionKey = Tuple[str, str]
+
+
+def _args(data) -> List[Any]:
+    """emit の data を Socket.IO のイベント引数に変換（AsyncManager.emit と同じ規則）"""
+    if isinstance(data, tuple):
+        return list(data)
+    if data is not None:
+        return [data]
+    return []
+
+
+def _coalesce_key(event: str, data: Any) -> Optional[Tuple[str, Any]]:
+    """最新の状態だけを送ればよいイベントの置き換えキー（それ以外は None）"""
+    if event not in LATEST_ONLY:
+        return None
+    field = LATEST_ONLY[event]
+    if field is None:
+        return (event, None)
+    if isinstance(data, dict) and field in data:
+        return (event, data[field])
+    return None
+
+
+class OutboundQueue:
+    """1接続の送信待ちイベント（上限付き）"""
+
+    __slots__ = ("events", "scheduled", "stalled_since")
+
+    _seq = itertools.count()
+
+    def __init__(self):
+        # 置き換えキー（または通し番号） -> (イベント名, データ)。挿入順が送信順
+        self.events: Dict[Any, Tuple[str, Any]] = {}
+        self.scheduled = False
+        self.stalled_since: Optional[float] = None
+
+    def put(self, event: str, data: Any, max_len: int) -> Tuple[bool, int, bool]:
+        """イベントを追加し、(置き換えたか, 破棄した件数, 破棄できず溢れたか) を返す"""
+        key = _coalesce_key(event, data)
+        coalesced = False
+        if key is None:
+            key = next(self._seq)
+        elif key in self.events:
+            # 古い状態を捨てて末尾（最新の位置）に入れ直す
+            del self.events[key]
+            coalesced = True
+        dropped = 0
+        while len(self.events) >= max_len:
+            victim = next((k for k, (name, _) in self.events.items() if name in DROPPABLE), None)
+            if victim is None:
+                if event in DROPPABLE:
+                    # 破棄できないイベントで一杯なら、追加しようとしたイベントの方を捨てる
+                    return coalesced, dropped + 1, False
+                return coalesced, dropped, True
+            del self.events[victim]
+            dropped += 1
+        self.events[key] = (event, data)
+        return coalesced, dropped, False
+
+    def drain(self) -> List[Tuple[str, Any]]:
+        events = list(self.events.values())
+        self.events.clear()
+        return events
+
+    def __len__(self) -> int:
+        return len(self.events)
+
+
+class BatchingManager(socketio.AsyncManager):
+    """このワーカーの接続への送信を接続ごとのキュー経由で行うクライアントマネージャー（単一ワーカー用）"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 0 以下ならイベントをまとめず1件ずつ送る（キューと背圧制御は有効）
+        self.batch_window = 0.005
+        self.max_batch = 64
+        # 1接続あたりの送信待ちイベントの上限
+        self.max_queue = 256
+        # Engine.IO の送信キューがこの件数以上なら、クライアントが受信できていないとみなして保留する
+        self.max_backlog = 64
+        # 保留がこの秒数続いた接続は切断する
+        self.slow_consumer_seconds = 10.0
+        self._outbound: Dict[ConnectionKey, OutboundQueue] = {}
+        # 統計（監視・ベンチマーク用）
+        self.events_sent = 0
+        self.frames_sent = 0
+        self.events_coalesced = 0
+        self.events_dropped = 0
+        self.slow_consumers = 0
+
+    async def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, **kwargs):
+        if callback is not None or namespace not in self.rooms:
+            # ack付きのイベントは接続ごとにIDが異なるため、キューを通さずに送る
+            return await super().emit(
+                event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, **kwargs
+            )
+        if not isinstance(skip_sid, list):
+            skip_sid = [skip_sid]
+        for sid, eio_sid in self.get_participants(namespace, room):
+            if sid not in skip_sid:
+                self._enqueue(namespace, eio_sid, event, data)
+
+    def _enqueue(self, namespace: str, eio_sid: str, event: str, data: Any):
+        key = (namespace, eio_sid)
+        queue = self._outbound.get(key)
+        if queue is None:
+            self._outbound[key] = queue = OutboundQueue()
+        coalesced, dropped, overflow = queue.put(event, data, self.max_queue)
+        self.events_coalesced += coalesced
+        self.events_dropped += dropped
+        loop = asyncio.get_running_loop()
+        if overflow:
+            # 破棄できないイベントで一杯: これ以上メモリを使わせずに切断する
+            self.events_dropped += 1
+            loop.create_task(self._disconnect_slow(key, "送信キューが一杯"))
+        elif queue.stalled_since is not None:
+            # 保留中の接続は再試行のタイマーに任せる
+            pass
+        elif self.batch_window > 0 and len(queue) >= self.max_batch:
+            self._schedule_flush(key)
+        elif not queue.scheduled:
+            # 最初のイベントから batch_window 後にまとめて送信
+            queue.scheduled = True
+            if self.batch_window > 0:
+                loop.call_later(self.batch_window, self._schedule_flush, key)
+            else:
+                loop.call_soon(self._schedule_flush, key)
+
+    def _schedule_flush(self, key: ConnectionKey):
+        if key in self._outbound:
+            asyncio.get_running_loop().create_task(self._flush(key))
+
+    def _eio_socket(self, eio_sid: str):
+        sockets = getattr(self.server.eio, "sockets", None)
+        return sockets.get(eio_sid) if sockets else None
+
+    def _backlog(self, eio_sid: str) -> int:
+        """Engine.IO の送信キューに残っているパケット数（クライアントが受信していない分）"""
+        socket = self._eio_socket(eio_sid)
+        return socket.queue.qsize() if socket is not None else 0
+
+    async def _flush(self, key: ConnectionKey):
+        queue = self._outbound.get(key)
+        if queue is None:
+            return
+        queue.scheduled = False
+        namespace, eio_sid = key
+        if self._backlog(eio_sid) >= self.max_backlog:
+            now = time.monotonic()
+            if queue.stalled_since is None:
+                queue.stalled_since = now
+            elif now - queue.stalled_since >= self.slow_consumer_seconds:
+                await self._disconnect_slow(key, f"{self.slow_consumer_seconds:g}秒間受信が停滞")
+                return
+            queue.scheduled = True
+            asyncio.get_running_loop().call_later(STALL_RETRY_SECONDS, self._schedule_flush, key)
+            return
+        del self._outbound[key]
+        pending = queue.drain()
+        if not pending:
+            return
+
+        if self.batch_window > 0:
+            frames = [pending[i:i + self.max_batch] for i in range(0, len(pending), self.max_batch)]
+        else:
+            frames = [[event] for event in pending]
+        for frame in frames:
+            if len(frame) == 1:
+                event, data = frame[0]
+                pkt = self.server.packet_class(packet.EVENT, namespace=namespace, data=[event] + _args(data))
+            else:
+                pkt = self.server.packet_class(packet.EVENT, namespace=namespace, data=[BATCH_EVENT, [
+                    [event, data] for event, data in frame
+                ]])
+            self.events_sent += len(frame)
+            self.frames_sent += 1
+            try:
+                await self.server._send_packet(eio_sid, pkt)
+            except Exception as e:
+                # 切断済みの接続など
+                logger.debug(f"送信エラー: {e}")
+                return
+
+    async def _disconnect_slow(self, key: ConnectionKey, reason: str):
+        """受信の遅い接続を切断する"""
+        if self._outbound.pop(key, None) is None:
+            return
+        namespace, eio_sid = key
+        self.slow_consumers += 1
+        logger.warning(f"受信の遅い接続を切断します: {eio_sid}（{reason}）")
+        socket = self._eio_socket(eio_sid)
+        try:
+            if socket is not None:
+                # 送信待ちが捌けるのを待たずに閉じる（Socket.IO の disconnect も発生する）
+                await socket.close(wait=False, abort=True)
+            else:
+                sid = self.sid_from_eio_sid(eio_sid, namespace)
+                if sid is not None:
+                    await self.server.disconnect(sid, namespace=namespace, ignore_queue=True)
+        except Exception as e:
+            logger.debug(f"切断エラー: {e}")
+
+    async def disconnect(self, sid, namespace, **kwargs):
+        eio_sid = self.eio_sid_from_sid(sid, namespace)
+        await super().disconnect(sid, namespace, **kwargs)
+        if eio_sid is not None:
+            self._outbound.pop((namespace, eio_sid), None)
+
+    async def flush_all(self):
+        """送信待ちのイベントを全て送信（停止時）"""
+        await asyncio.gather(*(self._flush(key) for key in list(self._outbound)))
+
+    def queue_depth(self, sid: str, namespace: str = "/") -> int:
+        """接続の送信待ちイベント数（このキュー + Engine.IO の送信キュー）"""
+        eio_sid = self.eio_sid_from_sid(sid, namespace)
+        if eio_sid is None:
+            return 0
+        queue = self._outbound.get((namespace, eio_sid))
+        return (len(queue) if queue is not None else 0) + self._backlog(eio_sid)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events_sent": self.events_sent,
+            "frames_sent": self.frames_sent,
+            "events_coalesced": self.events_coalesced,
+            "events_dropped": self.events_dropped,
+            "slow_consumers": self.slow_consumers,
+            "pending_sockets": len(self._outbound),
+            "stalled_sockets": sum(1 for queue in self._outbound.values() if queue.stalled_since is not None),
+        }
+
+
+class BatchingRedisManager(socketio.AsyncRedisManager, BatchingManager):
+    """複数ワーカー用（Redis経由で中継されたイベントを受信側のワーカーでまとめる）
+
+    MRO: AsyncRedisManager -> AsyncPubSubManager -> BatchingManager -> AsyncManager
+    """
+
+
+def create_batching_manager(
+    redis_url: Optional[str],
+    channel: str,
+    batch_window_ms: float,
+    max_batch: int = 64,
+    max_queue: int = 256,
+    max_backlog: int = 64,
+    slow_consumer_seconds: float = 10.0,
+):
+    """設定に応じたクライアントマネージャーを作成（redis_url が None なら単一ワーカー用）"""
+    if redis_url:
+        manager = BatchingRedisManager(redis_url, channel=channel)
+    else:
+        manager = BatchingManager()
+    manager.batch_window = batch_window_ms / 1000
+    manager.max_batch = max_batch
+    manager.max_queue = max_queue
+    manager.max_backlog = max_backlog
+    manager.slow_consumer_seconds = slow_consumer_seconds
+    return manager
@@ -0,0 +1,253 @@
+"""
+期限切れメッセージのスイーパー
+expires_at を過ぎたメッセージと関連行（受信箱・コンテンツ・ベクトル）をバッチ削除
+アーカイバーが設定されている場合は、各バッチを書き出してから削除する
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, select, text
+
+from app.archive import create_archiver
+from app.config import get_settings
+from app.database import AsyncSessionLocal
+from app.models import Message, MessageContent, Inbox
+from app.services.thread_version_service import thread_version_service
+from app.services.unread_counter_service import unread_counter_service
+from app.services.vector_service import vector_removals
+
+logger = logging.getLogger(__name__)
+
+# パーティション名: messages_pYYYYMMDD（expires_at の日単位レンジ）
+PARTITION_PREFIX = "messages_p"
+# 日次パーティションの範囲外（作成前の日付）の行が入るパーティション
+DEFAULT_PARTITION = "messages_default"
+# パーティション作成を複数プロセスで同時に行わないための advisory lock のキー
+PARTITION_LOCK_KEY = "messages_partitions"
+
+
+def partition_name(day: datetime) -> str:
+    return f"{PARTITION_PREFIX}{day.strftime('%Y%m%d')}"
+
+
+class ExpiredMessageSweeper:
+    """期限切れメッセージをバックグラウンドで削除する"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        batch_size: int = 500,
+        interval_seconds: float = 300,
+        duty_cycle: float = 0.2,
+        partitioned: bool = False,
+        vector_cleanup: Optional[Callable[[Iterable[str]], Any]] = None,
+        archiver=None,
+    ):
+        if not 0 < duty_cycle <= 1:
+            raise ValueError(f"duty_cycle は 0 より大きく 1 以下で指定してください: {duty_cycle}")
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval_seconds = interval_seconds
+        # 削除処理に使う時間の割合（残りはフォアグラウンド処理に譲る）
+        self.duty_cycle = duty_cycle
+        self.partitioned = partitioned
+        # ベクトルの削除（既定では全ワーカーのインデックスへ通知、同期・非同期どちらの関数も可）
+        self.vector_cleanup = vector_cleanup or vector_removals.remove
+        # 削除前に書き出すアーカイバー（MessageArchiver、None なら書き出さない）
+        self.archiver = archiver
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def _throttle(self, elapsed: float):
+        """直前のバッチ所要時間に応じて待機し、DBを占有しないようにする"""
+        pause = elapsed * (1 - self.duty_cycle) / self.duty_cycle
+        await asyncio.sleep(pause)
+
+    async def _cleanup_vectors(self, rows):
+        result = self.vector_cleanup([row.vector_id for row in rows if row.vector_id])
+        if inspect.isawaitable(result):
+            await result
+
+    async def _archive(self, db, message_ids: List[str]):
+        """削除前にアーカイブへ書き出す（失敗した場合は例外により削除しない）"""
+        if self.archiver is not None:
+            await self.archiver.archive(db, message_ids)
+
+    async def _delete_dependents(
+        self, db, message_ids: List[str]
+    ) -> Tuple[Set[str], List[Tuple[str, Optional[str]]]]:
+        """受信箱・コンテンツを削除し、(配信先スレッドのID, 削除した未読の (user_id, thread_id)) を返す"""
+        result = await db.execute(
+            delete(Inbox)
+            .where(Inbox.message_id.in_(message_ids))
+            .returning(Inbox.user_id, Inbox.thread_id, Inbox.status)
+        )
+        rows = result.all()
+        thread_ids = {row.thread_id for row in rows if row.thread_id}
+        unread = [(row.user_id, row.thread_id) for row in rows if row.status == "unread"]
+        await db.execute(delete(MessageContent).where(MessageContent.message_id.in_(message_ids)))
+        return thread_ids, unread
+
+    async def sweep_once(self, now: Optional[datetime] = None) -> int:
+        """期限切れメッセージを全て削除し、削除件数を返す"""
+        now = now or datetime.now()
+        async with self.session_factory() as db:
+            if self.partitioned and db.bind.dialect.name == "postgresql":
+                return await self._sweep_partitions(db, now)
+            return await self._sweep_batches(db, now)
+
+    async def _sweep_batches(self, db, now: datetime) -> int:
+        deleted = 0
+        while not self._stopping.is_set():
+            started = time.monotonic()
+            result = await db.execute(
+                select(Message.id, Message.vector_id, Message.thread_id)
+                .where(Message.expires_at < now)
+                .order_by(Message.expires_at)
+                .limit(self.batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+
+            message_ids = [row.id for row in rows]
+            await self._archive(db, message_ids)
+            thread_ids, unread = await self._delete_dependents(db, message_ids)
+            await db.execute(delete(Message).where(Message.id.in_(message_ids)))
+            await db.commit()
+            await thread_version_service.bump(thread_ids | {row.thread_id for row in rows})
+            await unread_counter_service.decrement(unread)
+
+            await self._cleanup_vectors(rows)
+            deleted += len(message_ids)
+
+            if len(rows) < self.batch_size:
+                break
+            await self._throttle(time.monotonic() - started)
+        return deleted
+
+    async def _sweep_partitions(self, db, now: datetime) -> int:
+        """期限切れ日のパーティションを丸ごとDROPする（PostgreSQL）
+        
+        デフォルトパーティション（と当日のパーティション）に残る期限切れ行は、
+        パーティション削除後に expires_at のバッチ削除で消す。
+        """
+        await self.ensure_partitions(db, now)
+
+        result = await db.execute(text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'messages' AND c.relname LIKE :prefix"
+        ), {"prefix": f"{PARTITION_PREFIX}%"})
+        today = partition_name(now)
+        expired = sorted(name for (name,) in result if name < today)
+
+        deleted = 0
+        for name in expired:
+            # 受信箱・コンテンツはパーティション化されていないため、idのキーセットでバッチ削除
+            last_id = ""
+            while not self._stopping.is_set():
+                started = time.monotonic()
+                result = await db.execute(text(
+                    f"SELECT id, vector_id, thread_id FROM {name} WHERE id > :last_id ORDER BY id LIMIT :limit"
+                ), {"last_id": last_id, "limit": self.batch_size})
+                rows = result.all()
+                if not rows:
+                    break
+                await self._archive(db, [row.id for row in rows])
+                thread_ids, unread = await self._delete_dependents(db, [row.id for row in rows])
+                await db.commit()
+                await thread_version_service.bump(thread_ids | {row.thread_id for row in rows})
+                await unread_counter_service.decrement(unread)
+                await self._cleanup_vectors(rows)
+                deleted += len(rows)
+                last_id = rows[-1].id
+                await self._throttle(time.monotonic() - started)
+
+            if self._stopping.is_set():
+                break
+            await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            await db.commit()
+            logger.info(f"期限切れパーティションを削除しました: {name}")
+
+        if not self._stopping.is_set():
+            # 期限切れ日のパーティションは削除済みのため、残りはデフォルト・当日のパーティションのみを走査する
+            deleted += await self._sweep_batches(db, now)
+        return deleted
+
+    async def ensure_partitions(self, db, now: datetime, days_ahead: int = 2):
+        """今日から days_ahead 日先までの日次パーティションを作成（PostgreSQL）
+        
+        範囲に該当する行がデフォルトパーティションにあると PARTITION OF での作成は失敗するため、
+        空のテーブルへ行を移してからパーティションとしてアタッチする。
+        """
+        for offset in range(days_ahead + 1):
+            day = (now + timedelta(days=offset)).replace(hour=0, minute=0, second=0, microsecond=0)
+            name = partition_name(day)
+            await db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": PARTITION_LOCK_KEY})
+            exists = (await db.execute(text("SELECT to_regclass(:name)"), {"name": name})).scalar()
+            if exists is not None:
+                await db.commit()
+                continue
+
+            bounds = {"start": day, "end": day + timedelta(days=1)}
+            # 移動中にデフォルトパーティションへ同じ範囲の行が追加されないようにする
+            await db.execute(text(f"LOCK TABLE {DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE"))
+            await db.execute(text(f"CREATE TABLE {name} (LIKE messages INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+            moved = await db.execute(text(
+                f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+                f"WHERE expires_at >= :start AND expires_at < :end RETURNING *) "
+                f"INSERT INTO {name} SELECT * FROM moved"
+            ), bounds)
+            await db.execute(text(
+                f"ALTER TABLE messages ATTACH PARTITION {name} "
+                f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+            ))
+            await db.commit()
+            if moved.rowcount:
+                logger.info(f"デフォルトパーティションから {name} へ移動しました: {moved.rowcount}件")
+
+    async def run(self):
+        """停止されるまで一定間隔でスイープを繰り返す"""
+        while not self._stopping.is_set():
+            try:
+                deleted = await self.sweep_once()
+                if deleted:
+                    logger.info(f"期限切れメッセージを削除しました: {deleted}件")
+            except Exception as e:
+                logger.error(f"期限切れメッセージ削除エラー: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.interval_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        """バックグラウンドタスクとして開始（FastAPIスタートアップで呼び出し）"""
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """バックグラウンドタスクを停止"""
+        self._stopping.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+
+def create_sweeper() -> ExpiredMessageSweeper:
+    """設定からスイーパーを作成"""
+    settings = get_settings()
+    return ExpiredMessageSweeper(
+        batch_size=settings.sweeper_batch_size,
+        interval_seconds=settings.sweeper_interval_seconds,
+        duty_cycle=settings.sweeper_duty_cycle,
+        partitioned=settings.messages_partitioned,
+        archiver=create_archiver(),
+    )
@@ -0,0 +1,73 @@
+"""
+スレッドに属するメッセージ
+/messages で作成したメッセージは messages.thread_id に、/deliver・/deliver/fanout で配信した
+メッセージは inbox.thread_id にのみスレッドIDを持つ。スレッドのページ・件数・検索は両方を対象にする。
+
+ページは2系統をそれぞれのインデックス順にキーセットで limit 件ずつ読み、和集合から limit 件を選ぶ
+（作成: idx_messages_thread_created、配信: idx_inbox_thread_message。スレッドの大きさに依存しない）。
+"""
+
+from typing import Optional, Union
+
+from sqlalchemy import func, or_, select, union
+from sqlalchemy.sql import CompoundSelect, Select
+
+from app.models import Inbox, Message
+from app.pagination import keyset_query
+
+
+def in_thread(thread_id: str):
+    """スレッドに作成された、またはスレッドへ配信されたメッセージの条件"""
+    return or_(
+        Message.thread_id == thread_id,
+        Message.id.in_(select(Inbox.message_id).where(Inbox.thread_id == thread_id))
+    )
+
+
+def in_threads(thread_ids: Union[Select, CompoundSelect]):
+    """いずれかのスレッドに作成された、またはスレッドへ配信されたメッセージの条件"""
+    return or_(
+        Message.thread_id.in_(thread_ids),
+        Message.id.in_(select(Inbox.message_id).where(Inbox.thread_id.in_(thread_ids)))
+    )
+
+
+def thread_page_keys(thread_id: str, cursor: Optional[str], limit: int):
+    """ページに載り得るメッセージの (created_at, id) を2系統から limit 件ずつ取得するサブクエリ
+
+    同じメッセージの複数の配信（fanout）は GROUP BY で1件にまとめる（インデックス順のまま集約される）。
+    """
+    created, _ = keyset_query(
+        select(Message.created_at.label("created_at"), Message.id.label("id"))
+        .where(Message.thread_id == thread_id),
+        cursor, Message.created_at, Message.id
+    )
+    delivered, _ = keyset_query(
+        select(Inbox.message_created_at.label("created_at"), Inbox.message_id.label("id"))
+        .where(Inbox.thread_id == thread_id)
+        .group_by(Inbox.message_created_at, Inbox.message_id),
+        cursor, Inbox.message_created_at, Inbox.message_id
+    )
+    # SQLite は UNION の各項に ORDER BY / LIMIT を書けないためサブクエリで包む
+    return union(
+        select(created.limit(limit).subquery()),
+        select(delivered.limit(limit).subquery()),
+    ).subquery("thread_page_keys")
+
+
+def thread_page_query(query: Select, thread_id: str, cursor: Optional[str], limit: int):
+    """Message を含むクエリをスレッドのページ（limit 件）に絞り込み、(クエリ, 向き) を返す"""
+    keys = thread_page_keys(thread_id, cursor, limit)
+    query, direction = keyset_query(
+        query.join(keys, keys.c.id == Message.id), cursor, Message.created_at, Message.id
+    )
+    return query.limit(limit), direction
+
+
+def count_thread_messages(thread_id: str) -> Select:
+    """スレッドのメッセージ数（2系統ともインデックスのみで数えられる）"""
+    message_ids = union(
+        select(Message.id).where(Message.thread_id == thread_id),
+        select(Inbox.message_id).where(Inbox.thread_id == thread_id),
+    ).subquery()
+    return select(func.count()).select_from(message_ids)
@@ -0,0 +1,64 @@
+"""
+リクエスト内の処理時間の内訳（Server-Timing）
+パイプラインの各段階を span() で囲むと、その所要時間が Server-Timing ヘッダーで返され、
+Prometheus の段階別ヒストグラムにも記録される
+
+    with span("llm"):
+        text, confidence = await llm_service.reconstruct_message(...)
+
+    Server-Timing: retrieval;dur=12.4, llm;dur=830.1, total;dur=851.0
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+from app.config import get_settings
+from app.metrics import observe_stage
+
+# 現在のリクエストで記録した (段階, ミリ秒)（リクエスト外では None）
+_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("server_timing_spans", default=None)
+
+
+@contextmanager
+def span(name: str):
+    """処理の1段階の所要時間を記録"""
+    started = time.perf_counter()
+    try:
+        with observe_stage(name):
+            yield
+    finally:
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((name, (time.perf_counter() - started) * 1000))
+
+
+def current_timings() -> Dict[str, float]:
+    """現在のリクエストの段階別の所要時間（ミリ秒、同じ段階は合計）"""
+    timings: Dict[str, float] = {}
+    for name, duration in _spans.get() or []:
+        timings[name] = round(timings.get(name, 0.0) + duration, 2)
+    return timings
+
+
+def format_server_timing(spans: List[Tuple[str, float]], total_ms: float) -> str:
+    return ", ".join([f"{name};dur={duration:.2f}" for name, duration in spans] + [f"total;dur={total_ms:.2f}"])
+
+
+async def server_timing_middleware(request: Request, call_next):
+    """Server-Timing ヘッダーを付与するミドルウェア"""
+    if not get_settings().server_timing_enabled:
+        return await call_next(request)
+    started = time.perf_counter()
+    # エンドポイントは別タスクで実行されるため、同じリストを共有させる
+    spans: List[Tuple[str, float]] = []
+    token = _spans.set(spans)
+    try:
+        response = await call_next(request)
+    finally:
+        _spans.reset(token)
+    response.headers["Server-Timing"] = format_server_timing(spans, (time.perf_counter() - started) * 1000)
+    return response
@@ -0,0 +1,81 @@
+"""
+入力中インジケーターの間引き
+(送信者, 受信者) ごとに入力中状態を保持し、キー入力ごとのイベントを
+状態変化時と一定間隔の再通知だけに絞る。更新の途絶えた状態は自動で終了させる。
+"""
+
+import time
+from typing import Callable, Dict, List, Tuple
+
+# (送信者, 受信者)
+TypingKey = Tuple[str, str]
+
+
+class TypingCoalescer:
+    """入力中状態の間引きと期限切れ管理"""
+
+    def __init__(
+        self,
+        refresh_seconds: float = 3.0,
+        timeout_seconds: float = 6.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        # 入力中が続く間、受信側の表示を維持するための再通知間隔
+        self.refresh_seconds = refresh_seconds
+        # この秒数更新がなければ入力終了とみなす
+        self.timeout_seconds = timeout_seconds
+        self.clock = clock
+        # 入力中のペア -> (最後に通知した時刻, 最後に更新を受けた時刻)
+        self._typing: Dict[TypingKey, List[float]] = {}
+        # 統計（監視用）
+        self.emitted = 0
+        self.suppressed = 0
+        self.expired = 0
+
+    def update(self, sender_id: str, recipient_id: str, is_typing: bool) -> bool:
+        """クライアントからの入力中イベントを反映し、受信者へ通知すべきかを返す"""
+        key = (sender_id, recipient_id)
+        now = self.clock()
+        state = self._typing.get(key)
+
+        if is_typing:
+            if state is None:
+                self._typing[key] = [now, now]
+                self.emitted += 1
+                return True
+            state[1] = now
+            if now - state[0] >= self.refresh_seconds:
+                state[0] = now
+                self.emitted += 1
+                return True
+        elif state is not None:
+            del self._typing[key]
+            self.emitted += 1
+            return True
+
+        self.suppressed += 1
+        return False
+
+    def expire(self) -> List[TypingKey]:
+        """更新が途絶えたペアを入力終了にし、受信者へ終了を通知すべきペアを返す"""
+        deadline = self.clock() - self.timeout_seconds
+        stale = [key for key, (_, updated_at) in self._typing.items() if updated_at <= deadline]
+        for key in stale:
+            del self._typing[key]
+        self.expired += len(stale)
+        return stale
+
+    def forget_sender(self, sender_id: str) -> List[TypingKey]:
+        """送信者がオフラインになった場合に入力中状態を終了し、通知すべきペアを返す"""
+        keys = [key for key in self._typing if key[0] == sender_id]
+        for key in keys:
+            del self._typing[key]
+        return keys
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "typing_pairs": len(self._typing),
+            "emitted": self.emitted,
+            "suppressed": self.suppressed,
+            "expired": self.expired,
+        }
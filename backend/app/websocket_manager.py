@@ -1,44 +1,112 @@
 """
 WebSocket接続管理
 リアルタイム通信とユーザー状態管理
+
+複数ワーカー・複数ノード構成では Socket.IO の AsyncRedisManager で emit を全ワーカーに中継し、
+各ユーザーの接続は user:{user_id} ルームに参加させて宛先ワーカーを意識せずに送信する。
+オンライン状態は presence_service（Redis）で全ワーカーと共有する。
 """
 
 import asyncio
-import json
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any, Optional, Set
 from datetime import datetime
-import redis.asyncio as redis
 import socketio
 import logging
-import os
+
+from app.config import get_settings
+from app.connection_registry import ConnectionRegistry
+from app.database import AsyncSessionLocal
+from app.presence_rooms import PresenceDeltaBatcher, load_user_rooms
+from app.socketio_batching import BatchingManager, create_batching_manager
+from app.typing_coalescer import TypingCoalescer
+from app.services.offline_queue_service import INBOX_EVENT_PREFIX, offline_queue_service
+from app.services.presence_service import presence_service, PRESENCE_TTL_SECONDS
+
+# msgpack（任意依存）: Socket.IO イベントをバイナリで送る場合に使用
+try:
+    import msgpack  # noqa: F401
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
 
 logger = logging.getLogger(__name__)
 
+
+def user_room(user_id: str) -> str:
+    """ユーザーの全接続が参加するルーム名"""
+    return f"user:{user_id}"
+
+
+def create_client_manager() -> BatchingManager:
+    """クライアントマネージャーを作成
+    
+    SOCKETIO_REDIS_MANAGER=true の場合はRedis経由で全ワーカーにemitを中継する。
+    SOCKETIO_BATCH_WINDOW_MS > 0 の場合は同じ接続宛てのイベントをまとめて送信する。
+    接続ごとの送信キューは上限付きで、受信の遅い接続は切断する。
+    """
+    settings = get_settings()
+    url = None
+    if settings.socketio_redis_manager:
+        url = f"redis://{settings.redis_host}:{settings.redis_port}/{settings.redis_db}"
+    return create_batching_manager(
+        url, settings.socketio_redis_channel, settings.socketio_batch_window_ms, settings.socketio_batch_max_events,
+        max_queue=settings.socketio_max_queue,
+        max_backlog=settings.socketio_max_backlog,
+        slow_consumer_seconds=settings.socketio_slow_consumer_seconds
+    )
+
+
+def resolve_serializer(name: str) -> str:
+    """Socket.IO のシリアライザー名（msgpack が未インストールなら default に戻す）"""
+    if name == "msgpack" and not MSGPACK_AVAILABLE:
+        logger.warning("msgpack が未インストールのため、Socket.IO は JSON で送信します")
+        return "default"
+    return name
+
+
 class SocketManager:
     """Socket.IO接続とメッセージングの管理"""
     
-    def __init__(self):
-        # Socket.IOサーバー
+    def __init__(self, client_manager=None, presence=None, session_factory=AsyncSessionLocal, offline_queue=None,
+                 serializer: str = "default"):
+        # Socket.IOサーバー（client_manager が None ならワーカー内のみで配信）
         self.sio = socketio.AsyncServer(
             async_mode='asgi',
             cors_allowed_origins=[
                 "http://localhost:3000",
                 "http://127.0.0.1:3000"
-            ]
+            ],
+            client_manager=client_manager,
+            serializer=resolve_serializer(serializer)
         )
         self.app = socketio.ASGIApp(self.sio)
         
-        # 接続されたユーザー
-        self.connected_users: Dict[str, str] = {}  # user_id -> sid
+        # このワーカーに接続された端末（user_id <-> sid の双方向インデックス）
+        self.connections = ConnectionRegistry()
+        
+        # 全ワーカー共有のオンライン状態
+        self.presence = presence or presence_service
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        
+        # プレゼンスルーム（スレッド・家族）と差分配信
+        settings = get_settings()
+        self.session_factory = session_factory  # None ならスレッドルームを使わない
+        self.user_rooms: Dict[str, Set[str]] = {}  # user_id -> 参加しているプレゼンスルーム
+        self.presence_deltas = PresenceDeltaBatcher()
+        self.presence_delta_interval = settings.presence_delta_interval_ms / 1000
+        self.thread_room_max_members = settings.presence_thread_room_max_members
+        self._presence_task: Optional[asyncio.Task] = None
         
-        # Redis接続（Pub/Sub用）
-        self.r = redis.Redis(
-            host=os.getenv("REDIS_HOST", "redis"),
-            port=int(os.getenv("REDIS_PORT", 6379)),
-            db=0,
-            decode_responses=True
+        # オフライン中のイベント（再接続時にまとめて再送）
+        self.offline_queue = offline_queue or offline_queue_service
+        self.replay_batch_size = settings.offline_replay_batch_size
+        
+        # 入力中イベントの間引き（状態変化と一定間隔の再通知のみ送信）
+        self.typing = TypingCoalescer(
+            refresh_seconds=settings.typing_refresh_seconds,
+            timeout_seconds=settings.typing_timeout_seconds,
         )
-        self.pubsub = self.r.pubsub()
+        self._typing_task: Optional[asyncio.Task] = None
         
         # Socket.IOイベントハンドラーを設定
         self.setup_event_handlers()
@@ -52,19 +120,25 @@ class SocketManager:
         @self.sio.on('connect')
         async def handle_connect(sid, environ):
             print(f"WebSocket connected: {sid}")
+            await self.sio.save_session(sid, {'user_agent': environ.get('HTTP_USER_AGENT')})
             await self.sio.emit('connection_established', {'sid': sid}, room=sid)
         
         @self.sio.on('disconnect')
         async def handle_disconnect(sid):
-            user_id = None
-            for uid, current_sid in self.connected_users.items():
-                if current_sid == sid:
-                    user_id = uid
-                    break
-            if user_id:
-                del self.connected_users[user_id]
+            session, last = self.connections.unregister(sid)
+            if session:
+                user_id = session.user_id
                 print(f"WebSocket disconnected: {sid}, User: {user_id}")
-                await self.broadcast_user_status(user_id, 'offline')
+                # 他のワーカー・端末に接続が残っていればオフラインにしない
+                went_offline = await self.presence.disconnect(user_id, sid)
+                if went_offline is None:
+                    went_offline = last
+                if went_offline:
+                    for _, recipient_id in self.typing.forget_sender(user_id):
+                        await self.emit_typing(user_id, recipient_id, False)
+                    await self.broadcast_user_status(user_id, 'offline')
+                if last:
+                    self.user_rooms.pop(user_id, None)
             else:
                 print(f"WebSocket disconnected: {sid}")
         
@@ -72,118 +146,318 @@ class SocketManager:
         async def handle_user_register(sid, data):
             user_id = data.get('user_id')
             if user_id:
-                self.connected_users[user_id] = sid
+                socket_session = await self.sio.get_session(sid)
+                previous_user_id = self.connections.user_of(sid)
+                if previous_user_id and previous_user_id != user_id:
+                    # 同じ接続で別ユーザーとして登録し直す場合は元のユーザーのルームから外す
+                    for room in {user_room(previous_user_id), *self.user_rooms.get(previous_user_id, ())}:
+                        await self.sio.leave_room(sid, room)
+                    await self.presence.disconnect(previous_user_id, sid)
+                first, replaced = self.connections.register(
+                    sid, user_id,
+                    device_id=data.get('device_id'),
+                    user_agent=socket_session.get('user_agent')
+                )
+                await self.sio.enter_room(sid, user_room(user_id))
+                rooms = await self.join_presence_rooms(sid, user_id)
                 print(f"User {user_id} registered with SID {sid}")
-                await self.broadcast_user_status(user_id, 'online')
-                await self.send_online_users(sid)
+                if replaced is not None:
+                    # 同じ端末の再接続: 切断が検知されていない古い接続を閉じる
+                    await self.presence.disconnect(user_id, replaced.sid)
+                    await self.sio.disconnect(replaced.sid)
+                came_online = await self.presence.connect(user_id, sid)
+                if came_online is None:
+                    came_online = first
+                if came_online:
+                    await self.broadcast_user_status(user_id, 'online')
+                await self.send_presence_snapshot(sid, rooms)
+                # inbox_cursor: 前回までに ack した受信箱ID（受信箱からの再送を続きから行う）
+                await self.replay_missed_events(sid, user_id, inbox_after=data.get('inbox_cursor'))
             else:
                 print(f"User registration failed for SID {sid}: no user_id provided")
         
         @self.sio.on('typing_status')
         async def handle_typing_status(sid, data):
-            user_id = None
-            for uid, current_sid in self.connected_users.items():
-                if current_sid == sid:
-                    user_id = uid
-                    break
+            user_id = self.connections.user_of(sid)
             if user_id:
                 recipient_id = data.get('recipient_id')
-                is_typing = data.get('is_typing')
-                if recipient_id and recipient_id in self.connected_users:
-                    await self.sio.emit('user_typing', {
-                        'user_id': user_id, 
-                        'is_typing': is_typing
-                    }, room=self.connected_users[recipient_id])
+                is_typing = bool(data.get('is_typing'))
+                if recipient_id:
+                    # キー入力ごとのイベントは状態変化・再通知のタイミング以外は送らない
+                    if self.typing.update(user_id, recipient_id, is_typing):
+                        await self.emit_typing(user_id, recipient_id, is_typing)
                 else:
                     # Optionally broadcast to all connected users in a chat room
                     pass
         
         @self.sio.on('ping')
         async def handle_ping(sid, data):
+            self.connections.touch(sid)
             await self.sio.emit('pong', {'timestamp': data.get('timestamp')}, room=sid)
         
+        @self.sio.on('ack_events')
+        async def handle_ack_events(sid, data):
+            # 再送したイベントの受信確認（last_id までを削除し、残りがあれば続きを送信）
+            user_id = self.connections.user_of(sid)
+            last_id = (data or {}).get('last_id')
+            if not user_id or not last_id:
+                return
+            if last_id.startswith(INBOX_EVENT_PREFIX):
+                # 受信箱から再構成したイベントは削除せず、ack したIDの後から続きを送る
+                await self.replay_missed_events(sid, user_id, inbox_after=last_id[len(INBOX_EVENT_PREFIX):])
+            elif await self.offline_queue.ack(user_id, last_id):
+                await self.replay_missed_events(sid, user_id)
+        
+        @self.sio.on('get_presence')
+        async def handle_get_presence(sid, data=None):
+            # 差分のバージョンが飛んだクライアントの再同期（新しく参加したスレッドも反映）
+            user_id = self.connections.user_of(sid)
+            if user_id:
+                rooms = await self.join_presence_rooms(sid, user_id)
+                await self.send_presence_snapshot(sid, rooms)
+        
         @self.sio.on('get_online_users')
-        async def handle_get_online_users(sid, data):
-            await self.send_online_users(sid)
+        async def handle_get_online_users(sid, data=None):
+            await handle_get_presence(sid, data)
+        
+        @self.sio.on('get_devices')
+        async def handle_get_devices(sid, data):
+            # このワーカーに接続している自分の端末一覧
+            user_id = self.connections.user_of(sid)
+            if user_id:
+                await self.sio.emit('devices', {
+                    'devices': [
+                        {**device.to_dict(), 'queue_depth': self.queue_depth(device.sid)}
+                        for device in self.connections.devices_of(user_id)
+                    ]
+                }, room=sid)
+    
+    async def emit_typing(self, user_id: str, recipient_id: str, is_typing: bool):
+        """入力中状態を受信者へ送信（受信者が接続しているワーカーに関わらずルーム宛て）"""
+        await self.sio.emit('user_typing', {
+            'user_id': user_id, 
+            'is_typing': is_typing
+        }, room=user_room(recipient_id))
+    
+    async def online_among(self, user_ids: Iterable[str]) -> Set[str]:
+        """指定ユーザーのうち、いずれかのワーカーに接続しているユーザーを返す"""
+        user_ids = list(user_ids)
+        online = await self.presence.online(user_ids)
+        if online is None:
+            # Redis利用不可: このワーカーの接続のみで判定
+            return {user_id for user_id in user_ids if self.connections.is_connected(user_id)}
+        return online
     
     async def broadcast_new_message(self, message_data: Dict[str, Any], sender_id: str, recipient_id: str):
         """新しいメッセージをブロードキャスト"""
+        online = await self.online_among([recipient_id, sender_id])
+        
         # Send to recipient
-        if recipient_id in self.connected_users:
-            await self.sio.emit('new_message', message_data, room=self.connected_users[recipient_id])
+        if recipient_id in online:
+            await self.sio.emit('new_message', message_data, room=user_room(recipient_id))
             print(f"Message {message_data.get('message_id')} sent to recipient {recipient_id} via WebSocket.")
         else:
-            print(f"Recipient {recipient_id} not online, message not sent via WebSocket.")
+            await self.offline_queue.enqueue(recipient_id, 'new_message', message_data)
+            print(f"Recipient {recipient_id} not online, message queued for replay on reconnect.")
         
         # Optionally send a delivery confirmation to sender
-        if sender_id in self.connected_users:
+        if sender_id in online:
             await self.sio.emit('message_delivered', {
                 'message_id': message_data.get('message_id')
-            }, room=self.connected_users[sender_id])
+            }, room=user_room(sender_id))
+    
+    async def notify_deliveries(self, delivery_data: Dict[str, Any], deliveries: Dict[str, str]):
+        """複数受信者への配信通知をまとめて送信（recipient_id -> delivery_id）"""
+        online = await self.online_among(deliveries)
+        emits = [
+            self.sio.emit('new_delivery', {
+                **delivery_data,
+                'delivery_id': delivery_id
+            }, room=user_room(recipient_id))
+            for recipient_id, delivery_id in deliveries.items()
+            if recipient_id in online
+        ]
+        if emits:
+            await asyncio.gather(*emits)
+        # オフラインの受信者には再接続時に再送
+        await self.offline_queue.enqueue_many([
+            (recipient_id, 'new_delivery', {**delivery_data, 'delivery_id': delivery_id})
+            for recipient_id, delivery_id in deliveries.items()
+            if recipient_id not in online
+        ])
+        print(f"Delivery of message {delivery_data.get('message_id')} notified to {len(emits)}/{len(deliveries)} recipients via WebSocket.")
+
+    async def replay_missed_events(self, sid: str, user_id: str, inbox_after: Optional[str] = None):
+        """オフライン中のイベントを1回のemitでまとめて再送
+        
+        クライアントは受け取った最後のIDを ack_events で返し、確認済みのイベントは削除される。
+        Redis利用不可の場合は受信箱の未読行から配信通知を再構成する。受信箱は削除されないため、
+        inbox_after（クライアントが最後に ack した受信箱ID）より後の行のみを送る。
+        """
+        events = await self.offline_queue.pending(user_id, self.replay_batch_size + 1)
+        if events is None and self.session_factory is not None:
+            try:
+                async with self.session_factory() as db:
+                    events = await self.offline_queue.pending_from_inbox(
+                        db, user_id, self.replay_batch_size + 1, after=inbox_after
+                    )
+            except Exception as e:
+                logger.error(f"未配信イベント取得エラー: {e}")
+                return
+        if not events:
+            return
+        has_more = len(events) > self.replay_batch_size
+        events = events[:self.replay_batch_size]
+        await self.sio.emit('missed_events', {
+            'events': [{'id': event_id, 'event': event, 'data': data} for event_id, event, data in events],
+            'has_more': has_more
+        }, room=sid)
     
     async def broadcast_user_status(self, user_id: str, status: str):
-        """ユーザーのオンライン状態をブロードキャスト"""
-        await self.sio.emit('user_status', {
-            'user_id': user_id, 
-            'status': status
-        }, skip_sid=self.connected_users.get(user_id))
+        """ユーザーのオンライン状態の変化を、ルームを共有するユーザー向けの差分に追加
+        
+        差分は presence_delta_interval ごとにまとめて送信する（flush_presence_deltas）。
+        """
+        self.presence_deltas.add(self.user_rooms.get(user_id, ()), user_id, status)
         print(f"User {user_id} is now {status}")
     
-    async def send_online_users(self, sid: str):
-        """オンラインユーザー一覧を送信"""
-        online_user_ids = list(self.connected_users.keys())
-        await self.sio.emit('online_users', {'users': online_user_ids}, room=sid)
+    async def load_presence_rooms(self, user_id: str) -> Dict[str, Set[str]]:
+        """ユーザーのプレゼンスルームとメンバーを取得（DB障害時は家族ルームのみ）"""
+        if self.session_factory is None:
+            return await load_user_rooms(None, user_id)
+        try:
+            async with self.session_factory() as db:
+                return await load_user_rooms(db, user_id, self.thread_room_max_members)
+        except Exception as e:
+            logger.error(f"プレゼンスルーム取得エラー: {e}")
+            return await load_user_rooms(None, user_id)
+    
+    async def join_presence_rooms(self, sid: str, user_id: str) -> Dict[str, Set[str]]:
+        """接続をユーザーのプレゼンスルームに参加させ、ルームとメンバーを返す"""
+        rooms = await self.load_presence_rooms(user_id)
+        for room in rooms:
+            await self.sio.enter_room(sid, room)
+        self.user_rooms[user_id] = self.user_rooms.get(user_id, set()) | set(rooms)
+        return rooms
+    
+    async def flush_presence_deltas(self):
+        """溜まった差分をルームごとに1回のemitで送信"""
+        pending = self.presence_deltas.drain()
+        if not pending:
+            return
+        versions = await self.presence.bump_versions(pending)
+        if versions is None:
+            versions = self.presence_deltas.local_versions(pending, bump=True)
+        await asyncio.gather(*(
+            self.sio.emit('presence_delta', {
+                'room': room,
+                'version': versions[room],
+                'changes': [{'user_id': user_id, 'status': status} for user_id, status in changes.items()]
+            }, room=room)
+            for room, changes in pending.items()
+        ))
+    
+    async def send_presence_snapshot(self, sid: str, rooms: Dict[str, Set[str]]):
+        """ルームごとのオンラインメンバーとバージョンを送信（再同期用）
+        
+        クライアントは snapshot のバージョンより大きい差分のみを適用し、
+        バージョンが飛んだ場合は get_presence で再取得する。
+        """
+        # 先にバージョンを読む（間に届く差分はバージョンが大きいため取りこぼさない）
+        versions = await self.presence.get_versions(rooms)
+        if versions is None:
+            versions = self.presence_deltas.local_versions(rooms, bump=False)
+        members = set().union(*rooms.values()) if rooms else set()
+        online = await self.online_among(members)
+        await self.sio.emit('presence_snapshot', {
+            'rooms': {
+                room: {'version': versions[room], 'online': sorted(room_members & online)}
+                for room, room_members in rooms.items()
+            }
+        }, room=sid)
+        # 従来クライアント向け: ルームを共有するオンラインユーザー
+        await self.sio.emit('online_users', {'users': sorted(online)}, room=sid)
+    
+    def queue_depth(self, sid: str) -> int:
+        """接続の送信待ちイベント数"""
+        if isinstance(self.sio.manager, BatchingManager):
+            return self.sio.manager.queue_depth(sid)
+        return 0
+    
+    def connection_stats(self) -> Dict[str, Any]:
+        """このワーカーの接続・送信キューの状態（監視用）"""
+        manager = self.sio.manager
+        return {
+            'connections': len(self.connections),
+            'users': len(self.connections.users()),
+            'queue_depths': {sid: self.queue_depth(sid) for sid in self.connections.sid_users()},
+            'outbound': manager.stats() if isinstance(manager, BatchingManager) else {},
+            'typing': self.typing.stats(),
+        }
     
     def get_user_id_from_sid(self, sid: str) -> str | None:
         """SIDからユーザーIDを取得"""
-        for user_id, connected_sid in self.connected_users.items():
-            if connected_sid == sid:
-                return user_id
-        return None
+        return self.connections.user_of(sid)
     
     async def initialize_redis(self):
-        """Redis接続を初期化（FastAPIスタートアップで呼び出し）"""
+        """共有プレゼンスの更新を開始（FastAPIスタートアップで呼び出し）
+        
+        ワーカー間のemit中継は AsyncRedisManager が行う。
+        """
         if self._redis_initialized:
             return
-        
-        try:
-            await self.pubsub.subscribe('chat_messages')
-            # Redisメッセージを処理するタスクを開始
-            asyncio.create_task(self._handle_redis_messages())
-            self._redis_initialized = True
-            logger.info("Redis接続を初期化しました")
-        except Exception as e:
-            logger.error(f"Redis接続エラー: {e}")
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._typing_task = asyncio.create_task(self._expire_typing())
+        self._presence_task = asyncio.create_task(self._flush_presence())
+        self._redis_initialized = True
+        logger.info("共有プレゼンスの更新を開始しました")
     
-    async def _init_redis(self):
-        """Redis接続を初期化（内部用）"""
-        await self.initialize_redis()
+    async def shutdown(self):
+        """プレゼンス更新を停止し、このワーカーの接続を共有プレゼンスから削除"""
+        for task in (self._heartbeat_task, self._typing_task, self._presence_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._heartbeat_task = self._typing_task = self._presence_task = None
+        for sid, user_id in self.connections.sid_users().items():
+            await self.presence.disconnect(user_id, sid)
+        if isinstance(self.sio.manager, BatchingManager):
+            await self.sio.manager.flush_all()
+        self._redis_initialized = False
     
-    async def _handle_redis_messages(self):
-        """Redisからのメッセージを処理"""
-        try:
-            async for message in self.pubsub.listen():
-                if message["type"] == "message":
-                    data = json.loads(message["data"])
-                    await self._process_redis_message(data)
-        except Exception as e:
-            logger.error(f"Redisメッセージ処理エラー: {e}")
-    
-    async def _process_redis_message(self, data: dict):
-        """Redisメッセージを処理"""
-        message_type = data.get("type")
-        
-        if message_type == "new_message":
-            await self.broadcast_new_message(
-                data["message_data"],
-                data["sender_id"],
-                data["recipient_id"]
-            )
-        elif message_type == "user_status":
-            await self.broadcast_user_status(
-                data["user_id"],
-                data["status"]
-            )
+    async def _heartbeat(self):
+        """このワーカーの接続の有効期限を定期的に延長（異常終了したワーカーの接続は期限切れで消える）"""
+        while True:
+            await asyncio.sleep(PRESENCE_TTL_SECONDS / 3)
+            try:
+                await self.presence.refresh(self.connections.sid_users())
+            except Exception as e:
+                logger.error(f"プレゼンス更新エラー: {e}")
+
+    async def _expire_typing(self):
+        """更新が途絶えた入力中状態を終了し、受信者に通知"""
+        while True:
+            await asyncio.sleep(1)
+            try:
+                for user_id, recipient_id in self.typing.expire():
+                    await self.emit_typing(user_id, recipient_id, False)
+            except Exception as e:
+                logger.error(f"入力中状態の期限切れ処理エラー: {e}")
+
+    async def _flush_presence(self):
+        """オンライン状態の差分を一定間隔でまとめて送信"""
+        while True:
+            await asyncio.sleep(self.presence_delta_interval)
+            try:
+                await self.flush_presence_deltas()
+            except Exception as e:
+                logger.error(f"プレゼンス差分送信エラー: {e}")
 
 # グローバルインスタンス
-websocket_manager = SocketManager()
\ No newline at end of file
+websocket_manager = SocketManager(
+    client_manager=create_client_manager(),
+    serializer=get_settings().socketio_serializer
+)
\ No newline at end of file
@@ -0,0 +1,43 @@
+"""
+gunicorn 設定
+PROMETHEUS_MULTIPROC_DIR が設定されている場合、ワーカーごとのメトリクスファイルを管理する
+
+SQLite本番プロファイル（SQLITE_TUNED=true）の単一ライターはプロセスごとに動くため、
+複数ワーカーでは書き込みが直列化されず "database is locked" が再発する。
+このプロファイルでは -w の指定に関わらずワーカー数を1にする（並列性はイベントループで確保する）。
+"""
+
+import glob
+import os
+
+
+def _sqlite_single_writer() -> bool:
+    """SQLite本番プロファイルか（app.database と同じ判定）"""
+    from app.config import get_settings
+    database_url = os.getenv("DATABASE_URL", "sqlite:///./data/sensechat.db")
+    return database_url.startswith("sqlite") and get_settings().sqlite_tuned
+
+
+def on_starting(server):
+    if server.num_workers > 1 and _sqlite_single_writer():
+        server.log.warning(
+            f"SQLITE_TUNED=true では単一ライターのためワーカー数を1にします（指定: {server.num_workers}）"
+        )
+        server.num_workers = 1
+
+    # 前回の起動で残ったワーカーのメトリクスを消す
+    multiproc_dir = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(multiproc_dir, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):
+    # 終了したワーカーの live* ゲージを集計から外す
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        try:
+            from prometheus_client import multiprocess
+        except ImportError:
+            return
+        multiprocess.mark_process_dead(worker.pid)
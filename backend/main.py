@@ -10,12 +10,20 @@ import uvicorn
 import os
 from contextlib import asynccontextmanager
 
-from app.database import init_db
+from app.database import init_db, close_db
 from app.config import get_settings
-from app.routers import auth, messages, users, health
+from app.routers import auth, messages, users, health, inbox, search
 from app.websocket_manager import websocket_manager
 from app.middleware import logging_middleware, rate_limit_middleware
+from app.timing import server_timing_middleware
 from app.exceptions import setup_exception_handlers
+from app.sweeper import create_sweeper
+from app.db_writer import db_writer, message_inserter
+from app.services.unread_counter_service import unread_counter_service
+from app.services.user_directory import user_directory
+from app.services.thread_version_service import thread_version_service
+from app.services.vector_service import vector_removals
+from app import metrics
 
 # アプリケーション起動時の処理
 @asynccontextmanager
@@ -26,6 +34,17 @@ async def lifespan(app: FastAPI):
     # データベース初期化
     await init_db()
     
+    # SQLite本番プロファイルの単一ライター開始
+    if db_writer is not None:
+        db_writer.start()
+    
+    # メッセージINSERTの write-behind バッファ開始（MESSAGE_WRITE_BEHIND=true の場合）
+    if message_inserter is not None:
+        message_inserter.start()
+    
+    # ユーザーディレクトリの読み込みとDB同期
+    await user_directory.start()
+    
     # AI/MLサービスの初期化
     from app.services.embedding_service import EmbeddingService
     from app.services.llm_api_service import LLMAPIService
@@ -34,15 +53,52 @@ async def lifespan(app: FastAPI):
     app.state.embedding_service = EmbeddingService()
     app.state.llm_api_service = LLMAPIService()
     
-    # WebSocketマネージャーのRedis初期化
+    # 他プロセス（スイーパー等）からのベクトル削除通知の購読開始
+    vector_removals.start()
+    
+    # WebSocketマネージャーの共有プレゼンス更新開始
     await websocket_manager.initialize_redis()
     
+    # 期限切れメッセージのスイーパー開始
+    sweeper = None
+    if settings.sweeper_enabled:
+        sweeper = create_sweeper()
+        sweeper.start()
+    
+    # 未読カウンターの突き合わせジョブ開始
+    unread_counter_service.start(settings.unread_reconcile_interval_seconds)
+    
+    # スレッドバージョンのリース更新開始（障害中の変更を書き戻すまで他ワーカーの304を止める）
+    thread_version_service.start()
+    
+    # Prometheus メトリクスの定期更新（イベントループの遅延・接続数・実行キュー）
+    if db_writer is not None:
+        metrics.runtime_monitor.queue_depths["db_writer"] = db_writer.queue_depth
+    if message_inserter is not None:
+        metrics.runtime_monitor.queue_depths["message_inserter"] = message_inserter.queue_depth
+    metrics.runtime_monitor.socket_stats = websocket_manager.connection_stats
+    metrics.runtime_monitor.start()
+    
     print("✅ 初期化完了")
     
     yield
     
     # 終了時
     print("🛑 SenseChat MVP Backend を停止しています...")
+    if sweeper:
+        await sweeper.stop()
+    await metrics.runtime_monitor.stop()
+    await websocket_manager.shutdown()
+    await unread_counter_service.stop()
+    await thread_version_service.stop()
+    await user_directory.stop()
+    await vector_removals.stop()
+    if message_inserter is not None:
+        # バッファ中のメッセージを書き込んでから停止
+        await message_inserter.stop()
+    if db_writer is not None:
+        await db_writer.stop()
+    await close_db()
 
 # アプリケーション設定
 app = FastAPI(
@@ -61,12 +117,21 @@ app.add_middleware(
     allow_origins=settings.cors_origins,
     allow_credentials=True,
     allow_methods=["*"],
-    allow_headers=["*"]
+    allow_headers=["*"],
+    # フロントエンドから段階別の処理時間を参照できるようにする
+    expose_headers=["Server-Timing"]
 )
 
 # カスタムミドルウェア
 app.middleware("http")(logging_middleware)
 app.middleware("http")(rate_limit_middleware)
+if settings.prometheus_enabled:
+    if metrics.PROMETHEUS_AVAILABLE:
+        app.middleware("http")(metrics.metrics_middleware)
+        app.include_router(metrics.router, tags=["metrics"])
+    else:
+        print("⚠️  PROMETHEUS_ENABLED=true ですが prometheus_client が未インストールのため /metrics は無効です")
+app.middleware("http")(server_timing_middleware)
 
 # 例外ハンドラーの設定
 setup_exception_handlers(app)
@@ -76,6 +141,8 @@ app.include_router(health.router, prefix="/api/v1", tags=["health"])
 app.include_router(auth.router, prefix="/api/v1/auth", tags=["auth"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["users"])
 app.include_router(messages.router, prefix="/api/v1", tags=["messages"])
+app.include_router(inbox.router, prefix="/api/v1/inbox", tags=["inbox"])
+app.include_router(search.router, prefix="/api/v1", tags=["search"])
 # Socket.IO (WebSocket) をFastAPIに直接マウント
 app.mount("/api/v1/ws", websocket_manager.app)
 
@@ -140,6 +140,7 @@ def migrate_database():
         print("   - Messageテーブルにexpires_atカラムを追加")
         print("   - MessageContentテーブルを追加（サーバー側永続化）")
         print("   - クライアント側保存 + サーバー側永続化対応完了")
+        print("以降のスキーマ変更（インデックス等）は alembic upgrade head で適用してください")
         
     except Exception as e:
         print(f"マイグレーションエラー: {e}")
@@ -0,0 +1,98 @@
+"""Initial schema
+
+Revision ID: 001
+Revises:
+Create Date: 2026-10-19 00:00:00.000000
+
+init_db()（create_all）や migrate_db.py で作成済みのDBにも適用できるよう、
+既存テーブルはスキップする。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name: str) -> bool:
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('users'):
+        op.create_table(
+            'users',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('name', sa.String(), nullable=False),
+            sa.Column('language', sa.String()),
+            sa.Column('style_preset', sa.String()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+    if not _has_table('threads'):
+        op.create_table(
+            'threads',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('created_by', sa.String(), sa.ForeignKey('users.id')),
+            sa.Column('title', sa.String()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+    if not _has_table('messages'):
+        op.create_table(
+            'messages',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('thread_id', sa.String(), sa.ForeignKey('threads.id')),
+            sa.Column('sender_id', sa.String(), sa.ForeignKey('users.id')),
+            sa.Column('summary', sa.Text(), nullable=False),
+            sa.Column('vector_id', sa.String()),
+            sa.Column('slots', sa.Text()),
+            sa.Column('lang_hint', sa.String()),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('expires_at', sa.DateTime()),
+        )
+
+    if not _has_table('message_contents'):
+        op.create_table(
+            'message_contents',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('message_id', sa.String(), sa.ForeignKey('messages.id'), nullable=False),
+            sa.Column('user_id', sa.String(), sa.ForeignKey('users.id'), nullable=False),
+            sa.Column('content_type', sa.String(), nullable=False),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.Column('created_at', sa.DateTime()),
+            sa.Column('updated_at', sa.DateTime()),
+        )
+
+    if not _has_table('inbox'):
+        op.create_table(
+            'inbox',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('user_id', sa.String(), sa.ForeignKey('users.id')),
+            sa.Column('message_id', sa.String(), sa.ForeignKey('messages.id')),
+            sa.Column('thread_id', sa.String(), sa.ForeignKey('threads.id')),
+            sa.Column('status', sa.String()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+    if not _has_table('kb_items'):
+        op.create_table(
+            'kb_items',
+            sa.Column('id', sa.String(), primary_key=True),
+            sa.Column('text', sa.Text(), nullable=False),
+            sa.Column('vector_id', sa.String()),
+            sa.Column('category', sa.String()),
+            sa.Column('created_at', sa.DateTime()),
+        )
+
+
+def downgrade():
+    op.drop_table('kb_items')
+    op.drop_table('inbox')
+    op.drop_table('message_contents')
+    op.drop_table('messages')
+    op.drop_table('threads')
+    op.drop_table('users')
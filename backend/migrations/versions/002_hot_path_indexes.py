@@ -0,0 +1,44 @@
+"""Hot path composite indexes
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 00:01:00.000000
+
+受信箱（未読一覧）、スレッド内メッセージ一覧、期限切れ削除、
+メッセージ×ユーザーのテキスト取得で使うインデックスを追加する。
+init_db() が同名インデックスを作成済みの場合はスキップする。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('idx_inbox_user_status', 'inbox', ['user_id', 'status', 'created_at']),
+    ('idx_messages_thread_created', 'messages', ['thread_id', 'created_at']),
+    ('idx_messages_expires_at', 'messages', ['expires_at']),
+    ('idx_message_contents_message_user', 'message_contents', ['message_id', 'user_id']),
+]
+
+
+def _existing_indexes(table: str) -> set:
+    return {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        if name not in _existing_indexes(table):
+            op.create_index(name, table, columns)
+
+    # プランナー統計を更新して新しいインデックスが選ばれるようにする
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        if name in _existing_indexes(table):
+            op.drop_index(name, table_name=table)
@@ -0,0 +1,39 @@
+"""Extend thread index with id for keyset pagination
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 00:02:00.000000
+
+スレッド内メッセージのキーセットページネーション（created_at, id）で
+ソートを省略できるよう、idx_messages_thread_created に id を追加する。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def _index_columns(name: str):
+    for ix in sa.inspect(op.get_bind()).get_indexes('messages'):
+        if ix['name'] == name:
+            return list(ix['column_names'])
+    return None
+
+
+def upgrade():
+    columns = _index_columns('idx_messages_thread_created')
+    if columns == ['thread_id', 'created_at', 'id']:
+        return
+    if columns is not None:
+        op.drop_index('idx_messages_thread_created', table_name='messages')
+    op.create_index('idx_messages_thread_created', 'messages', ['thread_id', 'created_at', 'id'])
+
+
+def downgrade():
+    if _index_columns('idx_messages_thread_created') is not None:
+        op.drop_index('idx_messages_thread_created', table_name='messages')
+    op.create_index('idx_messages_thread_created', 'messages', ['thread_id', 'created_at'])
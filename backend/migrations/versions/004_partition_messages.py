@@ -0,0 +1,119 @@
+"""Partition messages by expires_at (PostgreSQL, opt-in)
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 00:03:00.000000
+
+MESSAGES_PARTITIONED=true の PostgreSQL でのみ、messages を expires_at の
+日次レンジでパーティション化する。期限切れデータはスイーパーが
+パーティション単位で DROP する。それ以外の環境では何もしない。
+
+パーティションキーを主キーに含める必要があるため主キーは (id, expires_at) となり、
+inbox / message_contents から messages への外部キーは削除される
+（関連行はスイーパーがパーティション削除前に削除する）。
+"""
+import os
+
+from alembic import op
+
+# revision identifiers
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+
+def _enabled() -> bool:
+    return (
+        op.get_bind().dialect.name == 'postgresql'
+        and os.getenv('MESSAGES_PARTITIONED', 'false').lower() == 'true'
+    )
+
+
+def upgrade():
+    if not _enabled():
+        return
+
+    op.execute('ALTER TABLE inbox DROP CONSTRAINT IF EXISTS inbox_message_id_fkey')
+    op.execute('ALTER TABLE message_contents DROP CONSTRAINT IF EXISTS message_contents_message_id_fkey')
+    op.execute('ALTER TABLE messages RENAME TO messages_legacy')
+    op.execute('ALTER INDEX messages_pkey RENAME TO messages_legacy_pkey')
+
+    op.execute("""
+        CREATE TABLE messages (
+            id VARCHAR NOT NULL,
+            thread_id VARCHAR REFERENCES threads (id),
+            sender_id VARCHAR REFERENCES users (id),
+            summary TEXT NOT NULL,
+            vector_id VARCHAR,
+            slots TEXT,
+            lang_hint VARCHAR,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            expires_at TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+            PRIMARY KEY (id, expires_at)
+        ) PARTITION BY RANGE (expires_at)
+    """)
+    op.execute('CREATE TABLE messages_default PARTITION OF messages DEFAULT')
+
+    # 既存データの範囲 + 2日先までの日次パーティションを作成
+    op.execute("""
+        DO $$
+        DECLARE
+            d date;
+        BEGIN
+            FOR d IN SELECT generate_series(
+                COALESCE((SELECT min(COALESCE(expires_at, created_at + interval '24 hours'))::date
+                          FROM messages_legacy), current_date),
+                current_date + 2,
+                interval '1 day'
+            )::date LOOP
+                EXECUTE format(
+                    'CREATE TABLE IF NOT EXISTS %I PARTITION OF messages FOR VALUES FROM (%L) TO (%L)',
+                    'messages_p' || to_char(d, 'YYYYMMDD'), d, d + 1
+                );
+            END LOOP;
+        END $$;
+    """)
+
+    op.execute("""
+        INSERT INTO messages (id, thread_id, sender_id, summary, vector_id, slots, lang_hint, created_at, expires_at)
+        SELECT id, thread_id, sender_id, summary, vector_id, slots, lang_hint, created_at,
+               COALESCE(expires_at, created_at + interval '24 hours', now())
+        FROM messages_legacy
+    """)
+    op.execute('DROP TABLE messages_legacy')
+
+    op.create_index('idx_messages_thread_created', 'messages', ['thread_id', 'created_at', 'id'])
+    op.create_index('idx_messages_expires_at', 'messages', ['expires_at'])
+
+
+def downgrade():
+    if not _enabled():
+        return
+
+    op.execute('ALTER TABLE messages RENAME TO messages_partitioned')
+    op.execute('ALTER INDEX messages_pkey RENAME TO messages_partitioned_pkey')
+    op.execute("""
+        CREATE TABLE messages (
+            id VARCHAR PRIMARY KEY,
+            thread_id VARCHAR REFERENCES threads (id),
+            sender_id VARCHAR REFERENCES users (id),
+            summary TEXT NOT NULL,
+            vector_id VARCHAR,
+            slots TEXT,
+            lang_hint VARCHAR,
+            created_at TIMESTAMP WITHOUT TIME ZONE,
+            expires_at TIMESTAMP WITHOUT TIME ZONE
+        )
+    """)
+    op.execute('INSERT INTO messages SELECT * FROM messages_partitioned')
+    op.execute('DROP TABLE messages_partitioned CASCADE')
+
+    op.create_index('idx_messages_thread_created', 'messages', ['thread_id', 'created_at', 'id'])
+    op.create_index('idx_messages_expires_at', 'messages', ['expires_at'])
+    op.execute('DELETE FROM inbox WHERE message_id NOT IN (SELECT id FROM messages)')
+    op.execute('DELETE FROM message_contents WHERE message_id NOT IN (SELECT id FROM messages)')
+    op.create_foreign_key('inbox_message_id_fkey', 'inbox', 'messages', ['message_id'], ['id'])
+    op.create_foreign_key(
+        'message_contents_message_id_fkey', 'message_contents', 'messages', ['message_id'], ['id']
+    )
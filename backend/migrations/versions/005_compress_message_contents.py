@@ -0,0 +1,113 @@
+"""Compress message_contents.text
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-19 00:04:00.000000
+
+message_contents.text を TEXT からバイナリに変更し、既存行を
+先頭1バイトのヘッダー付き形式（0x00: 平文 / 0x01: zlib）で再エンコードする。
+
+アプリのコーデックや設定が後から変わっても結果が変わらないよう、
+このリビジョン時点の形式（zlib, 256バイト以上, レベル6）をここに固定している。
+zstd・共有辞書での再圧縮は scripts/recompress_message_contents.py で行う。
+"""
+import os
+import zlib
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+# このリビジョン時点の格納形式（app.compression と同じヘッダー）
+HEADER_PLAIN = b'\x00'
+HEADER_ZLIB = b'\x01'
+HEADER_ZSTD = b'\x02'
+THRESHOLD = 256
+ZLIB_LEVEL = 6
+
+
+def _encode(value) -> bytes:
+    """平文（ヘッダー付きを含む）を閾値以上なら zlib で圧縮"""
+    raw = _decode(value).encode('utf-8')
+    stored = HEADER_PLAIN + raw
+    if len(raw) >= THRESHOLD:
+        candidate = HEADER_ZLIB + zlib.compress(raw, ZLIB_LEVEL)
+        if len(candidate) < len(stored):
+            stored = candidate
+    return stored
+
+
+def _decode(value) -> str:
+    if isinstance(value, str):
+        return value
+    value = bytes(value)
+    header, body = value[:1], value[1:]
+    if header == HEADER_PLAIN:
+        return body.decode('utf-8')
+    if header == HEADER_ZLIB:
+        return zlib.decompress(body).decode('utf-8')
+    if header == HEADER_ZSTD:
+        # このリビジョン以降に zstd で再圧縮された行（downgrade 時のみ）
+        import zstandard
+        dict_path = os.getenv('TEXT_COMPRESSION_DICT_PATH')
+        dict_data = None
+        if dict_path:
+            with open(dict_path, 'rb') as f:
+                dict_data = zstandard.ZstdCompressionDict(f.read())
+        return zstandard.ZstdDecompressor(dict_data=dict_data).decompress(body).decode('utf-8')
+    return value.decode('utf-8')
+
+
+def _rewrite(transform):
+    """id のキーセットで全行を走査し、text を変換して書き戻す"""
+    conn = op.get_bind()
+    last_id = ''
+    while True:
+        rows = conn.execute(
+            sa.text('SELECT id, text FROM message_contents WHERE id > :last_id ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            sa.text('UPDATE message_contents SET text = :text WHERE id = :id'),
+            [{'id': row.id, 'text': transform(row.text)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # 既存の平文には平文ヘッダー（0x00）を付けてバイナリ化
+        op.execute(
+            "ALTER TABLE message_contents ALTER COLUMN text TYPE bytea "
+            "USING '\\x00'::bytea || convert_to(text, 'UTF8')"
+        )
+    else:
+        with op.batch_alter_table('message_contents') as batch_op:
+            batch_op.alter_column('text', type_=sa.LargeBinary(), existing_nullable=False)
+
+    # 閾値以上のテキストを圧縮
+    _rewrite(_encode)
+
+
+def downgrade():
+    _rewrite(lambda value: _decode(value).encode('utf-8'))
+
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute(
+            "ALTER TABLE message_contents ALTER COLUMN text TYPE text "
+            "USING convert_from(text, 'UTF8')"
+        )
+    else:
+        with op.batch_alter_table('message_contents') as batch_op:
+            batch_op.alter_column('text', type_=sa.Text(), existing_nullable=False)
+        # バッチ変更時のCASTで文字列化されていない値があれば変換
+        _rewrite(lambda value: value if isinstance(value, str) else bytes(value).decode('utf-8'))
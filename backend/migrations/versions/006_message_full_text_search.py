@@ -0,0 +1,75 @@
+"""Full-text search over message summaries
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-19 00:05:00.000000
+
+messages に全文検索用のバイグラム列 search_text を追加して既存行を埋め、
+PostgreSQL では GIN インデックス（idx_messages_summary_gin）、
+SQLite では FTS5 仮想テーブルと同期トリガーを作成する。
+init_db() が作成済みの場合はスキップする。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.fts import PG_TS_CONFIG, SQLITE_FTS_DDL, SQLITE_FTS_DROP, SQLITE_FTS_REBUILD, to_search_text
+
+# revision identifiers
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def _backfill():
+    """id のキーセットで全行を走査し、search_text を埋める"""
+    conn = op.get_bind()
+    last_id = ''
+    while True:
+        rows = conn.execute(
+            sa.text('SELECT id, summary FROM messages WHERE id > :last_id ORDER BY id LIMIT :limit'),
+            {'last_id': last_id, 'limit': BATCH_SIZE}
+        ).fetchall()
+        if not rows:
+            break
+        conn.execute(
+            sa.text('UPDATE messages SET search_text = :search_text WHERE id = :id'),
+            [{'id': row.id, 'search_text': to_search_text(row.summary)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'search_text' not in {c['name'] for c in inspector.get_columns('messages')}:
+        op.add_column('messages', sa.Column('search_text', sa.Text()))
+    _backfill()
+
+    if bind.dialect.name == 'postgresql':
+        if 'idx_messages_summary_gin' not in {ix['name'] for ix in inspector.get_indexes('messages')}:
+            op.execute(
+                f'CREATE INDEX idx_messages_summary_gin ON messages '
+                f'USING gin (to_tsvector({PG_TS_CONFIG}, search_text))'
+            )
+    elif bind.dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_DDL:
+            op.execute(statement)
+        # 既存行を索引に取り込む
+        op.execute(SQLITE_FTS_REBUILD)
+
+    op.execute('ANALYZE')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS idx_messages_summary_gin')
+    elif bind.dialect.name == 'sqlite':
+        for statement in SQLITE_FTS_DROP:
+            op.execute(statement)
+
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('search_text')
@@ -0,0 +1,28 @@
+"""Index messages.vector_id for hybrid search
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-19 00:06:00.000000
+
+ハイブリッド検索でベクトル検索の結果（vector_id）からメッセージを
+引き当てるためのインデックスを追加する。
+init_db() が作成済みの場合はスキップする。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = {ix['name'] for ix in sa.inspect(op.get_bind()).get_indexes('messages')}
+    if 'idx_messages_vector_id' not in existing:
+        op.create_index('idx_messages_vector_id', 'messages', ['vector_id'])
+
+
+def downgrade():
+    op.drop_index('idx_messages_vector_id', table_name='messages')
@@ -0,0 +1,39 @@
+"""Index inbox by thread for delivered-message pagination
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 00:07:00.000000
+
+/deliver で配信されたメッセージは inbox 側にのみスレッドIDを持つため、
+スレッドのページを (thread_id, message_created_at, message_id) のインデックス順に
+キーセットで読めるよう、inbox に messages.created_at の複製列とインデックスを追加する。
+init_db() が作成済みの場合はスキップする。
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if 'message_created_at' not in {column['name'] for column in inspector.get_columns('inbox')}:
+        op.add_column('inbox', sa.Column('message_created_at', sa.DateTime()))
+    op.execute(
+        'UPDATE inbox SET message_created_at = '
+        '(SELECT created_at FROM messages WHERE messages.id = inbox.message_id) '
+        'WHERE message_created_at IS NULL'
+    )
+    if 'idx_inbox_thread_message' not in {ix['name'] for ix in inspector.get_indexes('inbox')}:
+        op.create_index('idx_inbox_thread_message', 'inbox', ['thread_id', 'message_created_at', 'message_id'])
+    op.execute('ANALYZE inbox')
+
+
+def downgrade():
+    op.drop_index('idx_inbox_thread_message', table_name='inbox')
+    with op.batch_alter_table('inbox') as batch_op:
+        batch_op.drop_column('message_created_at')
@@ -0,0 +1,122 @@
+"""
+主キー形式ベンチマークスクリプト
+ランダムな UUIDv4 と時刻順の UUIDv7 で messages / inbox への挿入スループットを比較する
+（行数が増えてインデックスがキャッシュに収まらなくなるほど差が出る）
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+
+from app.database import Base
+from app.ids import uuid7
+from app.models import Message, Inbox
+
+ID_GENERATORS = {
+    "uuid4": lambda: str(uuid.uuid4()),
+    "uuid7": lambda: str(uuid7()),
+}
+
+
+def _index_size_kb(conn, dialect: str) -> float:
+    if dialect == "postgresql":
+        size = conn.execute(text(
+            "SELECT sum(pg_relation_size(indexrelid)) FROM pg_index "
+            "WHERE indrelid IN ('messages'::regclass, 'inbox'::regclass)"
+        )).scalar()
+        return size / 1024
+    # SQLite: 使用中の全ページ（テーブル + インデックス）
+    pages = conn.execute(text("PRAGMA page_count")).scalar() - conn.execute(text("PRAGMA freelist_count")).scalar()
+    page_size = conn.execute(text("PRAGMA page_size")).scalar()
+    return pages * page_size / 1024
+
+
+def run(id_format: str, url: str, rows: int, batch: int, cache_kb: int):
+    engine = create_engine(url)
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _pragmas(dbapi_conn, _):
+            cursor = dbapi_conn.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            # ページキャッシュを小さくして、インデックスがメモリに収まらない状況を再現
+            cursor.execute(f"PRAGMA cache_size=-{cache_kb}")
+            cursor.close()
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    new_id = ID_GENERATORS[id_format]
+    expires_at = datetime.now() + timedelta(hours=24)
+
+    timings = []
+    with engine.connect() as conn:
+        started = time.perf_counter()
+        for offset in range(0, rows, batch):
+            batch_started = time.perf_counter()
+            messages = [
+                {
+                    "id": new_id(),
+                    "thread_id": f"thread_{i % 100}",
+                    "sender_id": "user_1",
+                    "summary": f"benchmark message {i}",
+                    "slots": "{}",
+                    "created_at": datetime.now(),
+                    "expires_at": expires_at,
+                }
+                for i in range(offset, min(offset + batch, rows))
+            ]
+            conn.execute(Message.__table__.insert(), messages)
+            conn.execute(Inbox.__table__.insert(), [
+                {
+                    "id": new_id(),
+                    "user_id": "user_2",
+                    "message_id": message["id"],
+                    "thread_id": message["thread_id"],
+                    "status": "unread",
+                    "message_created_at": message["created_at"],
+                    "created_at": message["created_at"],
+                }
+                for message in messages
+            ])
+            conn.commit()
+            timings.append((len(messages), time.perf_counter() - batch_started))
+        elapsed = time.perf_counter() - started
+        size_kb = _index_size_kb(conn, engine.dialect.name)
+
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+    # 末尾10%のバッチ（テーブルが大きくなった状態）のスループット
+    tail = timings[-max(len(timings) // 10, 1):]
+    return {
+        "ids": id_format,
+        "rows/s": round(rows * 2 / elapsed),
+        "tail_rows/s": round(sum(n for n, _ in tail) * 2 / sum(t for _, t in tail)),
+        "size_kb": round(size_kb),
+    }
+
+
+def main(args):
+    url = args.url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_ids.db')}"
+    print(f"📊 主キー形式ベンチマーク（{args.rows}メッセージ + 同数の受信箱行, バッチ: {args.batch}件）")
+    for id_format in ("uuid4", "uuid7"):
+        result = run(id_format, url, args.rows, args.batch, args.cache_kb)
+        print("  " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="主キー形式（UUIDv4 / UUIDv7）の挿入ベンチマーク")
+    parser.add_argument("--url", help="ベンチマーク用DB（テーブルを作り直すため本番DBは指定しない）")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--cache-kb", type=int, default=2048, help="SQLiteのページキャッシュ（KiB）")
+    main(parser.parse_args())
@@ -0,0 +1,108 @@
+"""
+Socket.IO 送信サイズ・フレーム数ベンチマークスクリプト
+JSON / msgpack のシリアライザーと、接続ごとの送信バッチ化の有無で
+1メッセージあたりのバイト数と送信回数（WebSocketフレーム = send システムコール）を比較する
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+from datetime import datetime
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engineio import packet as eio_packet
+from socketio import packet
+from socketio.msgpack_packet import MsgPackPacket
+
+from app.socketio_batching import BatchingManager
+
+
+class _RecordingEngineIO:
+    _ids = itertools.count()
+
+    def generate_id(self):
+        return f"sid{next(self._ids)}"
+
+
+class RecordingServer:
+    """AsyncServer の送信部分だけを持つスタブ（実際のパケットクラスでエンコードしてサイズを記録）"""
+
+    def __init__(self, packet_class):
+        self.packet_class = packet_class
+        self.eio = _RecordingEngineIO()
+        self.frames = 0
+        self.bytes = 0
+
+    def _record(self, payload):
+        self.frames += 1
+        self.bytes += len(payload if isinstance(payload, (bytes, str)) else str(payload))
+
+    async def _send_packet(self, eio_sid, pkt):
+        encoded = pkt.encode()
+        for ep in encoded if isinstance(encoded, list) else [encoded]:
+            self._record(eio_packet.Packet(eio_packet.MESSAGE, ep).encode())
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        self._record(eio_pkt.encode())
+
+
+def _event(i: int):
+    """典型的な配信通知（new_delivery）と入力中・プレゼンスイベントの混在"""
+    kind = i % 3
+    if kind == 0:
+        return "new_delivery", {
+            "message_id": f"0190f3a2-7c1e-7a3b-9d2f-{i:012d}",
+            "thread_id": "0190f3a2-7c1e-7a3b-9d2f-000000000001",
+            "sender_id": "user_1",
+            "created_at": datetime(2024, 1, 1, 12, 0, i % 60).isoformat(),
+            "delivery_id": f"0190f3a2-7c1e-7a3b-9d2f-{i + 1:012d}",
+        }
+    if kind == 1:
+        return "typing", {"user_id": "user_1", "is_typing": True}
+    return "presence_delta", {
+        "room": "presence:family:tanaka", "version": i, "changes": {"user_2": "online"},
+    }
+
+
+async def run(serializer: str, batch_window_ms: float, messages: int, burst: int):
+    server = RecordingServer(MsgPackPacket if serializer == "msgpack" else packet.Packet)
+    manager = BatchingManager()
+    manager.set_server(server)
+    manager.batch_window = batch_window_ms / 1000
+    await manager.connect("eio0", "/")
+
+    sent = 0
+    while sent < messages:
+        # burst 件が同時に発生する状況（一斉配信・入力中・プレゼンス変化の重なり）
+        for _ in range(min(burst, messages - sent)):
+            event, data = _event(sent)
+            await manager.emit(event, data, "/", room=None)
+            sent += 1
+        await asyncio.sleep(max(batch_window_ms, 1) / 1000 * 2)
+    await manager.flush_all()
+    await asyncio.sleep(0)
+    return server.bytes / messages, server.frames / messages
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Socket.IO 送信サイズ・フレーム数ベンチマーク")
+    parser.add_argument("--messages", type=int, default=3000)
+    parser.add_argument("--burst", type=int, default=8, help="同時に発生するイベント数")
+    parser.add_argument("--batch-window-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"messages={args.messages} burst={args.burst}")
+    print(f"{'serializer':<10} {'batching':<10} {'bytes/msg':>10} {'frames/msg':>11}")
+    for serializer in ("default", "msgpack"):
+        for window in (0, args.batch_window_ms):
+            size, frames = await run(serializer, window, args.messages, args.burst)
+            label = f"{window:g}ms" if window else "off"
+            print(f"{serializer:<10} {label:<10} {size:>10.1f} {frames:>11.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,136 @@
+"""
+SQLiteベンチマークスクリプト
+現行設定（リクエスト毎コミット）と本番プロファイル（WAL + 単一ライター）を比較する
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.database import Base, apply_sqlite_pragmas
+from app.db_writer import GroupCommitWriter
+from app.models import Message, Inbox
+
+
+def _new_message(i: int) -> Message:
+    return Message(
+        thread_id=f"thread_{i % 10}",
+        sender_id="user_1",
+        summary=f"benchmark message {i}",
+        slots="{}",
+        expires_at=datetime.now() + timedelta(hours=24)
+    )
+
+
+async def run(mode: str, concurrency: int, ops: int, batch: int, delay_ms: float):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    url = f"sqlite+aiosqlite:///{path}"
+    tuned = mode == "tuned"
+
+    if tuned:
+        read_engine = create_async_engine(
+            url, pool_size=concurrency, max_overflow=0,
+            poolclass=AsyncAdaptedQueuePool, connect_args={"timeout": 30}
+        )
+        write_engine = create_async_engine(
+            url, pool_size=1, max_overflow=0,
+            poolclass=AsyncAdaptedQueuePool, connect_args={"timeout": 30}
+        )
+        for e in (read_engine, write_engine):
+            event.listen(e.sync_engine, "connect", apply_sqlite_pragmas)
+    else:
+        # 現行設定と同じ（タイムアウトはsqlite3既定の5秒）
+        read_engine = write_engine = create_async_engine(url)
+
+    async with write_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    sessions = async_sessionmaker(read_engine, expire_on_commit=False)
+    writer = None
+    if tuned:
+        writer = GroupCommitWriter(async_sessionmaker(write_engine, expire_on_commit=False), batch, delay_ms)
+        writer.start()
+
+    latencies = []
+    errors = 0
+
+    async def one(i: int):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            async def write(session):
+                message = _new_message(i)
+                session.add(message)
+                await session.flush()
+                session.add(Inbox(user_id="user_2", message_id=message.id, thread_id=message.thread_id,
+                                  message_created_at=message.created_at))
+
+            if writer is not None:
+                await writer.submit(write)
+            else:
+                async with sessions() as session:
+                    await write(session)
+                    await session.commit()
+
+            # 配信直後の読み取り（スレッド一覧）
+            async with sessions() as session:
+                await session.execute(
+                    select(Message.id).where(Message.thread_id == f"thread_{i % 10}").limit(20)
+                )
+        except OperationalError:
+            errors += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    async def worker(w: int):
+        for k in range(ops):
+            await one(w * ops + k)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    commits = writer.commits if writer else concurrency * ops
+    if writer:
+        await writer.stop()
+    await read_engine.dispose()
+    if write_engine is not read_engine:
+        await write_engine.dispose()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "ops/s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "commits": commits,
+        "locked_errors": errors,
+    }
+
+
+async def main(args):
+    print(f"📊 SQLiteベンチマーク（並列数: {args.concurrency}, 1並列あたり: {args.ops}件）")
+    for mode in ("default", "tuned"):
+        result = await run(mode, args.concurrency, args.ops, args.batch, args.delay_ms)
+        print("  " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite設定のベンチマーク")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=64)
+    parser.add_argument("--delay-ms", type=float, default=2)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+メッセージ write-behind ベンチマークスクリプト
+リクエスト毎コミット（現行の /embed）と write-behind（複数行INSERT + グループコミット）を比較する
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.database import Base, apply_sqlite_pragmas
+from app.db_writer import WriteBehindInserter
+from app.ids import new_id
+from app.models import Message
+
+
+def _new_row(i: int) -> dict:
+    now = datetime.now()
+    return {
+        "id": new_id(),
+        "sender_id": "user_1",
+        "summary": f"benchmark message {i}",
+        "slots": "{}",
+        "created_at": now,
+        "expires_at": now + timedelta(hours=24),
+    }
+
+
+async def run(mode: str, url: str, concurrency: int, ops: int, batch: int, delay_ms: float, synchronous: str):
+    engine = create_async_engine(
+        url, pool_size=concurrency, max_overflow=0,
+        poolclass=AsyncAdaptedQueuePool, connect_args={"timeout": 30}
+    )
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine.sync_engine, "connect")
+        def _pragmas(dbapi_conn, record):
+            apply_sqlite_pragmas(dbapi_conn, record)
+            cursor = dbapi_conn.cursor()
+            # FULL: コミット毎にWALをfsync（コミット数の差がそのままfsync回数の差になる）
+            cursor.execute(f"PRAGMA synchronous={synchronous}")
+            cursor.close()
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    inserter = None
+    if mode == "write_behind":
+        inserter = WriteBehindInserter(sessions, Message.__table__, max_batch=batch, max_delay_ms=delay_ms)
+        inserter.start()
+
+    latencies = []
+
+    async def one(i: int):
+        started = time.perf_counter()
+        if inserter is not None:
+            await inserter.submit(_new_row(i))
+        else:
+            async with sessions() as session:
+                session.add(Message(**_new_row(i)))
+                await session.commit()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    async def worker(w: int):
+        for k in range(ops):
+            await one(w * ops + k)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(w) for w in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    commits = inserter.commits if inserter else concurrency * ops
+    if inserter:
+        await inserter.stop()
+    async with sessions() as session:
+        stored = (await session.execute(select(func.count()).select_from(Message))).scalar_one()
+        await session.run_sync(lambda s: Base.metadata.drop_all(s.connection()))
+        await session.commit()
+    await engine.dispose()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "messages/s": round(len(latencies) / elapsed, 1),
+        "commits/s": round(commits / elapsed, 1),
+        "rows/commit": round(stored / commits, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+    }
+
+
+async def main(args):
+    url = args.url or f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'bench_write_behind.db')}"
+    print(f"📊 メッセージ write-behind ベンチマーク（並列数: {args.concurrency}, 1並列あたり: {args.ops}件）")
+    for mode in ("per_request", "write_behind"):
+        result = await run(mode, url, args.concurrency, args.ops, args.batch, args.delay_ms, args.synchronous)
+        print("  " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="メッセージINSERTの write-behind ベンチマーク")
+    parser.add_argument("--url", help="ベンチマーク用DB（テーブルを作り直すため本番DBは指定しない）")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=50)
+    parser.add_argument("--batch", type=int, default=256)
+    parser.add_argument("--delay-ms", type=float, default=5)
+    parser.add_argument("--synchronous", default="FULL", choices=["OFF", "NORMAL", "FULL"])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,37 @@
+"""
+ホットクエリの実行計画チェックスクリプト
+alembic upgrade head 後に実行し、インデックスが使われていることを確認する
+"""
+
+import sys
+import os
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import engine
+from app.query_plans import check_hot_queries
+
+
+def main():
+    print("🔍 ホットクエリの実行計画を確認しています...")
+
+    with engine.begin() as conn:
+        results = check_hot_queries(conn)
+
+    failed = False
+    for name, (uses_index, plan) in results.items():
+        mark = "✅" if uses_index else "❌"
+        print(f"{mark} {name}")
+        for line in plan:
+            print(f"     {line}")
+        failed = failed or not uses_index
+
+    if failed:
+        print("❌ インデックスが使われていないクエリがあります（alembic upgrade head を確認してください）")
+        sys.exit(1)
+    print("🎉 すべてのホットクエリがインデックスを使用しています")
+
+
+if __name__ == "__main__":
+    main()
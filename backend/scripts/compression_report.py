@@ -0,0 +1,80 @@
+"""
+テキスト圧縮レポート
+message_contents の現在の格納サイズと、各方式の圧縮率・CPUコストを比較する
+"""
+
+import argparse
+import sys
+import os
+import time
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func, select, text
+
+from app.compression import TextCodec, ZSTD_AVAILABLE
+from app.config import get_settings
+from app.database import SessionLocal
+from app.models import MessageContent
+
+
+def _measure(codec: TextCodec, texts):
+    started = time.process_time()
+    encoded = [codec.encode(t) for t in texts]
+    encode_cpu = time.process_time() - started
+    started = time.process_time()
+    for value in encoded:
+        codec.decode(value)
+    decode_cpu = time.process_time() - started
+    stats = codec.stats.snapshot()
+    raw_kb = max(stats["raw_bytes"] / 1024, 1e-9)
+    return {
+        "ratio": stats["ratio"],
+        "compressed": f"{stats['compressed']}/{stats['encoded']}",
+        "encode_us/KB": round(encode_cpu * 1e6 / raw_kb, 1),
+        "decode_us/KB": round(decode_cpu * 1e6 / raw_kb, 1),
+    }
+
+
+def main(samples: int):
+    settings = get_settings()
+    db = SessionLocal()
+    try:
+        rows, stored = db.execute(
+            select(func.count(), func.coalesce(func.sum(func.length(text("message_contents.text"))), 0))
+            .select_from(MessageContent)
+        ).one()
+        texts = db.execute(select(MessageContent.text).limit(samples)).scalars().all()
+    finally:
+        db.close()
+
+    raw = sum(len(t.encode("utf-8")) for t in texts)
+    print(f"📊 message_contents: {rows}行, 格納サイズ {stored / 1024:.1f}KiB")
+    print(f"   サンプル{len(texts)}件の平文サイズ: {raw / 1024:.1f}KiB")
+    if not texts:
+        return
+
+    candidates = {
+        "zlib-6": TextCodec("zlib", settings.text_compression_threshold, 6),
+        "zlib-9": TextCodec("zlib", settings.text_compression_threshold, 9),
+    }
+    if ZSTD_AVAILABLE:
+        candidates["zstd-3"] = TextCodec("zstd", settings.text_compression_threshold, 3)
+        if settings.text_compression_dict_path and os.path.exists(settings.text_compression_dict_path):
+            with open(settings.text_compression_dict_path, "rb") as f:
+                candidates["zstd-3+dict"] = TextCodec(
+                    "zstd", settings.text_compression_threshold, 3, zstd_dict=f.read()
+                )
+
+    print(f"   閾値: {settings.text_compression_threshold}バイト（未満は平文）")
+    for name, codec in candidates.items():
+        result = _measure(codec, texts)
+        print(f"   {name:12s} " + "  ".join(f"{k}={v}" for k, v in result.items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="テキスト圧縮レポート")
+    parser.add_argument("--samples", type=int, default=5000)
+    args = parser.parse_args()
+    main(args.samples)
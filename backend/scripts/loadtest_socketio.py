@@ -0,0 +1,278 @@
+"""
+Socket.IO 負荷試験スクリプト
+python-socketio の非同期クライアントで N 人のユーザーを模擬し、1ワーカーが捌ける同時接続数を計測する
+
+各ユーザーは接続して user_register を送り、送信役のユーザーは入力中イベントを送ったあと
+/embed → /deliver → /render でメッセージを送る。受信側で new_message が届くまでを
+エンドツーエンドの配信遅延として計測する。
+
+使い方（LLMはスタブ、Redisはローカル）:
+    python scripts/loadtest_socketio.py --write-users config/loadtest_users.json --users 1000
+    python scripts/stub_llm.py --port 9100 &
+    redis-server --daemonize yes
+    USERS_CONFIG=config/loadtest_users.json OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:9100/v1 \\
+        uvicorn main:app --port 8000 &
+    python scripts/loadtest_socketio.py --users 1000 --connect-rate 200 --server-pid $!
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import socketio
+
+USER_PREFIX = "load_"
+SOCKETIO_PATH = "/api/v1/ws/socket.io"
+STYLES = ["biz_formal", "emoji_casual", "technical"]
+
+
+def write_users(path: str, users: int):
+    """負荷試験用のユーザー定義（USERS_CONFIG）を書き出す"""
+    data = {
+        "users": [
+            {
+                "id": f"{USER_PREFIX}{i}",
+                "name": f"負荷試験ユーザー{i}",
+                "language": "ja",
+                "style_preset": STYLES[i % len(STYLES)],
+                # 10人ごとに家族ルームを共有（プレゼンス差分の配信も発生させる）
+                "family": f"load_family_{i // 10}",
+            }
+            for i in range(users)
+        ]
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"{users}人のユーザーを {path} に書き出しました")
+
+
+def percentiles(values: List[float]) -> str:
+    if not values:
+        return "n/a"
+    if len(values) == 1:
+        return f"p50={values[0]:.1f} p90={values[0]:.1f} p99={values[0]:.1f} max={values[0]:.1f}"
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return f"p50={q[49]:.1f} p90={q[89]:.1f} p99={q[98]:.1f} max={max(values):.1f}"
+
+
+def server_rss(pid: Optional[int]) -> Optional[int]:
+    """サーバープロセス（子プロセスのワーカーを含む）の常駐メモリ"""
+    if pid is None:
+        return None
+    import psutil
+    process = psutil.Process(pid)
+    return sum(p.memory_info().rss for p in [process, *process.children(recursive=True)])
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Server-Timing ヘッダー（name;dur=ms, ...）を {段階: ms} に変換"""
+    timings: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                timings[name] = timings.get(name, 0.0) + float(value)
+    return timings
+
+
+class LoadStats:
+    def __init__(self):
+        self.connect_ms: List[float] = []
+        self.connect_failures = 0
+        self.delivery_ms: List[float] = []
+        self.stage_ms: Dict[str, List[float]] = {"embed": [], "deliver": [], "render": []}
+        # サーバー側の段階別の処理時間（"/embed:llm" など、Server-Timing から集計）
+        self.server_ms: Dict[str, List[float]] = {}
+        self.http_errors = 0
+        self.sent = 0
+        self.received = 0
+        # message_id -> 送信開始時刻
+        self.in_flight: Dict[str, float] = {}
+
+
+class SimulatedUser:
+    """1ユーザー（1接続）"""
+
+    def __init__(self, user_id: str, stats: LoadStats):
+        self.user_id = user_id
+        self.stats = stats
+        self.sio = socketio.AsyncClient(reconnection=False)
+        self.registered = asyncio.Event()
+        self.sio.on("presence_snapshot", self._on_registered)
+        self.sio.on("new_message", self._on_new_message)
+        self.sio.on("batch", self._on_batch)
+
+    async def _on_registered(self, data=None):
+        # user_register の処理の最後にプレゼンスのスナップショットが届く
+        self.registered.set()
+
+    async def _on_new_message(self, data):
+        started = self.stats.in_flight.pop(data.get("message_id"), None)
+        if started is not None:
+            self.stats.delivery_ms.append((time.perf_counter() - started) * 1000)
+            self.stats.received += 1
+
+    async def _on_batch(self, events):
+        # SOCKETIO_BATCH_WINDOW_MS > 0 のサーバーでは複数イベントがまとめて届く
+        for event, data in events:
+            if event == "new_message":
+                await self._on_new_message(data)
+            elif event == "presence_snapshot":
+                await self._on_registered(data)
+
+    async def connect(self, url: str, timeout: float):
+        started = time.perf_counter()
+        try:
+            await self.sio.connect(url, socketio_path=SOCKETIO_PATH, transports=["websocket"], wait_timeout=timeout)
+            await self.sio.emit("user_register", {"user_id": self.user_id, "device_id": "loadtest"})
+            await asyncio.wait_for(self.registered.wait(), timeout)
+        except Exception as e:
+            self.stats.connect_failures += 1
+            if self.stats.connect_failures <= 5:
+                print(f"接続失敗 {self.user_id}: {e}")
+            return False
+        self.stats.connect_ms.append((time.perf_counter() - started) * 1000)
+        return True
+
+    async def type(self, recipient_id: str, keystrokes: int):
+        for _ in range(keystrokes):
+            await self.sio.emit("typing_status", {"recipient_id": recipient_id, "is_typing": True})
+            await asyncio.sleep(random.uniform(0.05, 0.2))
+        await self.sio.emit("typing_status", {"recipient_id": recipient_id, "is_typing": False})
+
+    def _record_server_timing(self, endpoint: str, response: httpx.Response):
+        for name, duration in parse_server_timing(response.headers.get("Server-Timing")).items():
+            self.stats.server_ms.setdefault(f"{endpoint}:{name}", []).append(duration)
+
+    async def send(self, http: httpx.AsyncClient, recipient_id: str, seq: int):
+        headers = {"X-User-ID": self.user_id}
+        started = time.perf_counter()
+        try:
+            response = await http.post("/api/v1/embed", headers=headers, json={
+                "text": f"{self.user_id} から {recipient_id} へのメッセージ {seq}: 明日の予定を確認させてください",
+                "lang_hint": "ja",
+            })
+            response.raise_for_status()
+            self._record_server_timing("/embed", response)
+            message_id = response.json()["message_id"]
+            self.stats.in_flight[message_id] = started
+            t_embed = time.perf_counter()
+
+            response = await http.post("/api/v1/deliver", headers=headers, json={
+                "to_user_id": recipient_id,
+                "message_id": message_id,
+                "thread_id": f"loadtest-{self.user_id}-{recipient_id}",
+            })
+            response.raise_for_status()
+            self._record_server_timing("/deliver", response)
+            t_deliver = time.perf_counter()
+
+            response = await http.post("/api/v1/render", headers=headers, json={
+                "message_id": message_id,
+                "recipient_id": recipient_id,
+            })
+            response.raise_for_status()
+            self._record_server_timing("/render", response)
+            t_render = time.perf_counter()
+        except Exception as e:
+            self.stats.http_errors += 1
+            if self.stats.http_errors <= 5:
+                print(f"送信エラー {self.user_id}: {e}")
+            return
+        self.stats.sent += 1
+        self.stats.stage_ms["embed"].append((t_embed - started) * 1000)
+        self.stats.stage_ms["deliver"].append((t_deliver - t_embed) * 1000)
+        self.stats.stage_ms["render"].append((t_render - t_deliver) * 1000)
+
+
+async def run(args):
+    stats = LoadStats()
+    users = [SimulatedUser(f"{USER_PREFIX}{i}", stats) for i in range(args.users)]
+    rss_before = server_rss(args.server_pid)
+
+    # 1. 接続（connect_rate 件/秒で開始）
+    print(f"{args.users}接続を開始（{args.connect_rate}件/秒）...")
+    started = time.perf_counter()
+    tasks = []
+    for user in users:
+        tasks.append(asyncio.create_task(user.connect(args.url, args.timeout)))
+        await asyncio.sleep(1 / args.connect_rate)
+    connected = [user for user, ok in zip(users, await asyncio.gather(*tasks)) if ok]
+    connect_seconds = time.perf_counter() - started
+    rss_after = server_rss(args.server_pid)
+
+    # 2. 送信（sender_ratio の割合のユーザーが次のユーザーへ送信）
+    senders = connected[:max(1, int(len(connected) * args.sender_ratio))] if connected else []
+    print(f"{len(senders)}人が{args.messages}件ずつ送信...")
+    limits = httpx.Limits(max_connections=args.http_concurrency, max_keepalive_connections=args.http_concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as http:
+        async def sender_loop(index: int, user: SimulatedUser):
+            recipient = connected[(index + 1) % len(connected)].user_id
+            for seq in range(args.messages):
+                await asyncio.sleep(random.uniform(0, args.think_time))
+                await user.type(recipient, args.keystrokes)
+                await user.send(http, recipient, seq)
+
+        send_started = time.perf_counter()
+        await asyncio.gather(*(sender_loop(i, user) for i, user in enumerate(senders)))
+        send_seconds = time.perf_counter() - send_started
+
+    # 届いていない new_message を待つ
+    deadline = time.perf_counter() + args.timeout
+    while stats.in_flight and time.perf_counter() < deadline:
+        await asyncio.sleep(0.1)
+
+    await asyncio.gather(*(user.sio.disconnect() for user in connected), return_exceptions=True)
+
+    # 3. 結果
+    print("\n=== 接続 ===")
+    print(f"成功 {len(connected)} / 失敗 {stats.connect_failures}  "
+          f"{len(connected) / connect_seconds:.1f} 接続/秒（{connect_seconds:.1f}秒）")
+    print(f"接続+登録 (ms): {percentiles(stats.connect_ms)}")
+    if rss_before is not None and rss_after is not None and connected:
+        per_connection = (rss_after - rss_before) / len(connected)
+        print(f"サーバーRSS: {rss_before / 2**20:.1f} MiB -> {rss_after / 2**20:.1f} MiB "
+              f"（1接続あたり {per_connection / 1024:.1f} KiB）")
+    print("\n=== 配信 ===")
+    print(f"送信 {stats.sent} / 受信 {stats.received} / 未着 {len(stats.in_flight)} / HTTPエラー {stats.http_errors}  "
+          f"{stats.sent / send_seconds if send_seconds else 0:.1f} 件/秒")
+    print(f"エンドツーエンド (ms): {percentiles(stats.delivery_ms)}")
+    for stage, values in stats.stage_ms.items():
+        print(f"  {stage:<8} (ms): {percentiles(values)}")
+    if stats.server_ms:
+        print("\n=== サーバー側の内訳（Server-Timing） ===")
+        for stage, values in stats.server_ms.items():
+            print(f"  {stage:<20} (ms): {percentiles(values)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO 負荷試験（N人の模擬ユーザー）")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--connect-rate", type=float, default=200, help="1秒あたりの新規接続数")
+    parser.add_argument("--sender-ratio", type=float, default=0.2, help="送信するユーザーの割合")
+    parser.add_argument("--messages", type=int, default=5, help="送信役1人あたりのメッセージ数")
+    parser.add_argument("--keystrokes", type=int, default=5, help="送信前の入力中イベント数")
+    parser.add_argument("--think-time", type=float, default=1.0, help="送信間隔の最大値（秒）")
+    parser.add_argument("--http-concurrency", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--server-pid", type=int, help="1接続あたりのメモリを計測するサーバーのPID")
+    parser.add_argument("--write-users", metavar="PATH", help="負荷試験用の users.json を書き出して終了")
+    args = parser.parse_args()
+
+    if args.write_users:
+        write_users(args.write_users, args.users)
+        return
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+message_contents の再圧縮スクリプト
+既存行を現在の設定（TEXT_COMPRESSION・TEXT_COMPRESSION_THRESHOLD・TEXT_COMPRESSION_DICT_PATH）で再エンコードする
+zstd辞書を差し替えた場合や、圧縮方式を変更した場合に使用する（マイグレーションの巻き戻しは不要）
+
+使い方（辞書の差し替え）:
+    python scripts/train_zstd_dict.py --output data/zstd_dict_v2.bin
+    TEXT_COMPRESSION_DICT_PATH=data/zstd_dict_v2.bin \\
+        python scripts/recompress_message_contents.py --old-dict data/zstd_dict.bin
+"""
+
+import argparse
+import sys
+import os
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.types import LargeBinary
+
+from app.compression import HEADER_ZSTD, TextCodec, text_codec
+from app.database import SessionLocal
+
+
+def main(old_dict: str, batch_size: int, dry_run: bool):
+    # 既存の zstd 行は差し替え前の辞書で展開する（平文・zlib 行は辞書に依存しない）
+    reader = text_codec
+    if old_dict:
+        with open(old_dict, "rb") as f:
+            reader = TextCodec("zstd", zstd_dict=f.read())
+
+    update = text("UPDATE message_contents SET text = :text WHERE id = :id").bindparams(
+        bindparam("text", type_=LargeBinary)
+    )
+    db = SessionLocal()
+    scanned = rewritten = 0
+    try:
+        last_id = ""
+        while True:
+            rows = db.execute(
+                text("SELECT id, text FROM message_contents WHERE id > :last_id ORDER BY id LIMIT :limit"),
+                {"last_id": last_id, "limit": batch_size}
+            ).fetchall()
+            if not rows:
+                break
+            changes = []
+            for row in rows:
+                # 圧縮導入前のTEXT値は文字列のまま返る
+                value = row.text if isinstance(row.text, str) else bytes(row.text)
+                source = reader if isinstance(value, bytes) and value[:1] == HEADER_ZSTD else text_codec
+                encoded = text_codec.encode(source.decode(value))
+                if encoded != value:
+                    changes.append({"id": row.id, "text": encoded})
+            if changes and not dry_run:
+                db.execute(update, changes)
+                db.commit()
+            scanned += len(rows)
+            rewritten += len(changes)
+            last_id = rows[-1].id
+            print(f"  {scanned}件を確認（再エンコード {rewritten}件）")
+    finally:
+        db.close()
+
+    stats = text_codec.stats.snapshot()
+    action = "再エンコード対象" if dry_run else "再エンコードしました"
+    print(f"✅ {action}: {rewritten}/{scanned}件（{text_codec.algorithm}, 圧縮率 {stats['ratio']}）")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="message_contents の再圧縮")
+    parser.add_argument("--old-dict", help="既存の zstd 行を展開する差し替え前の辞書")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="件数のみ表示して書き込まない")
+    args = parser.parse_args()
+    main(args.old_dict, args.batch_size, args.dry_run)
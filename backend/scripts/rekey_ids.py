@@ -0,0 +1,82 @@
+"""
+既存行のID再採番スクリプト（UUIDv4 → UUIDv7）
+他テーブルから参照されない主キーを created_at に基づく UUIDv7 に置き換え、
+インデックスを詰め直す
+
+- messages / inbox はクライアントがIDを保持しており、24時間で期限切れになるため
+  再採番しない（新規行が UUIDv7 になるので期限切れとともに入れ替わる）
+- users / threads はクライアント指定のIDのため対象外
+"""
+
+import argparse
+import os
+import sys
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import bindparam, select, text, update
+
+from app.database import engine
+from app.fts import SQLITE_FTS_REBUILD
+from app.ids import is_uuid7, uuid7
+from app.models import KBItem, MessageContent
+
+# 他テーブルから外部キーで参照されないテーブル
+REKEY_TABLES = {
+    "message_contents": MessageContent.__table__,
+    "kb_items": KBItem.__table__,
+}
+
+
+def rekey_table(conn, name: str, batch_size: int) -> int:
+    """UUIDv7 でないIDを再採番し、件数を返す"""
+    table = REKEY_TABLES[name]
+    stmt = update(table).where(table.c.id == bindparam("old_id")).values(id=bindparam("new_id"))
+    rekeyed = 0
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c.created_at)
+            .where(table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        updates = [
+            {"old_id": row.id, "new_id": str(uuid7(row.created_at))}
+            for row in rows
+            if not is_uuid7(row.id) and row.created_at is not None
+        ]
+        if updates:
+            conn.execute(stmt, updates)
+            conn.commit()
+            rekeyed += len(updates)
+    return rekeyed
+
+
+def main(args):
+    with engine.connect() as conn:
+        for table in args.tables:
+            rekeyed = rekey_table(conn, table, args.batch_size)
+            print(f"  {table}: {rekeyed}件を再採番しました")
+
+    # 再採番で断片化したインデックスを詰め直す
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            for table in args.tables:
+                conn.execute(text(f"REINDEX TABLE {table}"))
+        else:
+            conn.execute(text("VACUUM"))
+            # VACUUM で messages の rowid が振り直され得るため全文検索索引も再構築
+            conn.execute(text(SQLITE_FTS_REBUILD))
+    print("✅ インデックスを再構築しました")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="既存行のIDをUUIDv7に再採番")
+    parser.add_argument("--tables", nargs="+", default=list(REKEY_TABLES), choices=REKEY_TABLES)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    main(parser.parse_args())
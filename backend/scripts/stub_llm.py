@@ -0,0 +1,46 @@
+"""
+負荷試験用のLLMスタブサーバー
+OpenAI互換の /v1/chat/completions を一定の遅延で返す（外部APIを呼ばずに /render を計測するため）
+
+使い方:
+    python scripts/stub_llm.py --port 9100 --latency-ms 200
+    OPENAI_API_KEY=stub OPENAI_BASE_URL=http://127.0.0.1:9100/v1 uvicorn main:app
+"""
+
+import argparse
+import asyncio
+import random
+
+import uvicorn
+from fastapi import FastAPI
+
+
+def create_app(latency_ms: float, jitter_ms: float) -> FastAPI:
+    app = FastAPI(title="Stub LLM")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(payload: dict):
+        # 実際のLLMの応答時間を模した遅延
+        await asyncio.sleep(max(0.0, latency_ms + random.uniform(-jitter_ms, jitter_ms)) / 1000)
+        prompt = payload.get("messages", [{}])[-1].get("content", "")
+        return {
+            "choices": [{"message": {"role": "assistant", "content": "（スタブ）再構成されたメッセージです。"}}],
+            "usage": {"total_tokens": len(prompt) // 4 + 20},
+        }
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="負荷試験用のLLMスタブサーバー")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency_ms, args.jitter_ms), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
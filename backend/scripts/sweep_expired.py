@@ -0,0 +1,32 @@
+"""
+期限切れメッセージ削除ワーカー
+APIプロセスとは別に実行する場合に使用（SWEEPER_ENABLED=false と併用）
+"""
+
+import argparse
+import asyncio
+import sys
+import os
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.sweeper import create_sweeper
+
+
+async def main(once: bool):
+    sweeper = create_sweeper()
+    if once:
+        deleted = await sweeper.sweep_once()
+        print(f"✅ 期限切れメッセージを削除しました: {deleted}件")
+        return
+
+    print(f"🧹 スイーパーを開始します（間隔: {sweeper.interval_seconds}秒）")
+    await sweeper.run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="期限切れメッセージ削除ワーカー")
+    parser.add_argument("--once", action="store_true", help="1回だけ実行して終了")
+    args = parser.parse_args()
+    asyncio.run(main(args.once))
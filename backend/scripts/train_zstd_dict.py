@@ -0,0 +1,54 @@
+"""
+zstd共有辞書の学習スクリプト
+message_contents のテキストをサンプルにして辞書を作成する
+（TEXT_COMPRESSION=zstd, TEXT_COMPRESSION_DICT_PATH で使用）
+"""
+
+import argparse
+import sys
+import os
+
+# パスを追加
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+
+from app.compression import ZSTD_AVAILABLE, zstandard
+from app.database import SessionLocal
+from app.models import MessageContent
+
+
+def main(output: str, dict_size: int, samples: int):
+    if not ZSTD_AVAILABLE:
+        print("❌ zstandard がインストールされていません（pip install zstandard）")
+        sys.exit(1)
+
+    db = SessionLocal()
+    try:
+        texts = db.execute(
+            select(MessageContent.text).order_by(MessageContent.created_at.desc()).limit(samples)
+        ).scalars().all()
+    finally:
+        db.close()
+
+    corpus = [text.encode("utf-8") for text in texts if text]
+    if len(corpus) < 100:
+        print(f"❌ サンプルが不足しています: {len(corpus)}件（100件以上必要）")
+        sys.exit(1)
+
+    dictionary = zstandard.train_dictionary(dict_size, corpus)
+    with open(output, "wb") as f:
+        f.write(dictionary.as_bytes())
+    print(f"✅ zstd辞書を作成しました: {output}（{len(dictionary.as_bytes())}バイト, サンプル{len(corpus)}件）")
+    print("⚠️  辞書を差し替える場合は、既存の辞書を残したまま別ファイルに出力し、"
+          "TEXT_COMPRESSION_DICT_PATH を切り替えて既存行を再圧縮してください:")
+    print(f"    TEXT_COMPRESSION_DICT_PATH={output} python scripts/recompress_message_contents.py --old-dict <旧辞書>")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="zstd共有辞書の学習")
+    parser.add_argument("--output", default="data/zstd_dict.bin")
+    parser.add_argument("--dict-size", type=int, default=64 * 1024)
+    parser.add_argument("--samples", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.output, args.dict_size, args.samples)
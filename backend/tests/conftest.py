@@ -0,0 +1,25 @@
+"""
+テスト共通設定
+app.database はインポート時にエンジンを作成するため、アプリより先にテスト用の一時DBを指定する
+（開発用の data/sensechat.db やマイグレーション済みの状態に依存しない）
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_test_db_dir = tempfile.mkdtemp(prefix="sensechat-test-")
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{_test_db_dir}/test.db"
+
+from app.database import Base, engine  # noqa: E402
+import app.models  # noqa: E402,F401
+
+
+@pytest.fixture(scope="session", autouse=True)
+def test_database():
+    """テスト用DBに全テーブルを作成"""
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
@@ -1,5 +1,5 @@
 """
-API テスト
+API テスト（DBは conftest.py のテスト用一時DB）
 """
 
 import pytest
@@ -67,3 +67,168 @@ def test_embed_message_no_user():
         json={"text": "テストメッセージです"}
     )
     assert response.status_code == 401
+
+def test_deliver_fanout():
+    """複数受信者への一括配信テスト"""
+    embed = client.post(
+        "/api/v1/embed",
+        json={"text": "家族への連絡です", "lang_hint": "ja"},
+        headers={"X-User-ID": "user_1"}
+    )
+    message_id = embed.json()["message_id"]
+    
+    response = client.post(
+        "/api/v1/deliver/fanout",
+        json={
+            "to_user_ids": ["user_2", "user_3", "user_2"],
+            "message_id": message_id,
+            "thread_id": "thread_fanout_test"
+        },
+        headers={"X-User-ID": "user_1"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [d["user_id"] for d in data["deliveries"]] == ["user_2", "user_3"]
+    assert len({d["delivery_id"] for d in data["deliveries"]}) == 2
+
+def test_deliver_fanout_unknown_message():
+    """存在しないメッセージの一括配信は404"""
+    response = client.post(
+        "/api/v1/deliver/fanout",
+        json={"to_user_ids": ["user_2"], "message_id": "missing", "thread_id": "t"},
+        headers={"X-User-ID": "user_1"}
+    )
+    assert response.status_code == 404
+
+def test_inbox_summary_and_mark_read():
+    """未読数サマリーと一括既読テスト"""
+    embed = client.post(
+        "/api/v1/embed",
+        json={"text": "未読テストです", "lang_hint": "ja"},
+        headers={"X-User-ID": "user_1"}
+    )
+    message_id = embed.json()["message_id"]
+    thread_id = f"thread_unread_{message_id}"
+    client.post(
+        "/api/v1/deliver/fanout",
+        json={"to_user_ids": ["user_4"], "message_id": message_id, "thread_id": thread_id},
+        headers={"X-User-ID": "user_1"}
+    )
+    
+    summary = client.get("/api/v1/inbox/summary", headers={"X-User-ID": "user_4"}).json()
+    assert summary["threads"][thread_id] == 1
+    
+    response = client.post(
+        "/api/v1/inbox/read",
+        json={"thread_id": thread_id},
+        headers={"X-User-ID": "user_4"}
+    )
+    assert response.status_code == 200
+    assert response.json()["updated"] == 1
+    
+    summary = client.get("/api/v1/inbox/summary", headers={"X-User-ID": "user_4"}).json()
+    assert thread_id not in summary["threads"]
+
+def test_mark_read_requires_target():
+    """対象指定なしの一括既読は422"""
+    response = client.post("/api/v1/inbox/read", json={}, headers={"X-User-ID": "user_4"})
+    assert response.status_code == 422
+
+def test_search_messages():
+    """メッセージ要約の全文検索テスト"""
+    embed = client.post(
+        "/api/v1/embed",
+        json={"text": "来週の旅行の計画です", "lang_hint": "ja"},
+        headers={"X-User-ID": "user_1"}
+    )
+    message_id = embed.json()["message_id"]
+    
+    response = client.get("/api/v1/search", params={"q": "旅行"}, headers={"X-User-ID": "user_1"})
+    assert response.status_code == 200
+    assert message_id in [r["message_id"] for r in response.json()["results"]]
+    
+    # 参加していないユーザーには返らない
+    response = client.get("/api/v1/search", params={"q": "旅行"}, headers={"X-User-ID": "user_9"})
+    assert message_id not in [r["message_id"] for r in response.json()["results"]]
+    
+    # ハイブリッド検索（全文 + ベクトル）
+    response = client.get(
+        "/api/v1/search", params={"q": "旅行", "mode": "hybrid"}, headers={"X-User-ID": "user_1"}
+    )
+    assert response.status_code == 200
+    assert message_id in [r["message_id"] for r in response.json()["results"]]
+
+def test_thread_timeline_etag():
+    """スレッドタイムラインの一括取得とETagによる304"""
+    embed = client.post(
+        "/api/v1/embed",
+        json={"text": "タイムラインテストです", "lang_hint": "ja"},
+        headers={"X-User-ID": "user_1"}
+    )
+    message_id = embed.json()["message_id"]
+    thread_id = f"thread_timeline_{message_id}"
+    client.post(
+        "/api/v1/deliver/fanout",
+        json={"to_user_ids": ["user_4"], "message_id": message_id, "thread_id": thread_id},
+        headers={"X-User-ID": "user_1"}
+    )
+    
+    response = client.get(f"/api/v1/threads/{thread_id}/timeline", headers={"X-User-ID": "user_4"})
+    assert response.status_code == 200
+    messages = response.json()["messages"]
+    assert [m["id"] for m in messages] == [message_id]
+    assert messages[0]["status"] == "unread"
+    etag = response.headers["ETag"]
+    
+    # 配信されたメッセージはメッセージ一覧・件数にも含まれる
+    response = client.get(
+        f"/api/v1/threads/{thread_id}/messages", params={"count": "exact"}, headers={"X-User-ID": "user_4"}
+    )
+    assert [m["id"] for m in response.json()["messages"]] == [message_id]
+    assert response.json()["total_count"] == 1
+    
+    response = client.get(
+        f"/api/v1/threads/{thread_id}/timeline",
+        headers={"X-User-ID": "user_4", "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    
+    # 既読にするとETagが変わる
+    client.post("/api/v1/inbox/read", json={"thread_id": thread_id}, headers={"X-User-ID": "user_4"})
+    response = client.get(
+        f"/api/v1/threads/{thread_id}/timeline",
+        headers={"X-User-ID": "user_4", "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["messages"][0]["status"] == "read"
+    assert response.headers["ETag"] != etag
+
+def test_embed_server_timing():
+    """段階別の処理時間が Server-Timing ヘッダーと（?timing=true で）レスポンスに含まれること"""
+    response = client.post(
+        "/api/v1/embed?timing=true",
+        json={"text": "処理時間の内訳を確認します", "lang_hint": "ja"},
+        headers={"X-User-ID": "user_1"}
+    )
+    assert response.status_code == 200
+    header = response.headers["Server-Timing"]
+    stages = [entry.split(";")[0].strip() for entry in header.split(",")]
+    assert stages == ["summarize", "embed", "slots", "db_write", "index", "total"]
+    assert set(response.json()["timings"]) == {"summarize", "embed", "slots", "db_write", "index"}
+    
+    # 指定しなければレスポンスには含めない
+    response = client.post(
+        "/api/v1/embed",
+        json={"text": "処理時間の内訳を確認します", "lang_hint": "ja"},
+        headers={"X-User-ID": "user_1"}
+    )
+    assert response.json()["timings"] is None
+    
+    # エラーになったリクエストでも、そこまでの段階が返ること
+    response = client.post(
+        "/api/v1/render",
+        json={"message_id": "missing", "recipient_id": "user_2"},
+        headers={"X-User-ID": "user_1"}
+    )
+    assert response.status_code == 404
+    assert response.headers["Server-Timing"].startswith("db_read;dur=")
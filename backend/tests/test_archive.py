@@ -0,0 +1,111 @@
+"""
+コールドアーカイブテスト
+"""
+
+import asyncio
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+pytest.importorskip("pyarrow")
+
+from app.archive import ArchiveReader, MessageArchiver
+from app.database import Base
+from app.models import Message, MessageContent, Inbox
+from app.services.vector_service import VectorService
+from app.sweeper import ExpiredMessageSweeper
+
+
+async def _sweep_with_archive(db_path, archive_dir, file_format):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    vectors = VectorService(dimension=4)
+    now = datetime(2026, 1, 3)
+    async with session_factory() as db:
+        for i in range(5):
+            # 2件は前日、2件は前々日に期限切れ、1件は有効
+            expires_at = now + [timedelta(days=-1), timedelta(days=-2), timedelta(hours=1)][min(i // 2, 2)]
+            message = Message(id=f"msg_{i}", sender_id="user_1", summary=f"message {i}",
+                              vector_id=f"vec_{i}", expires_at=expires_at)
+            db.add(message)
+            db.add(Inbox(user_id="user_2", message_id=message.id, status="unread"))
+            db.add(MessageContent(message_id=message.id, user_id="user_1", content_type="original",
+                                  text="長文テキスト" * 100))
+            vectors.add(f"vec_{i}", np.arange(4, dtype=np.float32) + i)
+        await db.commit()
+
+    archiver = MessageArchiver(str(archive_dir), file_format=file_format,
+                               vector_lookup=vectors.get, dimension=4)
+    sweeper = ExpiredMessageSweeper(
+        session_factory=session_factory,
+        batch_size=3,
+        duty_cycle=1.0,
+        vector_cleanup=vectors.remove,
+        archiver=archiver,
+    )
+    deleted = await sweeper.sweep_once(now=now)
+
+    async with session_factory() as db:
+        remaining = (await db.execute(select(func.count()).select_from(Message))).scalar_one()
+    await engine.dispose()
+    return deleted, remaining
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_sweep_archives_before_delete(tmp_path, file_format):
+    """削除したメッセージと関連行・ベクトルが日付パーティションに書き出されること"""
+    deleted, remaining = asyncio.run(
+        _sweep_with_archive(tmp_path / "archive.db", tmp_path / "archive", file_format)
+    )
+    assert (deleted, remaining) == (4, 1)
+
+    reader = ArchiveReader(str(tmp_path / "archive"))
+    messages = reader.read_table("messages")
+    assert sorted(messages.column("id").to_pylist()) == ["msg_0", "msg_1", "msg_2", "msg_3"]
+    assert reader.read_table("inbox").num_rows == 4
+    assert set(reader.read_table("message_contents").column("text").to_pylist()) == {"長文テキスト" * 100}
+
+    # 日付範囲の指定でパーティションを絞り込める
+    day = reader.read_table("messages", start=date(2026, 1, 2), end=date(2026, 1, 2), columns=["id"])
+    assert sorted(day.column("id").to_pylist()) == ["msg_0", "msg_1"]
+
+    vectors = reader.read_table("vectors")
+    by_id = dict(zip(vectors.column("vector_id").to_pylist(), vectors.column("vector").to_pylist()))
+    assert set(by_id) == {"vec_0", "vec_1", "vec_2", "vec_3"}
+    expected = np.arange(4, dtype=np.float32) + 2
+    assert np.allclose(by_id["vec_2"], expected / np.linalg.norm(expected))
+
+
+async def _archive_with_missing_vectors(db_path, archive_dir):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    # vec_1 は別のワーカーで作成された（このプロセスのインデックスにない）
+    vectors = VectorService(dimension=4)
+    vectors.add("vec_0", np.ones(4, dtype=np.float32))
+    async with session_factory() as db:
+        for i in range(2):
+            db.add(Message(id=f"msg_{i}", sender_id="user_1", summary=f"message {i}",
+                           vector_id=f"vec_{i}", expires_at=datetime(2026, 1, 1)))
+        await db.commit()
+        archiver = MessageArchiver(str(archive_dir), vector_lookup=vectors.get, dimension=4)
+        archived = await archiver.archive(db, ["msg_0", "msg_1"])
+    await engine.dispose()
+    return archived, archiver
+
+
+def test_missing_vectors_are_counted(tmp_path):
+    """インデックスにないベクトルは書き出さずに件数を報告すること"""
+    archived, archiver = asyncio.run(_archive_with_missing_vectors(tmp_path / "missing.db", tmp_path / "archive"))
+    assert archived == 2
+    assert (archiver.vectors_written, archiver.vectors_missing) == (1, 1)
+    reader = ArchiveReader(str(tmp_path / "archive"))
+    assert reader.read_table("vectors").column("vector_id").to_pylist() == ["vec_0"]
@@ -0,0 +1,62 @@
+"""
+テキスト圧縮テスト
+"""
+
+import importlib.util
+import os
+
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import Session
+
+from app.compression import TextCodec, HEADER_PLAIN, HEADER_ZLIB
+from app.database import Base
+from app.models import MessageContent
+
+
+def test_threshold_and_roundtrip():
+    """閾値未満は平文、以上は圧縮され、いずれも元に戻ること"""
+    codec = TextCodec("zlib", threshold=64)
+    short = "こんにちは"
+    long = "明日の会議の件で、資料の準備をお願いします。" * 20
+
+    assert codec.encode(short)[:1] == HEADER_PLAIN
+    assert codec.encode(long)[:1] == HEADER_ZLIB
+    assert codec.decode(codec.encode(short)) == short
+    assert codec.decode(codec.encode(long)) == long
+    assert codec.stats.snapshot()["ratio"] > 1
+
+
+def test_legacy_text_values_are_readable():
+    """圧縮導入前のTEXT値も読み出せること"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    long = "再構成されたテキスト。" * 50
+    with Session(engine) as db:
+        db.add(MessageContent(id="c1", message_id="m1", user_id="u1", content_type="rendered", text=long))
+        db.execute(text(
+            "INSERT INTO message_contents (id, message_id, user_id, content_type, text) "
+            "VALUES ('c2', 'm1', 'u1', 'original', 'legacy plain text')"
+        ))
+        db.commit()
+
+        stored = db.execute(text("SELECT length(text) FROM message_contents WHERE id = 'c1'")).scalar()
+        assert stored < len(long.encode("utf-8"))
+        texts = dict(db.execute(select(MessageContent.id, MessageContent.text)).all())
+    assert texts == {"c1": long, "c2": "legacy plain text"}
+
+
+def test_migration_codec_is_compatible():
+    """マイグレーション005に固定した形式がアプリのコーデックで読めること"""
+    path = os.path.join(os.path.dirname(__file__), "..", "migrations", "versions", "005_compress_message_contents.py")
+    spec = importlib.util.spec_from_file_location("migration_005", path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    codec = TextCodec("none")
+    short = "こんにちは"
+    long = "明日の会議の件で、資料の準備をお願いします。" * 20
+    assert migration._encode(short)[:1] == HEADER_PLAIN
+    assert migration._encode(long)[:1] == HEADER_ZLIB
+    assert codec.decode(migration._encode(long)) == long
+    # アプリで圧縮した値も downgrade で平文に戻せること
+    assert migration._decode(TextCodec("zlib", threshold=16).encode(long)) == long
@@ -0,0 +1,46 @@
+"""
+接続レジストリテスト
+"""
+
+from app.connection_registry import ConnectionRegistry
+
+
+def test_multiple_devices_reference_counted():
+    """2台目の接続で1台目が上書きされず、最後の端末の切断でのみ未接続になること"""
+    registry = ConnectionRegistry()
+    assert registry.register("sid_phone", "user_1", device_id="phone") == (True, None)
+    assert registry.register("sid_laptop", "user_1", device_id="laptop") == (False, None)
+    assert registry.sids_of("user_1") == {"sid_phone", "sid_laptop"}
+    assert registry.user_of("sid_laptop") == "user_1"
+
+    session, last = registry.unregister("sid_phone")
+    assert (session.device_id, last) == ("phone", False)
+    assert registry.is_connected("user_1")
+
+    session, last = registry.unregister("sid_laptop")
+    assert last is True
+    assert not registry.is_connected("user_1")
+    assert registry.user_of("sid_laptop") is None
+    assert registry.unregister("sid_laptop") == (None, False)
+    assert len(registry) == 0
+
+
+def test_same_device_reconnect_replaces_stale_sid():
+    """同じ端末の再接続は古い接続を置き換えること"""
+    registry = ConnectionRegistry()
+    registry.register("sid_old", "user_1", device_id="phone", user_agent="app/1.0")
+    first, replaced = registry.register("sid_new", "user_1", device_id="phone")
+    assert first is True  # 古い接続を外した後の登録
+    assert replaced.sid == "sid_old"
+    assert registry.sids_of("user_1") == {"sid_new"}
+    assert registry.sid_users() == {"sid_new": "user_1"}
+
+
+def test_reregister_as_other_user():
+    """同じ接続を別ユーザーとして登録し直すと元のユーザーから外れること"""
+    registry = ConnectionRegistry()
+    registry.register("sid_1", "user_1")
+    assert registry.register("sid_1", "user_1") == (False, None)
+    registry.register("sid_1", "user_2")
+    assert not registry.is_connected("user_1")
+    assert registry.user_of("sid_1") == "user_2"
@@ -0,0 +1,100 @@
+"""
+単一ライター（グループコミット）テスト
+"""
+
+import asyncio
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.db_writer import GroupCommitWriter, WriteBehindInserter
+from app.models import Message
+
+
+async def _run_writes(db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    writer = GroupCommitWriter(session_factory, max_batch=16, max_delay_ms=20)
+    writer.start()
+
+    def make_write(i):
+        async def write(session):
+            if i == 3:
+                raise ValueError("bad write")
+            session.add(Message(id=f"msg_{i}", sender_id="user_1", summary=f"message {i}"))
+            await session.flush()
+            return i
+        return write
+
+    results = await asyncio.gather(
+        *(writer.submit(make_write(i)) for i in range(10)),
+        return_exceptions=True
+    )
+    await writer.stop()
+
+    async with session_factory() as db:
+        count = (await db.execute(select(func.count()).select_from(Message))).scalar_one()
+    await engine.dispose()
+    return results, count, writer
+
+
+def test_group_commit_isolates_failed_write(tmp_path):
+    """1件の失敗が同じグループの他の書き込みに影響しないこと"""
+    results, count, writer = asyncio.run(_run_writes(tmp_path / "writer.db"))
+
+    assert isinstance(results[3], ValueError)
+    assert [r for i, r in enumerate(results) if i != 3] == [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert count == 9
+    assert writer.writes == 9
+
+
+async def _run_inserts(db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    inserter = WriteBehindInserter(session_factory, Message.__table__, max_batch=8, max_delay_ms=20)
+    inserter.start()
+
+    rows = [
+        {"id": f"msg_{i}", "sender_id": "user_1", "summary": f"write behind {i}",
+         "created_at": datetime(2026, 1, 1), "expires_at": datetime(2026, 1, 2)}
+        for i in range(20)
+    ]
+    # 重複IDの行は複数行INSERTを失敗させるが、他の行は書き込まれる
+    rows.append(dict(rows[0]))
+    results = await asyncio.gather(*(inserter.submit(row) for row in rows), return_exceptions=True)
+
+    # 停止時にバッファ中の行が書き込まれること
+    pending = asyncio.ensure_future(inserter.submit(
+        {"id": "msg_last", "sender_id": "user_1", "summary": "last", "expires_at": datetime(2026, 1, 2)}
+    ))
+    await asyncio.sleep(0)
+    await inserter.stop()
+    await pending
+
+    async with session_factory() as db:
+        stored = (await db.execute(select(Message.id, Message.search_text))).all()
+    await engine.dispose()
+    return results, stored, inserter
+
+
+def test_write_behind_batches_inserts(tmp_path):
+    """複数行INSERTにまとめてコミットし、失敗した行だけがエラーになること"""
+    results, stored, inserter = asyncio.run(_run_inserts(tmp_path / "inserter.db"))
+
+    assert all(r is None for r in results[:20])
+    assert isinstance(results[20], Exception)
+    assert len(stored) == 22 - 1
+    assert "msg_last" in {row.id for row in stored}
+    # search_text は要約から生成される
+    assert all(row.search_text for row in stored)
+    assert inserter.writes == 21
+    # 1行ずつのやり直しを除けば、コミット数は行数より大幅に少ない
+    assert inserter.commits < inserter.writes
@@ -0,0 +1,26 @@
+"""
+主キーID生成テスト
+"""
+
+import uuid
+from datetime import datetime
+
+from app.ids import is_uuid7, new_id, uuid7, uuid7_timestamp
+
+
+def test_uuid7_is_time_ordered():
+    """生成順に文字列としても昇順に並び、重複しないこと"""
+    ids = [new_id() for _ in range(10000)]
+    assert ids == sorted(ids)
+    assert len(set(ids)) == len(ids)
+    assert all(uuid.UUID(i).version == 7 and uuid.UUID(i).variant == uuid.RFC_4122 for i in ids[:10])
+
+
+def test_uuid7_timestamp_roundtrip():
+    """指定時刻のIDから時刻を取り出せること（再採番用）"""
+    at = datetime(2026, 1, 1, 12, 30, 15, 250000)
+    value = str(uuid7(at))
+    assert uuid7_timestamp(value) == at
+    assert is_uuid7(value)
+    assert not is_uuid7(str(uuid.uuid4()))
+    assert not is_uuid7("user_1")
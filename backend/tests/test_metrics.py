@@ -0,0 +1,76 @@
+"""
+Prometheus メトリクステスト
+"""
+
+import pytest
+
+prometheus_client = pytest.importorskip("prometheus_client")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app import metrics
+
+
+def _value(name, labels):
+    return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.fixture
+def metrics_enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "enabled", True)
+
+
+def test_request_duration_by_route_template(metrics_enabled):
+    """パスパラメータではなくルートのテンプレート・ステータス別に記録されること"""
+    app = FastAPI()
+    app.middleware("http")(metrics.metrics_middleware)
+    app.include_router(metrics.router)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        with metrics.observe_stage("llm"):
+            pass
+        return {"id": item_id}
+
+    labels = {"method": "GET", "route": "/items/{item_id}", "status": "200"}
+    before = _value("sensechat_http_request_duration_seconds_count", labels)
+    stage_before = _value("sensechat_stage_duration_seconds_count", {"stage": "llm"})
+    client = TestClient(app)
+    client.get("/items/a")
+    client.get("/items/b")
+
+    assert _value("sensechat_http_request_duration_seconds_count", labels) == before + 2
+    assert _value("sensechat_stage_duration_seconds_count", {"stage": "llm"}) == stage_before + 2
+    body = client.get("/metrics").text
+    assert 'route="/items/{item_id}"' in body
+    assert "/items/a" not in body
+
+
+def test_cache_and_runtime_gauges(metrics_enabled):
+    """キャッシュのヒット/ミスと、接続数・実行キュー・ループ遅延のゲージが反映されること"""
+    hits = _value("sensechat_cache_requests_total", {"cache": "test_cache", "result": "hit"})
+    metrics.record_cache("test_cache", True)
+    metrics.record_cache("test_cache", False)
+    assert _value("sensechat_cache_requests_total", {"cache": "test_cache", "result": "hit"}) == hits + 1
+
+    monitor = metrics.RuntimeMonitor()
+    monitor.queue_depths = {"db_writer": lambda: 7}
+    monitor.socket_stats = lambda: {"connections": 3, "outbound": {"slow_consumers": 1}}
+    monitor.sample(0.25)
+
+    assert _value("sensechat_executor_queue_depth", {"executor": "db_writer"}) == 7
+    assert _value("sensechat_socketio_connections", {}) == 3
+    assert _value("sensechat_socketio_slow_consumers_disconnected", {}) == 1
+    assert _value("sensechat_event_loop_lag_seconds", {}) == 0.25
+
+
+def test_disabled_metrics_are_noop(monkeypatch):
+    """無効時は計測しないこと"""
+    monkeypatch.setattr(metrics, "enabled", False)
+    before = _value("sensechat_stage_duration_seconds_count", {"stage": "noop"})
+    with metrics.observe_stage("noop"):
+        pass
+    metrics.record_cache("noop", True)
+    assert _value("sensechat_stage_duration_seconds_count", {"stage": "noop"}) == before
+    assert _value("sensechat_cache_requests_total", {"cache": "noop", "result": "hit"}) == 0
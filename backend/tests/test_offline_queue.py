@@ -0,0 +1,117 @@
+"""
+オフライン配信キューテスト
+"""
+
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.database import AsyncSessionLocal, SessionLocal
+from app.models import Inbox, Message
+from app.services.offline_queue_service import OfflineQueueService
+from app.services.presence_service import PresenceService
+from app.websocket_manager import SocketManager
+
+
+def _manager(batch_size, session_factory=None):
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    queue = OfflineQueueService(redis_client=redis_client, ttl_seconds=60, max_len=100)
+    manager = SocketManager(presence=PresenceService(redis_client=redis_client), session_factory=session_factory, offline_queue=queue)
+    manager.replay_batch_size = batch_size
+    emitted = []
+
+    async def record(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+    manager.sio.emit = record
+
+    async def noop(*args, **kwargs):
+        pass
+    manager.sio.enter_room = noop
+
+    async def get_session(sid):
+        return {}
+    manager.sio.get_session = get_session
+    return manager, queue, emitted
+
+
+def test_queue_ack_trims_stream():
+    """ack したIDまでが削除され、以降のイベントは残ること"""
+    async def scenario():
+        queue = OfflineQueueService(redis_client=fakeredis.FakeAsyncRedis(decode_responses=True), ttl_seconds=60, max_len=100)
+        ids = await queue.enqueue_many([("user_2", "new_delivery", {"n": i}) for i in range(3)])
+        await queue.ack("user_2", ids[1])
+        remaining = await queue.pending("user_2", 10)
+        # 不正なIDの ack は無視
+        assert await queue.ack("user_2", "bad") is False
+        return ids, remaining
+
+    ids, remaining = asyncio.run(scenario())
+    assert remaining == [(ids[2], "new_delivery", {"n": 2})]
+
+
+def test_replay_missed_events_on_register():
+    """オフライン中のイベントが再接続時にまとめて再送され、ack で続きが送られること"""
+    async def scenario():
+        manager, queue, emitted = _manager(batch_size=2)
+        for i in range(3):
+            await manager.broadcast_new_message({"message_id": f"msg_{i}"}, sender_id="user_1", recipient_id="user_2")
+        assert not [e for e in emitted if e[0] == "new_message"]
+
+        handlers = manager.sio.handlers["/"]
+        await handlers["user_register"]("sid_2", {"user_id": "user_2"})
+        first = [data for event, data, room in emitted if event == "missed_events"]
+        await handlers["ack_events"]("sid_2", {"last_id": first[0]["events"][-1]["id"]})
+        replays = [data for event, data, room in emitted if event == "missed_events"]
+        await handlers["ack_events"]("sid_2", {"last_id": replays[-1]["events"][-1]["id"]})
+        return replays, await queue.pending("user_2", 10)
+
+    replays, remaining = asyncio.run(scenario())
+    assert [[e["data"]["message_id"] for e in r["events"]] for r in replays] == [["msg_0", "msg_1"], ["msg_2"]]
+    assert [r["has_more"] for r in replays] == [True, False]
+    assert remaining == []
+
+
+def test_inbox_replay_resumes_after_acked_cursor():
+    """Redis利用不可時の受信箱からの再送は、ack したIDの後から続きを送り、再接続で同じ配信を再送しないこと"""
+    user_id = f"user_{uuid.uuid4()}"
+    base_time = datetime(2026, 1, 1)
+    db = SessionLocal()
+    try:
+        for i in range(3):
+            message = Message(id=f"msg_{uuid.uuid4()}", sender_id="user_1", summary=f"message {i}", created_at=base_time)
+            db.add(message)
+            # 2件を同じ作成時刻にして id のタイブレークを確認
+            db.add(Inbox(user_id=user_id, message_id=message.id, status="unread", created_at=base_time + timedelta(minutes=i // 2)))
+        db.commit()
+        expected = [row.message_id for row in db.query(Inbox).filter(Inbox.user_id == user_id).order_by(Inbox.created_at, Inbox.id)]
+    finally:
+        db.close()
+
+    async def scenario():
+        manager, queue, emitted = _manager(batch_size=2, session_factory=AsyncSessionLocal)
+        queue._redis_down_until = time.monotonic() + 60
+        handlers = manager.sio.handlers["/"]
+
+        def replays():
+            return [data for event, data, room in emitted if event == "missed_events"]
+
+        await handlers["user_register"]("sid_2", {"user_id": user_id})
+        await handlers["ack_events"]("sid_2", {"last_id": replays()[-1]["events"][-1]["id"]})
+        last_id = replays()[-1]["events"][-1]["id"]
+        # 最後まで ack した後は何も送らない
+        await handlers["ack_events"]("sid_2", {"last_id": last_id})
+        # 再接続: ack 済みのカーソルを渡すと再送なし、渡さなければ先頭から
+        await handlers["user_register"]("sid_3", {"user_id": user_id, "inbox_cursor": last_id[len("inbox:"):]})
+        before_reset = len(replays())
+        await handlers["user_register"]("sid_4", {"user_id": user_id})
+        return replays(), before_reset
+
+    replays, before_reset = asyncio.run(scenario())
+    assert before_reset == 2
+    assert [[e["data"]["message_id"] for e in r["events"]] for r in replays] == [expected[:2], expected[2:], expected[:2]]
+    assert [r["has_more"] for r in replays[:2]] == [True, False]
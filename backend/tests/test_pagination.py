@@ -0,0 +1,119 @@
+"""
+キーセットページネーションテスト
+"""
+
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+from app.database import SessionLocal, Base, engine
+from app.models import Message
+from app.pagination import encode_cursor, decode_cursor, DIRECTION_NEXT
+from main import app
+
+client = TestClient(app)
+
+
+def test_cursor_roundtrip():
+    """カーソルのエンコード/デコード"""
+    created_at = datetime(2026, 1, 2, 3, 4, 5)
+    cursor = encode_cursor(created_at, "msg_1", DIRECTION_NEXT)
+    assert decode_cursor(cursor) == (created_at, "msg_1", DIRECTION_NEXT)
+
+
+def test_invalid_cursor():
+    """無効なカーソルは400"""
+    response = client.get(
+        "/api/v1/threads/any/messages",
+        params={"cursor": "not-a-cursor"},
+        headers={"X-User-ID": "user_1"}
+    )
+    assert response.status_code == 400
+
+
+def test_thread_messages_keyset_pages():
+    """同一時刻を含むメッセージを重複・欠落なく前後にページングできること"""
+    Base.metadata.create_all(bind=engine)
+    thread_id = f"thread_{uuid.uuid4()}"
+    base_time = datetime(2026, 1, 1)
+    db = SessionLocal()
+    try:
+        for i in range(5):
+            db.add(Message(
+                thread_id=thread_id,
+                sender_id="user_1",
+                summary=f"message {i}",
+                # 2件ずつ同じ作成時刻にして id のタイブレークを確認
+                created_at=base_time + timedelta(minutes=i // 2)
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+    headers = {"X-User-ID": "user_1"}
+    url = f"/api/v1/threads/{thread_id}/messages"
+
+    seen = []
+    params = {"limit": 2, "count": "exact"}
+    pages = []
+    while True:
+        data = client.get(url, params=params, headers=headers).json()
+        pages.append(data)
+        seen.extend(m["id"] for m in data["messages"])
+        if not data["next_cursor"]:
+            break
+        params = {"limit": 2, "cursor": data["next_cursor"]}
+
+    assert pages[0]["total_count"] == 5
+    assert pages[0]["prev_cursor"] is None
+    assert len(seen) == 5 and len(set(seen)) == 5
+    assert [p["has_more"] for p in pages] == [True, True, False]
+
+    # 最後のページから新しい方向へ戻る
+    back = client.get(
+        url, params={"limit": 2, "cursor": pages[-1]["prev_cursor"]}, headers=headers
+    ).json()
+    assert [m["id"] for m in back["messages"]] == [m["id"] for m in pages[1]["messages"]]
+
+
+def test_delivered_messages_in_thread_page_count_and_timeline():
+    """/deliver で配信したメッセージ（スレッドIDは受信箱のみ）がページ・件数・タイムラインに含まれること"""
+    Base.metadata.create_all(bind=engine)
+    thread_id = f"thread_{uuid.uuid4()}"
+    base_time = datetime(2026, 1, 1)
+    db = SessionLocal()
+    try:
+        expires_at = datetime.now() + timedelta(hours=1)
+        created = Message(thread_id=thread_id, sender_id="user_1", summary="created",
+                          created_at=base_time, expires_at=expires_at)
+        delivered = Message(sender_id="user_1", summary="delivered",
+                            created_at=base_time + timedelta(minutes=1), expires_at=expires_at)
+        db.add_all([created, delivered])
+        db.commit()
+        created_id, delivered_id = created.id, delivered.id
+    finally:
+        db.close()
+
+    # 同じメッセージを2人に配信しても1件として数える
+    for recipient_id in ("user_2", "user_3"):
+        response = client.post(
+            "/api/v1/deliver",
+            json={"to_user_id": recipient_id, "message_id": delivered_id, "thread_id": thread_id},
+            headers={"X-User-ID": "user_1"}
+        )
+        assert response.status_code == 200
+
+    headers = {"X-User-ID": "user_2"}
+    first = client.get(
+        f"/api/v1/threads/{thread_id}/messages", params={"limit": 1, "count": "exact"}, headers=headers
+    ).json()
+    assert [m["id"] for m in first["messages"]] == [delivered_id]
+    assert first["total_count"] == 2
+    second = client.get(
+        f"/api/v1/threads/{thread_id}/messages", params={"limit": 1, "cursor": first["next_cursor"]}, headers=headers
+    ).json()
+    assert [m["id"] for m in second["messages"]] == [created_id]
+    assert second["has_more"] is False
+
+    timeline = client.get(f"/api/v1/threads/{thread_id}/timeline", headers=headers).json()
+    assert [(m["id"], m["status"]) for m in timeline["messages"]] == [(delivered_id, "unread"), (created_id, None)]
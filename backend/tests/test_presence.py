@@ -0,0 +1,134 @@
+"""
+共有プレゼンス・ワーカー間配信テスト
+"""
+
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services.presence_service import PresenceService
+from app.websocket_manager import SocketManager, user_room
+
+
+def _presence(ttl_seconds=60):
+    return PresenceService(redis_client=fakeredis.FakeAsyncRedis(decode_responses=True), ttl_seconds=ttl_seconds)
+
+
+def test_presence_shared_between_workers():
+    """別ワーカーの接続も含めて、最後の接続が切れたときだけオフラインになること"""
+    async def scenario():
+        presence = _presence()
+        first = await presence.connect("user_1", "sid_worker_a")
+        second = await presence.connect("user_1", "sid_worker_b")
+        online = await presence.online(["user_1", "user_2"])
+        partial = await presence.disconnect("user_1", "sid_worker_a")
+        last = await presence.disconnect("user_1", "sid_worker_b")
+        after = await presence.online_users()
+        return first, second, online, partial, last, after
+
+    first, second, online, partial, last, after = asyncio.run(scenario())
+    assert (first, second) == (True, False)
+    assert online == {"user_1"}
+    assert (partial, last) == (False, True)
+    assert after == []
+
+
+def test_presence_expires_without_refresh():
+    """更新されない接続（異常終了したワーカー）は期限切れでオフライン扱いになること"""
+    async def scenario():
+        presence = _presence(ttl_seconds=-1)
+        await presence.connect("user_1", "sid_crashed")
+        return await presence.online(["user_1"]), await presence.online_users()
+
+    assert asyncio.run(scenario()) == (set(), [])
+
+
+def test_broadcast_reaches_user_on_other_worker():
+    """受信者が別ワーカーに接続していてもユーザールーム宛てに送信されること"""
+    async def scenario():
+        presence = _presence()
+        # 受信者は別ワーカーに接続済み（このワーカーの connections には存在しない）
+        await presence.connect("user_2", "sid_other_worker")
+        manager = SocketManager(presence=presence)
+        emitted = []
+
+        async def record(event, data=None, room=None, **kwargs):
+            emitted.append((event, room))
+        manager.sio.emit = record
+
+        await manager.broadcast_new_message({"message_id": "msg_1"}, sender_id="user_1", recipient_id="user_2")
+        return emitted
+
+    assert asyncio.run(scenario()) == [("new_message", user_room("user_2"))]
+
+
+def _manager(presence, rooms):
+    """Socket.IOの送信を記録し、プレゼンスルームを固定したマネージャー"""
+    manager = SocketManager(presence=presence, session_factory=None)
+    emitted = []
+
+    async def record(event, data=None, room=None, **kwargs):
+        emitted.append((event, data, room))
+    manager.sio.emit = record
+
+    async def noop(*args, **kwargs):
+        pass
+    manager.sio.enter_room = noop
+    manager.sio.leave_room = noop
+
+    async def get_session(sid):
+        return {"user_agent": "test"}
+    manager.sio.get_session = get_session
+
+    async def load_presence_rooms(user_id):
+        return {room: members for room, members in rooms.items() if user_id in members}
+    manager.load_presence_rooms = load_presence_rooms
+    return manager, emitted
+
+
+def test_offline_only_after_last_device():
+    """複数端末のうち1台の切断ではオフライン差分を送らないこと"""
+    async def scenario():
+        room = "presence:family:tanaka"
+        manager, emitted = _manager(_presence(), {room: {"user_1", "user_2"}})
+        handlers = manager.sio.handlers["/"]
+        deltas = lambda: [(data["version"], data["changes"]) for event, data, _ in emitted if event == "presence_delta"]
+
+        await handlers["user_register"]("sid_phone", {"user_id": "user_1", "device_id": "phone"})
+        await handlers["user_register"]("sid_laptop", {"user_id": "user_1", "device_id": "laptop"})
+        await manager.flush_presence_deltas()
+        await handlers["disconnect"]("sid_phone")
+        await manager.flush_presence_deltas()
+        after_first = deltas()
+        await handlers["disconnect"]("sid_laptop")
+        await manager.flush_presence_deltas()
+        return after_first, deltas()
+
+    after_first, deltas = asyncio.run(scenario())
+    assert after_first == [(1, [{"user_id": "user_1", "status": "online"}])]
+    assert deltas[1:] == [(2, [{"user_id": "user_1", "status": "offline"}])]
+
+
+def test_presence_scoped_to_shared_rooms():
+    """ルームを共有しないユーザーには差分もスナップショットも送らないこと"""
+    async def scenario():
+        rooms = {"presence:thread:t1": {"user_1", "user_2"}, "presence:thread:t2": {"user_3"}}
+        manager, emitted = _manager(_presence(), rooms)
+        handlers = manager.sio.handlers["/"]
+        await handlers["user_register"]("sid_2", {"user_id": "user_2"})
+        await handlers["user_register"]("sid_3", {"user_id": "user_3"})
+        await manager.flush_presence_deltas()
+        emitted.clear()
+
+        await handlers["user_register"]("sid_1", {"user_id": "user_1"})
+        await manager.flush_presence_deltas()
+        return emitted
+
+    emitted = asyncio.run(scenario())
+    snapshot = next(data for event, data, room in emitted if event == "presence_snapshot")
+    assert snapshot == {"rooms": {"presence:thread:t1": {"version": 1, "online": ["user_1", "user_2"]}}}
+    # 1回のemitで、共有ルームのみに送信
+    deltas = [(data["changes"], room) for event, data, room in emitted if event == "presence_delta"]
+    assert deltas == [([{"user_id": "user_1", "status": "online"}], "presence:thread:t1")]
@@ -0,0 +1,70 @@
+"""
+プレゼンスルーム（スレッド参加者）テスト
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.models import Inbox, Message, Thread
+from app.presence_rooms import conversation_room, load_user_rooms, thread_room
+
+
+async def _rooms(db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    expires_at = datetime.now() + timedelta(hours=1)
+    async with session_factory() as db:
+        db.add(Thread(id="t1", created_by="user_5"))
+        db.add(Message(id="m1", sender_id="user_1", summary="a", expires_at=expires_at))
+        db.add(Message(id="m2", sender_id="user_3", summary="b", expires_at=expires_at))
+        db.add(Inbox(user_id="user_2", message_id="m1", thread_id="t1"))
+        db.add(Inbox(user_id="user_4", message_id="m2", thread_id="t2"))
+        await db.commit()
+
+    async with session_factory() as db:
+        sender = await load_user_rooms(db, "user_1")
+        outsider = await load_user_rooms(db, "user_4")
+    await engine.dispose()
+    return sender, outsider
+
+
+def test_thread_rooms_from_participants(tmp_path):
+    """送信者・配信先・作成者がスレッドルームのメンバーになること"""
+    sender, outsider = asyncio.run(_rooms(tmp_path / "rooms.db"))
+    assert sender == {thread_room("t1"): {"user_1", "user_2", "user_5"}}
+    assert outsider == {thread_room("t2"): {"user_3", "user_4"}}
+
+
+async def _crowded_rooms(db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    # 旧クライアントのように全員が同じスレッド "default" で送受信
+    expires_at = datetime.now() + timedelta(hours=1)
+    async with session_factory() as db:
+        for i, (sender, recipient) in enumerate([("user_1", "user_2"), ("user_3", "user_1"), ("user_4", "user_5")]):
+            db.add(Message(id=f"m{i}", sender_id=sender, summary="a", expires_at=expires_at))
+            db.add(Inbox(user_id=recipient, message_id=f"m{i}", thread_id="default"))
+        await db.commit()
+
+    async with session_factory() as db:
+        rooms = await load_user_rooms(db, "user_1", max_thread_members=3)
+    await engine.dispose()
+    return rooms
+
+
+def test_crowded_thread_split_into_conversations(tmp_path):
+    """参加者が多すぎるスレッドは、実際に送受信した2人ごとのルームになること"""
+    rooms = asyncio.run(_crowded_rooms(tmp_path / "crowded.db"))
+    assert rooms == {
+        conversation_room("user_1", "user_2"): {"user_1", "user_2"},
+        conversation_room("user_1", "user_3"): {"user_1", "user_3"},
+    }
@@ -0,0 +1,31 @@
+"""
+実行計画テスト
+"""
+
+from sqlalchemy import create_engine
+from app.database import Base
+from app.query_plans import check_hot_queries
+import app.models  # noqa: F401
+
+
+def test_hot_queries_use_indexes():
+    """ホットクエリが複合インデックスを使用すること"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        results = check_hot_queries(conn)
+
+    for name, (uses_index, plan) in results.items():
+        assert uses_index, f"{name}: {plan}"
+
+
+def test_thread_page_reads_both_sources_by_index():
+    """スレッドのページが messages・inbox のどちらも全件走査しないこと"""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    with engine.begin() as conn:
+        _, plan = check_hot_queries(conn)["thread_messages"]
+
+    assert not any(line.startswith(("SCAN messages", "SCAN inbox")) for line in plan), plan
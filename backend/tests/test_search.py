@@ -0,0 +1,152 @@
+"""
+検索テスト（全文・ハイブリッド）
+"""
+
+import asyncio
+
+import numpy as np
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.fts import tokenize, sqlite_match_expression
+from app.models import Message, Inbox
+from app.services.search_service import SearchService, reciprocal_rank_fusion
+from app.services.vector_service import VectorService
+
+
+def test_tokenize_bigrams_japanese():
+    """日本語はバイグラム、英数字は単語単位で分割されること"""
+    assert tokenize("会議室 Zoom１５時") == ["会議", "議室", "zoom15", "時"]
+    assert sqlite_match_expression("会議 会議") == '"会議"'
+    assert sqlite_match_expression("会") == '"会"*'
+    assert sqlite_match_expression("!!") == ""
+
+
+async def _search(db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    service = SearchService()
+
+    async with session_factory() as db:
+        db.add_all([
+            Message(id="m1", thread_id="t1", sender_id="user_1", summary="明日の会議は会議室Aで10時から"),
+            Message(id="m2", thread_id="t1", sender_id="user_1", summary="会議の資料を共有します"),
+            Message(id="m3", thread_id="t2", sender_id="user_3", summary="会議室の予約をお願いします"),
+            Inbox(id="i1", user_id="user_2", message_id="m1", thread_id="t1"),
+        ])
+        await db.commit()
+
+        results = {}
+        results["sender"], _ = await service.search_messages(db, "user_1", "会議室")
+        results["recipient"], _ = await service.search_messages(db, "user_2", "会議")
+        results["outsider"], _ = await service.search_messages(db, "user_9", "会議")
+        results["page"], results["has_more"] = await service.search_messages(db, "user_2", "会議", limit=1)
+
+        # /deliver で配信されたメッセージ（スレッドIDは受信箱のみ）もスレッド内検索・参加者の検索に含まれる
+        db.add_all([
+            Message(id="m4", sender_id="user_1", summary="会議の議事録を送ります"),
+            Inbox(id="i2", user_id="user_5", message_id="m4", thread_id="t1"),
+        ])
+        await db.commit()
+        results["thread"], _ = await service.search_messages(db, "user_1", "会議", thread_id="t1")
+        results["participant"], _ = await service.search_messages(db, "user_2", "議事録")
+        await db.execute(delete(Message).where(Message.id == "m4"))
+
+        # 削除はトリガーで索引からも除かれる
+        await db.execute(delete(Inbox))
+        await db.execute(delete(Message).where(Message.id == "m1"))
+        await db.commit()
+        results["deleted"], _ = await service.search_messages(db, "user_1", "会議室")
+    await engine.dispose()
+    return results
+
+
+def test_search_scoped_to_caller(tmp_path):
+    """参加スレッドのメッセージのみが関連度順に返ること"""
+    results = asyncio.run(_search(tmp_path / "search.db"))
+
+    assert [m.id for m, _ in results["sender"]] == ["m1"]
+    assert {m.id for m, _ in results["recipient"]} == {"m1", "m2"}
+    assert results["outsider"] == []
+    assert len(results["page"]) == 1 and results["has_more"] is True
+    assert {m.id for m, _ in results["thread"]} == {"m1", "m2", "m4"}
+    assert [m.id for m, _ in results["participant"]] == ["m4"]
+    assert results["deleted"] == []
+
+
+def test_reciprocal_rank_fusion():
+    """両方の検索で上位の項目が最上位になること"""
+    fused = reciprocal_rank_fusion({"lexical": ["a", "b", "c"], "vector": ["b", "d"]}, k=60)
+    assert [item_id for item_id, _ in fused] == ["b", "a", "d", "c"]
+
+
+class _FixedEmbedding:
+    """クエリに関わらず同じベクトルを返す埋め込み（テスト用）"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def create_embedding(self, text, lang_hint="auto"):
+        self.calls += 1
+        return "vec_query", np.array([1.0, 0.0, 0.0, 0.0])
+
+
+async def _hybrid(db_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    vectors = VectorService(dimension=4)
+    vectors.add("vec_1", np.array([0.0, 1.0, 0.0, 0.0]))
+    vectors.add("vec_2", np.array([1.0, 0.1, 0.0, 0.0]))
+    vectors.add("vec_3", np.array([1.0, 0.0, 0.0, 0.0]))
+    embedding = _FixedEmbedding()
+    service = SearchService(vectors=vectors, embedding_service=embedding)
+
+    async with session_factory() as db:
+        db.add_all([
+            # 全文一致のみ
+            Message(id="m1", sender_id="user_1", summary="3/15 10:30に集合", vector_id="vec_1",
+                    slots='{"intent": "general", "urgency": "normal"}'),
+            # ベクトルで近い言い換えのみ
+            Message(id="m2", sender_id="user_1", summary="待ち合わせの時間について", vector_id="vec_2",
+                    slots='{"intent": "general", "urgency": "high"}'),
+            # 閲覧できないメッセージ
+            Message(id="m3", sender_id="user_3", summary="3/15 10:30に集合", vector_id="vec_3",
+                    slots='{"intent": "general", "urgency": "normal"}'),
+            # user_2 には m1・m2 を配信済み
+            Inbox(id="i1", user_id="user_2", message_id="m1"),
+            Inbox(id="i2", user_id="user_2", message_id="m2"),
+        ])
+        await db.commit()
+
+        results = {}
+        results["all"], _ = await service.hybrid_search(db, "user_1", "3/15 10:30")
+        results["urgent"], _ = await service.hybrid_search(db, "user_1", "3/15 10:30", slots={"urgency": "high"})
+        calls = embedding.calls
+        m1 = await db.get(Message, "m1")
+        results["neighbors"] = await service.find_neighbors(db, m1, "user_2")
+        # 送信者が閲覧できても受信者が閲覧できないメッセージは含めない
+        results["outsider_neighbors"] = await service.find_neighbors(db, m1, "user_9")
+        # 保存済みのベクトルを使い、埋め込み直さない
+        results["embedded"] = embedding.calls - calls
+    await engine.dispose()
+    return results
+
+
+def test_hybrid_search_fuses_lexical_and_vector(tmp_path):
+    """全文・ベクトルの両方の結果が閲覧範囲とスロット条件で絞り込まれて統合されること"""
+    results = asyncio.run(_hybrid(tmp_path / "hybrid.db"))
+
+    assert {m.id: ranks for m, _, ranks in results["all"]} == {
+        "m1": {"lexical": 1, "vector": 2},
+        "m2": {"vector": 1},
+    }
+    assert [m.id for m, _, _ in results["urgent"]] == ["m2"]
+    assert [n["message_id"] for n in results["neighbors"]] == ["m2"]
+    assert results["outsider_neighbors"] == []
+    assert results["embedded"] == 0
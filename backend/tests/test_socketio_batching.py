@@ -0,0 +1,164 @@
+"""
+Socket.IO 送信バッチ化・接続ごとの送信キューテスト
+"""
+
+import asyncio
+import itertools
+
+from socketio import packet
+
+from app.socketio_batching import BATCH_EVENT, BatchingManager, OutboundQueue
+
+
+class _Socket:
+    """送信キューが捌けない Engine.IO ソケット"""
+
+    def __init__(self, backlog=0):
+        self.queue = asyncio.Queue()
+        for _ in range(backlog):
+            self.queue.put_nowait(None)
+        self.closed = False
+
+    async def close(self, wait=True, abort=False):
+        self.closed = True
+
+
+class _EngineIO:
+    _ids = itertools.count()
+
+    def __init__(self):
+        self.sockets = {}
+
+    def generate_id(self):
+        return f"sid{next(self._ids)}"
+
+
+class _Server:
+    """送信されたパケットを記録するだけの AsyncServer スタブ"""
+
+    packet_class = packet.Packet
+
+    def __init__(self):
+        self.eio = _EngineIO()
+        self.sent = []
+
+    async def _send_packet(self, eio_sid, pkt):
+        self.sent.append((eio_sid, pkt.data))
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        self.sent.append((eio_sid, eio_pkt.data))
+
+
+async def _manager(window_ms=5, max_batch=64):
+    server = _Server()
+    manager = BatchingManager()
+    manager.set_server(server)
+    manager.batch_window = window_ms / 1000
+    manager.max_batch = max_batch
+    sids = [await manager.connect(f"eio{i}", "/") for i in range(2)]
+    return server, manager, sids
+
+
+def test_events_in_window_are_sent_as_one_frame():
+    """同じ接続宛てに続いたイベントが1つの batch フレームにまとまること"""
+    async def scenario():
+        server, manager, (sid, _) = await _manager()
+        for i in range(3):
+            await manager.emit("typing", {"n": i}, "/", room=sid)
+        await asyncio.sleep(0.02)
+        return server.sent, manager.stats()
+
+    sent, stats = asyncio.run(scenario())
+    assert sent == [("eio0", [BATCH_EVENT, [["typing", {"n": 0}], ["typing", {"n": 1}], ["typing", {"n": 2}]]])]
+    assert (stats["events_sent"], stats["frames_sent"]) == (3, 1)
+
+
+def test_single_event_is_sent_unchanged():
+    """1件だけの場合は通常のイベントとして届き、skip_sid の接続には送られないこと"""
+    async def scenario():
+        server, manager, (sid_a, sid_b) = await _manager()
+        await manager.emit("user_status", {"user_id": "user_1"}, "/", room=None, skip_sid=sid_b)
+        await asyncio.sleep(0.02)
+        return server.sent
+
+    assert asyncio.run(scenario()) == [("eio0", ["user_status", {"user_id": "user_1"}])]
+
+
+def test_max_batch_flushes_early_and_disabled_window_bypasses():
+    """max_batch に達したら待たずに送信し、batch_window=0 ではまとめないこと"""
+    async def scenario():
+        server, manager, (sid, _) = await _manager(window_ms=1000, max_batch=2)
+        await manager.emit("a", 1, "/", room=sid)
+        await manager.emit("b", 2, "/", room=sid)
+        await asyncio.sleep(0.01)
+        early = list(server.sent)
+
+        manager.batch_window = 0
+        await manager.emit("c", 3, "/", room=sid)
+        await asyncio.sleep(0.01)
+        return early, server.sent[len(early):]
+
+    early, unbatched = asyncio.run(scenario())
+    assert early == [("eio0", [BATCH_EVENT, [["a", 1], ["b", 2]]])]
+    assert len(unbatched) == 1
+
+
+def test_outbound_queue_coalesces_latest_state_and_drops_under_pressure():
+    """入力中などは最新の状態だけが残り、一杯のときは破棄してよいイベントから捨てること"""
+    queue = OutboundQueue()
+    queue.put("user_typing", {"user_id": "user_1", "is_typing": True}, 3)
+    queue.put("new_delivery", {"message_id": "m1"}, 3)
+    coalesced, _, _ = queue.put("user_typing", {"user_id": "user_1", "is_typing": False}, 3)
+    queue.put("presence_delta", {"room": "r", "version": 1}, 3)
+    _, dropped, overflow = queue.put("new_delivery", {"message_id": "m2"}, 3)
+
+    assert coalesced is True
+    assert (dropped, overflow) == (1, False)
+    assert queue.drain() == [
+        ("new_delivery", {"message_id": "m1"}),
+        ("presence_delta", {"room": "r", "version": 1}),
+        ("new_delivery", {"message_id": "m2"}),
+    ]
+
+    full = OutboundQueue()
+    full.put("new_delivery", {"message_id": "m1"}, 1)
+    assert full.put("user_typing", {"user_id": "user_1"}, 1) == (False, 1, False)
+    assert full.put("new_delivery", {"message_id": "m2"}, 1) == (False, 0, True)
+
+
+def test_stalled_client_is_held_then_disconnected():
+    """受信が停滞した接続には送らずに保留し、続けば切断して数えること"""
+    async def scenario():
+        server, manager, (sid, _) = await _manager(window_ms=0)
+        manager.max_backlog = 2
+        manager.slow_consumer_seconds = 0.15
+        socket = server.eio.sockets["eio0"] = _Socket(backlog=2)
+        for i in range(3):
+            await manager.emit("new_delivery", {"n": i}, "/", room=sid)
+        await asyncio.sleep(0.05)
+        held = (list(server.sent), manager.queue_depth(sid))
+        await asyncio.sleep(0.3)
+        return held, socket.closed, manager.stats()
+
+    (sent, depth), closed, stats = asyncio.run(scenario())
+    assert sent == []
+    assert depth == 5
+    assert closed is True
+    assert stats["slow_consumers"] == 1
+    assert stats["pending_sockets"] == 0
+
+
+def test_overflowing_queue_disconnects_client():
+    """破棄できないイベントで一杯になった接続は切断されること"""
+    async def scenario():
+        server, manager, (sid, _) = await _manager(window_ms=1000)
+        manager.max_queue = 2
+        socket = server.eio.sockets["eio0"] = _Socket()
+        for i in range(3):
+            await manager.emit("new_message", {"n": i}, "/", room=sid)
+        await asyncio.sleep(0.01)
+        return socket.closed, manager.stats()
+
+    closed, stats = asyncio.run(scenario())
+    assert closed is True
+    assert (stats["slow_consumers"], stats["events_dropped"]) == (1, 1)
@@ -0,0 +1,110 @@
+"""
+期限切れメッセージスイーパーテスト
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from app.database import Base
+from app.models import Message, MessageContent, Inbox
+from app.services.vector_service import REMOVAL_CHANNEL, VectorRemovalBroadcaster, VectorService
+from app.sweeper import ExpiredMessageSweeper
+
+
+async def _run_sweep():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    vectors = VectorService(dimension=4)
+    now = datetime(2026, 1, 2)
+    async with session_factory() as db:
+        for i in range(7):
+            expired = i < 5
+            message = Message(
+                id=f"msg_{i}",
+                sender_id="user_1",
+                summary=f"message {i}",
+                vector_id=f"vec_{i}",
+                expires_at=now + (timedelta(hours=-1) if expired else timedelta(hours=1))
+            )
+            db.add(message)
+            db.add(Inbox(user_id="user_2", message_id=message.id, status="unread"))
+            db.add(MessageContent(message_id=message.id, user_id="user_1", content_type="original", text="x"))
+            vectors.add(f"vec_{i}", np.ones(4, dtype=np.float32))
+        await db.commit()
+
+    sweeper = ExpiredMessageSweeper(
+        session_factory=session_factory,
+        batch_size=2,
+        duty_cycle=1.0,
+        vector_cleanup=vectors.remove,
+    )
+    deleted = await sweeper.sweep_once(now=now)
+
+    async with session_factory() as db:
+        counts = {
+            model.__tablename__: (await db.execute(select(func.count()).select_from(model))).scalar_one()
+            for model in (Message, Inbox, MessageContent)
+        }
+    await engine.dispose()
+    return deleted, counts, vectors
+
+
+def test_sweep_deletes_expired_in_batches():
+    """期限切れメッセージと関連行・ベクトルが削除されること"""
+    deleted, counts, vectors = asyncio.run(_run_sweep())
+
+    assert deleted == 5
+    assert counts == {"messages": 2, "inbox": 2, "message_contents": 2}
+    assert len(vectors) == 2
+    assert {vid for vid, _ in vectors.search(np.ones(4), k=5)} == {"vec_5", "vec_6"}
+
+
+def test_invalid_duty_cycle():
+    """duty_cycle は 0 より大きく 1 以下であること"""
+    for duty_cycle in (0, -0.5, 1.5):
+        with pytest.raises(ValueError):
+            ExpiredMessageSweeper(duty_cycle=duty_cycle)
+
+
+def test_vector_removal_reaches_other_workers():
+    """削除したベクトルが、通知を購読している他ワーカーのインデックスからも消えること"""
+    fakeredis = pytest.importorskip("fakeredis")
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        sweeper_index, worker_index = VectorService(dimension=4), VectorService(dimension=4)
+        for index in (sweeper_index, worker_index):
+            index.add("vec_1", np.ones(4, dtype=np.float32))
+            index.add("vec_2", np.ones(4, dtype=np.float32))
+        sweeper_side = VectorRemovalBroadcaster(
+            sweeper_index, redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        )
+        worker_side = VectorRemovalBroadcaster(
+            worker_index, redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        )
+        worker_side.start()
+        try:
+            for _ in range(50):
+                await asyncio.sleep(0.01)
+                if await sweeper_side.r.pubsub_numsub(REMOVAL_CHANNEL) != [(REMOVAL_CHANNEL, 0)]:
+                    break
+            assert await sweeper_side.remove(["vec_1"]) == 1
+            for _ in range(50):
+                if len(worker_index) == 1:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await worker_side.stop()
+        return sweeper_index, worker_index
+
+    sweeper_index, worker_index = asyncio.run(scenario())
+    assert len(sweeper_index) == 1
+    assert set(worker_index.get(["vec_1", "vec_2"])) == {"vec_2"}
@@ -0,0 +1,142 @@
+"""
+スレッドバージョンサービステスト
+"""
+
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services import thread_version_service as module
+from app.services.thread_version_service import ThreadVersionService
+
+
+async def _versions():
+    service = ThreadVersionService(redis_client=fakeredis.FakeAsyncRedis(decode_responses=True))
+    initial = await service.get("thread_1")
+    unchanged = await service.get("thread_1")
+    await service.bump(["thread_1", None])
+    bumped = await service.get("thread_1")
+    other = await service.get("thread_2")
+    return initial, unchanged, bumped, other
+
+
+def test_bump_changes_version():
+    """変更がなければ同じバージョン、bump で必ず進むこと"""
+    initial, unchanged, bumped, other = asyncio.run(_versions())
+    assert initial == unchanged
+    assert bumped > initial
+    assert other is not None
+
+
+class _BrokenRedis:
+    def register_script(self, script):
+        async def run(*args, **kwargs):
+            raise ConnectionError("redis down")
+        return run
+
+    async def get(self, key):
+        raise ConnectionError("redis down")
+
+    async def delete(self, *keys):
+        raise ConnectionError("redis down")
+
+
+def test_get_returns_none_when_redis_down():
+    """Redis利用不可の場合は None（呼び出し側が内容ハッシュにフォールバック）"""
+    service = ThreadVersionService(redis_client=_BrokenRedis())
+    assert asyncio.run(service.get("thread_1")) is None
+
+
+def test_bumps_during_outage_are_replayed():
+    """Redis障害中に進められなかったバージョンが、復旧後の参照前に進むこと"""
+    async def scenario():
+        server = fakeredis.FakeServer()
+        service = ThreadVersionService(redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        before = await service.get("thread_1")
+
+        server.connected = False
+        await service.bump(["thread_1"])
+        # 障害中（再接続待ち）の変更も記録される
+        await service.bump(["thread_2"])
+        down = await service.get("thread_1")
+
+        server.connected = True
+        service._redis_down_until = 0.0
+        after = await service.get("thread_1")
+        return before, down, after, service._pending
+
+    before, down, after, pending = asyncio.run(scenario())
+    assert down is None
+    assert after > before
+    assert pending == set()
+
+
+class _Clock:
+    """リースの期限判定に使う現在時刻（ミリ秒）を進める"""
+
+    def __init__(self, monkeypatch):
+        self.offset = 0
+        real_now_ms = module._now_ms
+        monkeypatch.setattr(module, "_now_ms", lambda: real_now_ms() + self.offset)
+
+    def advance(self, seconds: float):
+        self.offset += int(seconds * 1000)
+
+
+def test_other_worker_falls_back_until_outage_is_replayed(monkeypatch):
+    """障害中に変更したワーカーが書き戻すまで、他のワーカーも古いバージョンを返さないこと"""
+    clock = _Clock(monkeypatch)
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        worker_a = ThreadVersionService(redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        worker_b = ThreadVersionService(redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        await worker_a.renew_lease()
+        await worker_b.renew_lease()
+        before = await worker_b.get("thread_1")
+
+        # ワーカーAだけがRedisに書けずに変更（Bは引き続きRedisを参照できる）
+        server.connected = False
+        await worker_a.bump(["thread_1"])
+        server.connected = True
+        clock.advance(module.LEASE_SECONDS + 1)
+        await worker_b.renew_lease()
+        during = await worker_b.get("thread_1")
+
+        # Aの復旧（リース更新の前に書き戻す）
+        worker_a._redis_down_until = 0.0
+        await worker_a.renew_lease()
+        after = await worker_b.get("thread_1")
+        return before, during, after
+
+    before, during, after = asyncio.run(scenario())
+    assert during is None
+    assert after > before
+
+
+def test_abandoned_lease_invalidates_all_versions(monkeypatch):
+    """戻らないワーカーのリースは一定時間後に削除され、全スレッドのバージョンが新しくなること"""
+    clock = _Clock(monkeypatch)
+
+    async def scenario():
+        server = fakeredis.FakeServer()
+        crashed = ThreadVersionService(redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        worker = ThreadVersionService(redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True))
+        await crashed.renew_lease()
+        before = await worker.get("thread_1")
+
+        clock.advance(module.LEASE_SECONDS + 1)
+        await worker.renew_lease()
+        expired = await worker.get("thread_1")
+
+        clock.advance(module.LEASE_FORGET_SECONDS)
+        await worker.renew_lease()
+        forgotten = await worker.get("thread_1")
+        after = await worker.get("thread_1")
+        return before, expired, forgotten, after
+
+    before, expired, forgotten, after = asyncio.run(scenario())
+    assert expired is None and forgotten is None
+    assert after > before
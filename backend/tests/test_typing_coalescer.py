@@ -0,0 +1,53 @@
+"""
+入力中インジケーター間引きテスト
+"""
+
+from app.typing_coalescer import TypingCoalescer
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_coalesces_keystrokes():
+    """状態変化と再通知間隔ごとのみ通知し、それ以外は抑制数に数えること"""
+    clock = _Clock()
+    typing = TypingCoalescer(refresh_seconds=3, timeout_seconds=6, clock=clock)
+
+    emitted = []
+    for step in range(20):  # 0.25秒ごとのキー入力を5秒間
+        clock.now = step * 0.25
+        emitted.append(typing.update("user_1", "user_2", True))
+    clock.now = 5.0
+    emitted.append(typing.update("user_1", "user_2", False))
+    emitted.append(typing.update("user_1", "user_2", False))
+
+    # 開始・3秒後の再通知・終了のみ
+    assert emitted.count(True) == 3
+    assert emitted[0] and emitted[12] and emitted[20]
+    assert typing.stats()["suppressed"] == 19
+    # 別の受信者は独立
+    assert typing.update("user_1", "user_3", True)
+
+
+def test_expires_stale_typing():
+    """更新が途絶えた入力中状態は期限切れで終了すること"""
+    clock = _Clock()
+    typing = TypingCoalescer(refresh_seconds=3, timeout_seconds=6, clock=clock)
+    typing.update("user_1", "user_2", True)
+    typing.update("user_3", "user_2", True)
+
+    clock.now = 5.0
+    typing.update("user_3", "user_2", True)
+    assert typing.expire() == []
+
+    clock.now = 6.0
+    assert typing.expire() == [("user_1", "user_2")]
+    assert typing.forget_sender("user_3") == [("user_3", "user_2")]
+    assert typing.stats()["typing_pairs"] == 0
+    # 期限切れ後の入力は再び開始として通知
+    assert typing.update("user_1", "user_2", True)
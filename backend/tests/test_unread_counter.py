@@ -0,0 +1,112 @@
+"""
+未読カウンターサービステスト
+"""
+
+import asyncio
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+
+from app.services.unread_counter_service import UnreadCounterService
+
+
+class _CountingService(UnreadCounterService):
+    """DB集計の代わりに固定値を返し、集計中に別リクエストの配信を割り込ませる"""
+
+    def __init__(self, redis_client, counts, during_count=None):
+        super().__init__(redis_client=redis_client, session_factory=None)
+        self.counts = counts
+        self.during_count = during_count
+
+    async def _count_from_db(self, user_id=None):
+        if user_id is not None:
+            snapshot = dict(self.counts.get(user_id, {}))
+        else:
+            snapshot = {uid: dict(counts) for uid, counts in self.counts.items()}
+        if self.during_count is not None:
+            await self.during_count()
+        return snapshot
+
+
+def _redis():
+    return fakeredis.FakeAsyncRedis(decode_responses=True)
+
+
+def test_rebuild_skipped_when_counter_changes_during_count():
+    """キー再構築中の加算を古い集計値で上書きしないこと"""
+    async def scenario():
+        service = _CountingService(_redis(), {"user_1": {"thread_1": 1}})
+
+        async def deliver():
+            # 集計後にコミットされた配信（集計値には含まれない）
+            service.counts["user_1"]["thread_1"] = 2
+            await service.increment([("user_1", "thread_1")])
+
+        service.during_count = deliver
+        first = await service.get_summary("user_1")
+        service.during_count = None
+        second = await service.get_summary("user_1")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert first == (1, {"thread_1": 1})
+    # 置き換えなかったため、次の参照で改めて集計される
+    assert second == (2, {"thread_1": 2})
+
+
+def test_rebuild_skipped_between_commit_and_increment():
+    """配信のコミット後・加算前の再構築で、コミット済みの行を二重に数えないこと"""
+    async def scenario():
+        service = _CountingService(_redis(), {"user_1": {}})
+        async with service.in_flight(["user_1"]):
+            # 配信がコミットされた（DB集計に含まれる）直後に、別リクエストがキーを再構築
+            service.counts["user_1"]["thread_1"] = 1
+            during = await service.get_summary("user_1")
+            await service.increment([("user_1", "thread_1")])
+        after = await service.get_summary("user_1")
+        cached = await service.r.hgetall("unread:user_1")
+        return during, after, cached
+
+    during, after, cached = asyncio.run(scenario())
+    assert during == (1, {"thread_1": 1})
+    assert after == (1, {"thread_1": 1})
+    assert cached == {"thread_1": "1", "_total": "1"}
+
+
+def test_reconcile_keeps_concurrent_increments():
+    """突き合わせ中に加算されたユーザーは置き換えず、それ以外は補正すること"""
+    async def scenario():
+        service = _CountingService(_redis(), {"user_1": {"thread_1": 1}, "user_2": {"thread_1": 3}})
+        await service.get_summary("user_1")
+        await service.get_summary("user_2")
+        # user_2 はずれている（配信の取りこぼし）
+        await service.r.hset("unread:user_2", mapping={"thread_1": 9, "_total": 9})
+
+        async def deliver():
+            await service.increment([("user_1", "thread_1")])
+
+        service.during_count = deliver
+        stored = await service.reconcile()
+        service.during_count = None
+        return stored, await service.get_summary("user_1"), await service.get_summary("user_2")
+
+    stored, user_1, user_2 = asyncio.run(scenario())
+    assert stored == 1
+    assert user_1 == (2, {"thread_1": 2})
+    assert user_2 == (3, {"thread_1": 3})
+
+
+def test_reconcile_lock_taken_by_one_worker():
+    """突き合わせのロックは1間隔につき1ワーカーのみ取得できること"""
+    async def scenario():
+        server = fakeredis.FakeServer()
+        workers = [
+            UnreadCounterService(
+                redis_client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True), session_factory=None
+            )
+            for _ in range(3)
+        ]
+        return [await worker._acquire_reconcile_lock(60) for worker in workers]
+
+    assert asyncio.run(scenario()) == [True, False, False]
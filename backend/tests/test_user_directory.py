@@ -0,0 +1,77 @@
+"""
+ユーザーディレクトリテスト
+"""
+
+import asyncio
+import json
+import os
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import User
+from app.services.user_directory import UserDirectory
+
+
+def _write_users(path, users, mtime):
+    path.write_text(json.dumps({"users": users}), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_lookup_and_reload_on_mtime_change(tmp_path):
+    """IDで参照でき、更新時刻が変わると再読み込みされること"""
+    path = tmp_path / "users.json"
+    _write_users(path, [{"id": "user_1", "name": "A", "language": "ja", "style_preset": "biz_formal"}], 1000)
+
+    directory = UserDirectory(path=str(path), check_interval=0)
+    assert directory.get("user_1")["name"] == "A"
+    assert directory.get("user_2") is None
+
+    _write_users(path, [
+        {"id": "user_1", "name": "B", "language": "ja", "style_preset": "biz_formal"},
+        {"id": "user_2", "name": "C", "language": "en", "style_preset": "emoji_casual"},
+    ], 2000)
+    assert directory.get("user_1")["name"] == "B"
+    assert [u["id"] for u in directory.all()] == ["user_1", "user_2"]
+
+
+def test_missing_file(tmp_path):
+    """ファイルがない場合は未読み込み扱い"""
+    directory = UserDirectory(path=str(tmp_path / "missing.json"), check_interval=0)
+    assert not directory.loaded
+    assert directory.get("user_1") is None
+
+
+def test_sync_to_db_upserts(tmp_path):
+    """複数ワーカーが同時に同期しても衝突せず、変更のあった行のみ数えること"""
+    path = tmp_path / "users.json"
+    _write_users(path, [
+        {"id": "user_1", "name": "A", "language": "ja", "style_preset": "biz_formal"},
+        {"id": "user_2", "name": "B", "language": "en", "style_preset": "emoji_casual"},
+    ], 1000)
+
+    async def scenario():
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all, tables=[User.__table__])
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        directory = UserDirectory(path=str(path), check_interval=0)
+        directory.load()
+
+        first = await asyncio.gather(*(directory.sync_to_db(session_factory) for _ in range(4)))
+        _write_users(path, [
+            {"id": "user_1", "name": "A2", "language": "ja", "style_preset": "biz_formal"},
+            {"id": "user_2", "name": "B", "language": "en", "style_preset": "emoji_casual"},
+        ], 2000)
+        directory.load()
+        second = await directory.sync_to_db(session_factory)
+        async with session_factory() as db:
+            names = {user.id: user.name for user in (await db.execute(select(User))).scalars()}
+        await engine.dispose()
+        return first, second, names
+
+    first, second, names = asyncio.run(scenario())
+    assert sum(first) == 2
+    assert second == 1
+    assert names == {"user_1": "A2", "user_2": "B"}
@@ -0,0 +1,183 @@
+import { io, Socket } from 'socket.io-client'
+import msgpackParser from 'socket.io-msgpack-parser'
+
+// バックエンドの Socket.IO エンドポイント（main.py で /api/v1/ws にマウント）
+const SOCKET_URL = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+const SOCKET_PATH = '/api/v1/ws/socket.io'
+// バックエンドの SOCKETIO_SERIALIZER と揃える（msgpack のサーバーには msgpack パーサーでないと接続できない）
+const SOCKET_SERIALIZER = process.env.NEXT_PUBLIC_SOCKETIO_SERIALIZER || 'default'
+// SOCKETIO_BATCH_WINDOW_MS > 0 のサーバーは複数イベントを [[イベント名, データ], ...] にまとめて送る
+const BATCH_EVENT = 'batch'
+const DEVICE_ID_KEY = 'sensechat-device-id'
+// Redis障害時に受信箱から再送された配信の ack 済みID（再接続時に続きから再送させる）
+const INBOX_CURSOR_KEY_PREFIX = 'sensechat-inbox-cursor:'
+const INBOX_EVENT_PREFIX = 'inbox:'
+
+export interface NewMessage {
+  message_id: string
+  text: string
+  summary?: string
+  sender_id: string
+  recipient_id: string
+  confidence?: number
+  created_at: string
+}
+
+// /deliver/fanout の配信通知（本文は受信者側で /render して取得する）
+export interface NewDelivery {
+  message_id: string
+  thread_id: string | null
+  sender_id: string
+  created_at: string
+  delivery_id: string
+}
+
+export interface UserStatus {
+  user_id: string
+  status: 'online' | 'offline'
+}
+
+export interface TypingStatus {
+  user_id: string
+  is_typing: boolean
+}
+
+// オフライン中に届かなかったイベント（user_register 直後・ack_events の後にまとめて再送される）
+export interface MissedEvents {
+  events: { id: string, event: string, data: any }[]
+  has_more: boolean
+}
+
+type EventHandler = (data: any) => void
+
+// 端末ID（同じ端末の再接続で古い接続を置き換えるため、ブラウザごとに固定）
+function getDeviceId(): string {
+  if (typeof window === 'undefined') {
+    return 'server'
+  }
+  let deviceId = window.localStorage.getItem(DEVICE_ID_KEY)
+  if (!deviceId) {
+    deviceId = `web_${Math.random().toString(36).slice(2, 10)}`
+    window.localStorage.setItem(DEVICE_ID_KEY, deviceId)
+  }
+  return deviceId
+}
+
+function getInboxCursor(userId: string): string | null {
+  if (typeof window === 'undefined') {
+    return null
+  }
+  return window.localStorage.getItem(INBOX_CURSOR_KEY_PREFIX + userId)
+}
+
+function setInboxCursor(userId: string, cursor: string) {
+  if (typeof window !== 'undefined') {
+    window.localStorage.setItem(INBOX_CURSOR_KEY_PREFIX + userId, cursor)
+  }
+}
+
+class WebSocketClient {
+  private socket: Socket | null = null
+  private userId: string | null = null
+  // イベント名 -> ハンドラー（connectWebSocket が複数回呼ばれても重複登録しない）
+  private handlers = new Map<string, EventHandler>()
+
+  onMessage(event: string, handler: EventHandler) {
+    this.handlers.set(event, handler)
+  }
+
+  onStatus(event: string, handler: EventHandler) {
+    this.handlers.set(event, handler)
+  }
+
+  private dispatch(event: string, data: any) {
+    if (event === BATCH_EVENT) {
+      for (const [batchedEvent, batchedData] of (data || []) as [string, any][]) {
+        this.dispatch(batchedEvent, batchedData)
+      }
+      return
+    }
+    if (event === 'missed_events') {
+      this.replayMissedEvents(data)
+      return
+    }
+    const handler = this.handlers.get(event)
+    if (handler) {
+      handler(data)
+    }
+  }
+
+  // 再送イベントを通常のイベントと同じハンドラーで処理し、最後のIDを返して確認済みにする
+  // （残りがあればサーバーから続きが届く。inbox: で始まるIDは受信箱の行なので、
+  // 次回の接続で同じ配信を再送させないよう最後のIDを保存して user_register で渡す）
+  private replayMissedEvents(data: MissedEvents) {
+    const events = data?.events || []
+    for (const missed of events) {
+      this.dispatch(missed.event, missed.data)
+    }
+    if (events.length > 0) {
+      const lastId = events[events.length - 1].id
+      if (this.userId && lastId.startsWith(INBOX_EVENT_PREFIX)) {
+        setInboxCursor(this.userId, lastId.slice(INBOX_EVENT_PREFIX.length))
+      }
+      this.emit('ack_events', { last_id: lastId })
+    }
+  }
+
+  connect(userId: string): Promise<void> {
+    if (this.socket && this.userId === userId) {
+      return Promise.resolve()
+    }
+    this.disconnect()
+    this.userId = userId
+
+    const socket = io(SOCKET_URL, {
+      path: SOCKET_PATH,
+      transports: ['websocket'],
+      ...(SOCKET_SERIALIZER === 'msgpack' ? { parser: msgpackParser } : {})
+    })
+    this.socket = socket
+
+    // サーバーからのイベントは登録済みのハンドラーへ振り分ける
+    socket.onAny((event: string, data: any) => this.dispatch(event, data))
+
+    socket.on('disconnect', (reason: string) => {
+      this.dispatch('disconnected', { reason })
+    })
+
+    return new Promise((resolve, reject) => {
+      socket.once('connect_error', (error: Error) => reject(error))
+      // 再接続のたびにユーザー登録し直す（オンライン状態・未配信イベントの再送）
+      socket.on('connect', () => {
+        socket.emit('user_register', {
+          user_id: userId,
+          device_id: getDeviceId(),
+          inbox_cursor: getInboxCursor(userId)
+        })
+        resolve()
+      })
+    })
+  }
+
+  disconnect() {
+    if (this.socket) {
+      this.socket.disconnect()
+      this.socket = null
+    }
+    this.userId = null
+  }
+
+  emit(event: string, data?: any) {
+    this.socket?.emit(event, data)
+  }
+
+  sendTypingStatus(isTyping: boolean, recipientId?: string) {
+    this.emit('typing_status', { recipient_id: recipientId, is_typing: isTyping })
+  }
+
+  sendMessageRead(messageId: string, senderId: string) {
+    this.emit('message_read', { message_id: messageId, sender_id: senderId })
+  }
+}
+
+export const websocketClient = new WebSocketClient()
@@ -1,7 +1,7 @@
 import { create } from 'zustand'
 import { persist } from 'zustand/middleware'
 import { useUserStore } from './userStore'
-import { websocketClient, NewMessage, UserStatus, TypingStatus } from '../lib/websocket'
+import { websocketClient, NewMessage, NewDelivery, UserStatus, TypingStatus } from '../lib/websocket'
 
 export interface Message {
   id: string
@@ -13,6 +13,35 @@ export interface Message {
   message_type: 'sent' | 'received'  // メッセージの種類
 }
 
+// 1対1の会話のスレッドID（送信者・受信者のどちらから見ても同じ）
+// 全員が同じスレッドを使うと、サーバーのプレゼンスルームが全ユーザーを含む1つのルームになる
+export function conversationThreadId(userId: string, recipientId: string): string {
+  return `dm_${[userId, recipientId].sort().join('_')}`
+}
+
+// プレゼンスルームごとの状態（presence_snapshot で初期化し、presence_delta で更新）
+interface PresenceRoom {
+  version: number
+  online: string[]
+}
+
+// get_presence の応答待ち（差分の欠落が続いても再取得は1回にする）
+let presenceResyncPending = false
+
+// /render を呼んだ配信のメッセージID（new_message が届く前に同じ配信が再送されても再構成しない）
+const renderingDeliveries = new Set<string>()
+
+function requestPresenceSnapshot() {
+  if (!presenceResyncPending) {
+    presenceResyncPending = true
+    websocketClient.emit('get_presence')
+  }
+}
+
+function onlineUsersOf(rooms: Record<string, PresenceRoom>): string[] {
+  return Array.from(new Set(Object.values(rooms).flatMap((room) => room.online))).sort()
+}
+
 interface ChatState {
   messages: Message[]
   currentThread: string | null
@@ -23,6 +52,7 @@ interface ChatState {
   // WebSocket関連
   isWebSocketConnected: boolean
   onlineUsers: string[]
+  presenceRooms: Record<string, PresenceRoom> // room -> バージョン・オンラインメンバー
   typingUsers: Record<string, boolean> // user_id -> is_typing
   
   // クライアント側保存: 送信者と受信者で分離
@@ -63,6 +93,7 @@ export const useChatStore = create<ChatState>()(
       // WebSocket関連
       isWebSocketConnected: false,
       onlineUsers: [],
+      presenceRooms: {},
       typingUsers: {},
       
       sentMessages: {}, // 送信者のメッセージ
@@ -189,7 +220,7 @@ export const useChatStore = create<ChatState>()(
             body: JSON.stringify({
               to_user_id: selectedRecipient, // 選択された受信者
               message_id: embedData.message_id,
-              thread_id: get().currentThread || 'default'
+              thread_id: get().currentThread || conversationThreadId(currentUser.id, selectedRecipient)
             })
           })
           
@@ -241,7 +272,11 @@ export const useChatStore = create<ChatState>()(
       },
       
       setSelectedRecipient: (recipientId: string) => {
-        set({ selectedRecipient: recipientId })
+        const { currentUser } = useUserStore.getState()
+        set({
+          selectedRecipient: recipientId,
+          currentThread: currentUser ? conversationThreadId(currentUser.id, recipientId) : null
+        })
       },
 
       clearError: () => {
@@ -375,6 +410,38 @@ export const useChatStore = create<ChatState>()(
             get().saveReceivedMessage(userId, data.sender_id, message)
           })
           
+          // 一括配信（/deliver/fanout）の通知: 受信者側で再構成すると new_message で本文が届く
+          websocketClient.onMessage('new_delivery', async (data: NewDelivery) => {
+            console.log('📬 新しい配信を受信:', data)
+            // 表示済み・再構成中のメッセージは再構成しない（再送された配信で LLM を呼び直さない）
+            if (renderingDeliveries.has(data.message_id) || get().messages.some((msg) => msg.id === data.message_id)) {
+              return
+            }
+            renderingDeliveries.add(data.message_id)
+            
+            try {
+              const apiUrl = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000'
+              const response = await fetch(`${apiUrl}/api/v1/render`, {
+                method: 'POST',
+                headers: {
+                  'Content-Type': 'application/json',
+                  'X-User-ID': userId
+                },
+                body: JSON.stringify({
+                  message_id: data.message_id,
+                  recipient_id: userId
+                })
+              })
+              if (!response.ok) {
+                throw new Error(`再構成エラー: ${response.status}`)
+              }
+            } catch (error) {
+              console.error('❌ 配信メッセージの再構成エラー:', error)
+              // 失敗した配信は次の通知で再構成し直せるようにする
+              renderingDeliveries.delete(data.message_id)
+            }
+          })
+          
           websocketClient.onMessage('message_delivered', (data) => {
             console.log('✅ メッセージ配信確認:', data)
             // メッセージのステータスを更新
@@ -387,21 +454,43 @@ export const useChatStore = create<ChatState>()(
             get().updateMessage(data.message_id, { status: 'read' })
           })
           
-          websocketClient.onMessage('user_status', (data: UserStatus) => {
+          // ルームごとのオンラインメンバーとバージョン（接続時・get_presence の応答）
+          websocketClient.onMessage('presence_snapshot', (data: { rooms: Record<string, PresenceRoom> }) => {
+            console.log('👥 プレゼンスのスナップショット:', data)
+            presenceResyncPending = false
+            set({ presenceRooms: data.rooms, onlineUsers: onlineUsersOf(data.rooms) })
+          })
+          
+          // オンライン状態の差分（スレッド・家族を共有するユーザーのみ）
+          // 差分は送信キューが詰まると破棄されるため、バージョンが飛んだらスナップショットを取り直す
+          websocketClient.onMessage('presence_delta', (data: { room: string, version: number, changes: UserStatus[] }) => {
             console.log('👤 ユーザー状態変更:', data)
             
+            const room = get().presenceRooms[data.room]
+            if (!room || data.version <= room.version) {
+              // 未知のルーム（参加直後）はこの後のスナップショットに含まれる、古い差分は適用済み
+              return
+            }
+            if (data.version !== room.version + 1) {
+              console.log('🔄 プレゼンスの差分が欠落したため再取得:', data.room)
+              requestPresenceSnapshot()
+              return
+            }
+            
+            const online = new Set(room.online)
+            for (const change of data.changes) {
+              if (change.status === 'online') {
+                online.add(change.user_id)
+              } else {
+                online.delete(change.user_id)
+              }
+            }
             set((state) => {
-              const onlineUsers = [...state.onlineUsers]
-              if (data.status === 'online' && !onlineUsers.includes(data.user_id)) {
-                onlineUsers.push(data.user_id)
-              } else if (data.status === 'offline') {
-                const index = onlineUsers.indexOf(data.user_id)
-                if (index > -1) {
-                  onlineUsers.splice(index, 1)
-                }
+              const presenceRooms = {
+                ...state.presenceRooms,
+                [data.room]: { version: data.version, online: Array.from(online) }
               }
-              
-              return { onlineUsers }
+              return { presenceRooms, onlineUsers: onlineUsersOf(presenceRooms) }
             })
           })
           
@@ -416,9 +505,12 @@ export const useChatStore = create<ChatState>()(
             }))
           })
           
+          // 従来サーバー向け（presence_snapshot を受け取った後は presenceRooms から算出する）
           websocketClient.onMessage('online_users', (data) => {
             console.log('👥 オンラインユーザー一覧:', data.users)
-            set({ onlineUsers: data.users })
+            if (Object.keys(get().presenceRooms).length === 0) {
+              set({ onlineUsers: data.users })
+            }
           })
           
           websocketClient.onStatus('connection_established', (data) => {
@@ -441,6 +533,7 @@ export const useChatStore = create<ChatState>()(
         set({ 
           isWebSocketConnected: false,
           onlineUsers: [],
+          presenceRooms: {},
           typingUsers: {}
         })
       },
@@ -0,0 +1,5 @@
+// socket.io-msgpack-parser は型定義を同梱していないため、io() の parser オプションとして渡せる形で宣言
+declare module 'socket.io-msgpack-parser' {
+  const parser: any
+  export default parser
+}